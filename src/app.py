@@ -1,9 +1,13 @@
 """Main module for running the application"""
 
 from start_app import StartApp
+from bot_supervisor import Supervisor
 
 _START_COMANDS = ["start", "s", "info", "i"]
 
 if __name__ == '__main__':
-    app = StartApp(_START_COMANDS)
-    app.start_polling()
+    if Supervisor.is_enabled():
+        Supervisor(_START_COMANDS).run()
+    else:
+        app = StartApp(_START_COMANDS)
+        app.start()
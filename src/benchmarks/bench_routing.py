@@ -0,0 +1,68 @@
+"""Micro-benchmark of update routing: linear handler scan of TeleBot
+against the routing table of RoutedTeleBot.
+
+Run from the src directory: python -m benchmarks.bench_routing [plugins] [updates]"""
+
+import random
+import sys
+import time
+from typing import List
+import telebot
+from telebot import types
+from telebot.callback_data import CallbackData
+from bot_callback_filter import BotCallbackCustomFilter
+from bot_router import RoutedTeleBot
+
+def setup_handlers(bot: telebot.TeleBot, plugins: int) -> List[CallbackData]:
+    """Register handlers like atomic functions and the default function do"""
+    factories = []
+    for index in range(plugins):
+        commands = [f"cmd{index}", f"alias{index}"]
+        factory = CallbackData("button", prefix=commands[0])
+        factories.append(factory)
+        bot.message_handler(commands=commands)(lambda message: None)
+        bot.callback_query_handler(func=None, config=factory.filter())(lambda call: None)
+    bot.message_handler(func=lambda message: True)(lambda message: None)
+    bot.add_custom_filter(BotCallbackCustomFilter())
+    return factories
+
+def make_updates(plugins: int, factories: List[CallbackData], count: int) -> List[types.Update]:
+    """Create commands, callback queries and plain texts for random plugins"""
+    rnd = random.Random(1)
+    chat = {"id": 1, "type": "private"}
+    user = {"id": 1, "is_bot": False, "first_name": "user"}
+    updates = []
+    for update_id in range(count):
+        index = rnd.randrange(plugins)
+        kind = update_id % 3
+        if kind == 2:
+            data = factories[index].new(button="1")
+            updates.append(types.Update.de_json({"update_id": update_id, "callback_query": {
+                "id": str(update_id), "from": user, "chat_instance": "1", "data": data}}))
+            continue
+        text = f"/cmd{index} arg" if kind == 0 else "hello"
+        message = {"message_id": update_id, "date": 0, "chat": chat, "from": user, "text": text}
+        updates.append(types.Update.de_json({"update_id": update_id, "message": message}))
+    return updates
+
+def run(bot: telebot.TeleBot, updates: List[types.Update]) -> float:
+    """Process updates one by one and get microseconds per update"""
+    start = time.perf_counter()
+    for update in updates:
+        bot.process_new_updates([update])
+    return (time.perf_counter() - start) / len(updates) * 1e6
+
+def main():
+    """Compare routing methods"""
+    plugins = int(sys.argv[1]) if len(sys.argv) > 1 else 25
+    count = int(sys.argv[2]) if len(sys.argv) > 2 else 30000
+    telebot.logger.setLevel("ERROR")
+    for name, bot_class in (("linear", telebot.TeleBot), ("routed", RoutedTeleBot)):
+        bot = bot_class("123:abc", threaded=False)
+        factories = setup_handlers(bot, plugins)
+        updates = make_updates(plugins, factories, count)
+        print(f"{name}: {run(bot, updates):.1f} us/update ({plugins} plugins, {count} updates)")
+
+
+if __name__ == "__main__":
+    main()
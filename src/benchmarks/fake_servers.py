@@ -0,0 +1,207 @@
+"""Local stand-ins of the Telegram Bot API and of external APIs for load tests"""
+
+import itertools
+import json
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import parse_qsl, urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+
+OnReply = Callable[[int, str, float], None]
+
+JOKE = {"id": 1, "type": "general", "setup": "Setup?", "punchline": "Punchline."}
+
+class _JsonHandler(BaseHTTPRequestHandler):
+    """Base handler that reads request parameters and answers JSON.
+    Headers and body are written separately, without TCP_NODELAY
+    every keep-alive response would wait for the delayed ACK"""
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Handle GET request"""
+        self.handle_request()
+
+    def do_POST(self): # pylint: disable=invalid-name
+        """Handle POST request"""
+        self.handle_request()
+
+    def handle_request(self):
+        """Answer the request"""
+        raise NotImplementedError
+
+    def read_params(self) -> Dict[str, str]:
+        """Read parameters from the query string and the urlencoded or multipart body"""
+        params = dict(parse_qsl(urlsplit(self.path).query))
+        length = int(self.headers.get("Content-Length") or 0)
+        body = self.rfile.read(length).decode("utf-8", "replace") if length else ""
+        if "multipart/form-data" in self.headers.get("Content-Type", ""):
+            params.update(re.findall(r'name="([^"]+)"\r\n(?:[^\r\n]+\r\n)*\r\n([^\r\n]*)', body))
+        elif body:
+            params.update(parse_qsl(body))
+        return params
+
+    def send_json(self, value: Any):
+        """Send the value as the JSON body"""
+        body = json.dumps(value).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Disable request logging"""
+
+class FakeTelegramApi:
+    """Bot API server that serves queued updates to getUpdates and reports
+    every message the bot sends to a chat. Answers to callback queries are reported
+    with the callback query id, load tests use the chat id as this id"""
+
+    POLL_WAIT = 0.2
+
+    def __init__(self, on_reply: OnReply):
+        self.__on_reply = on_reply
+        self.__updates: List[Dict[str, Any]] = []
+        self.__update_ids = itertools.count(1)
+        self.__message_ids = itertools.count(1)
+        self.__condition = threading.Condition()
+        self.methods: Dict[str, int] = {}
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__get_handler())
+        self.__server.daemon_threads = True
+
+    @property
+    def api_url(self) -> str:
+        """URL template for telebot.apihelper.API_URL"""
+        return f"http://127.0.0.1:{self.__server.server_port}/bot{{0}}/{{1}}"
+
+    def start(self):
+        """Start serving"""
+        threading.Thread(target=self.__server.serve_forever,
+            name="FakeTelegramApi", daemon=True).start()
+
+    def stop(self):
+        """Stop serving"""
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def push_update(self, update: Dict[str, Any]):
+        """Queue the update for getUpdates"""
+        with self.__condition:
+            self.__updates.append(dict(update, update_id=next(self.__update_ids)))
+            self.__condition.notify_all()
+
+    def get_updates(self, offset: int, timeout: float) -> List[Dict[str, Any]]:
+        """Get updates from the offset, waiting for them up to the timeout"""
+        with self.__condition:
+            self.__updates = [update for update in self.__updates if update["update_id"] >= offset]
+            if not self.__updates:
+                self.__condition.wait(min(timeout, self.POLL_WAIT))
+            return list(self.__updates[:100])
+
+    def call(self, method: str, params: Dict[str, str]) -> Any:
+        """Answer the Bot API method"""
+        self.methods[method] = self.methods.get(method, 0) + 1
+        if method == "getUpdates":
+            return self.get_updates(int(params.get("offset") or 0),
+                float(params.get("timeout") or 0))
+        if method == "getMe":
+            return {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}
+        chat_id = params.get("chat_id")
+        reply_to = chat_id or params.get("callback_query_id")
+        if reply_to is not None and reply_to.lstrip("-").isdigit():
+            self.__on_reply(int(reply_to), method, time.perf_counter())
+        if chat_id is None:
+            return True
+        message = {"message_id": next(self.__message_ids), "date": int(time.time()),
+            "chat": {"id": int(chat_id), "type": "private"}, "text": params.get("text", "")}
+        if method == "sendMediaGroup":
+            return [message]
+        return message
+
+    def __get_handler(self) -> type:
+        api = self
+
+        class Handler(_JsonHandler):
+            """Bot API request handler"""
+
+            def handle_request(self):
+                method = urlsplit(self.path).path.rsplit("/", 1)[-1]
+                self.send_json({"ok": True, "result": api.call(method, self.read_params())})
+
+        return Handler
+
+class UpstreamStub:
+    """Answers requests of atomic functions to external APIs after a fixed latency.
+    Responses are looked up by the original host and path prefix, unknown ones get {}"""
+
+    RESPONSES: Dict[str, Any] = {
+        "official-joke-api.appspot.com/random_ten": [JOKE] * 10,
+        "official-joke-api.appspot.com/jokes/random/": [JOKE] * 10,
+        "official-joke-api.appspot.com/types": ["general"],
+        "official-joke-api.appspot.com/": JOKE,
+    }
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.requests = 0
+        self.__server = ThreadingHTTPServer(("127.0.0.1", 0), self.__get_handler())
+        self.__server.daemon_threads = True
+
+    @property
+    def url(self) -> str:
+        """Base URL of the stub"""
+        return f"http://127.0.0.1:{self.__server.server_port}"
+
+    def start(self):
+        """Start serving"""
+        threading.Thread(target=self.__server.serve_forever,
+            name="UpstreamStub", daemon=True).start()
+
+    def stop(self):
+        """Stop serving"""
+        self.__server.shutdown()
+        self.__server.server_close()
+
+    def get_response(self, path: str) -> Any:
+        """Get the response for the original host and path"""
+        self.requests += 1
+        path = path.lstrip("/").split("?")[0]
+        for prefix, response in self.RESPONSES.items():
+            if path.startswith(prefix):
+                return response
+        return {}
+
+    def __get_handler(self) -> type:
+        stub = self
+
+        class Handler(_JsonHandler):
+            """External API request handler"""
+
+            def handle_request(self):
+                self.read_params()
+                time.sleep(stub.latency)
+                self.send_json(stub.get_response(self.path))
+
+        return Handler
+
+class StubAdapter(HTTPAdapter):
+    """Sends requests to any host to the upstream stub,
+    the original host becomes part of the path"""
+
+    def __init__(self, stub_url: str, **kwargs):
+        super().__init__(**kwargs)
+        self.stub_url = stub_url
+
+    def send(self, request: requests.PreparedRequest, # pylint: disable=too-many-arguments,too-many-positional-arguments
+    stream: bool = False, timeout: Optional[Any] = None, verify: Any = True,
+    cert: Optional[Any] = None, proxies: Optional[Any] = None) -> requests.Response:
+        parts = urlsplit(request.url)
+        query = f"?{parts.query}" if parts.query else ""
+        request.url = f"{self.stub_url}/{parts.netloc}{parts.path}{query}"
+        return super().send(request, stream=stream, timeout=timeout, verify=verify,
+            cert=cert, proxies=proxies)
@@ -0,0 +1,278 @@
+"""Load test of the whole bot: StartApp polls a local fake Telegram Bot API,
+atomic functions call a local stub of external APIs with a fixed latency.
+Synthetic sessions of commands, callback queries and next-step replies are
+replayed at a fixed rate, the time from an update to the first message the bot
+sends to its chat is the latency.
+
+Run from the repository root, like the bot itself:
+PYTHONPATH=src python -m benchmarks.load_test --sessions 500 --rate 100 --db"""
+
+import argparse
+import dataclasses
+import functools
+import itertools
+import json
+import os
+import random
+import resource
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+import telebot
+from telebot import asyncio_helper
+from benchmarks.fake_servers import FakeTelegramApi, StubAdapter, UpstreamStub
+
+START_COMMANDS = ["start", "s", "info", "i"]
+
+Step = Tuple[str, str]
+"""Kind of the update, message or callback_query, and its text or callback data"""
+
+SCENARIOS: Dict[str, List[Step]] = {
+    "start": [("message", "/start")],
+    "text": [("message", "hello")],
+    "joke": [("message", "/randomjoke")],
+    "jokeid": [("message", "/jokeid 1")],
+    "callback": [("callback_query", "example:cb_yes")],
+    "next_step": [("callback_query", "example:force_reply"), ("message", "next step text")],
+}
+
+@dataclasses.dataclass
+class Session:
+    """Steps of one scenario in one chat"""
+    scenario: str
+    chat_id: int
+    step: int = 0
+    sent: float = 0.0
+
+def new_update(step: Step, chat_id: int) -> Dict[str, Any]:
+    """Create an update of the step in the chat"""
+    kind, text = step
+    user = {"id": chat_id, "is_bot": False, "first_name": "Load", "username": f"user{chat_id}"}
+    message = {"message_id": 1, "date": int(time.time()),
+        "chat": {"id": chat_id, "type": "private"}, "from": user, "text": text}
+    if kind == "message":
+        if text.startswith("/"):
+            length = len(text.split()[0])
+            message["entities"] = [{"type": "bot_command", "offset": 0, "length": length}]
+        return {"message": message}
+    bot_message = dict(message, text="keyboard",
+        **{"from": {"id": 1, "is_bot": True, "first_name": "bot", "username": "bot"}})
+    return {"callback_query": {"id": str(chat_id), "from": user, "chat_instance": "1",
+        "data": text, "message": bot_message}}
+
+def percentiles(values: List[float]) -> Dict[str, float]:
+    """Get p50, p95, p99 and max in milliseconds"""
+    if not values:
+        return {}
+    values = sorted(values)
+    def rank(quantile: float) -> float:
+        return values[min(len(values) - 1, int(quantile * len(values)))] * 1000
+    return {"p50": rank(0.5), "p95": rank(0.95), "p99": rank(0.99), "max": values[-1] * 1000}
+
+class LoadTest:
+    """Replays sessions against the bot and collects latencies of their steps"""
+
+    def __init__(self, api: FakeTelegramApi):
+        self.api = api
+        self.__pending: Dict[int, Session] = {}
+        self.__lock = threading.Lock()
+        self.__done = threading.Condition(self.__lock)
+        self.latencies: Dict[str, List[float]] = {}
+        self.first_sent = 0.0
+        self.last_reply = 0.0
+
+    def on_reply(self, chat_id: int, _method: str, replied: float):
+        """Count the first reply to the current step and send the next step of the session"""
+        with self.__lock:
+            session = self.__pending.pop(chat_id, None)
+            if session is None:
+                return
+            steps = SCENARIOS[session.scenario]
+            kind = f"{session.scenario}.{session.step}" if len(steps) > 1 else session.scenario
+            self.latencies.setdefault(kind, []).append(replied - session.sent)
+            self.last_reply = replied
+            session.step += 1
+            if session.step < len(steps):
+                self.__send(session)
+            if not self.__pending:
+                self.__done.notify_all()
+
+    def replay(self, sessions: List[Session], rate: float, timeout: float) -> int:
+        """Start sessions at the rate and wait for them, get the number of unfinished sessions"""
+        start = time.perf_counter()
+        self.first_sent = start
+        for index, session in enumerate(sessions):
+            delay = start + index / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+            with self.__lock:
+                self.__send(session)
+        with self.__lock:
+            self.__done.wait_for(lambda: not self.__pending, timeout)
+            unfinished = len(self.__pending)
+            self.__pending.clear()
+            return unfinished
+
+    def __send(self, session: Session):
+        session.sent = time.perf_counter()
+        self.__pending[session.chat_id] = session
+        self.api.push_update(new_update(SCENARIOS[session.scenario][session.step], session.chat_id))
+
+def get_sessions(mix: Dict[str, float], count: int, chat_ids: itertools.count,
+seed: int) -> List[Session]:
+    """Get sessions with scenarios chosen by their weights"""
+    rnd = random.Random(seed)
+    scenarios = rnd.choices(list(mix), weights=list(mix.values()), k=count)
+    return [Session(scenario, next(chat_ids)) for scenario in scenarios]
+
+def parse_mix(text: str) -> Dict[str, float]:
+    """Parse scenario weights like start=1,joke=2"""
+    mix = {}
+    for item in text.split(","):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name}, use {', '.join(SCENARIOS)}")
+        mix[name] = float(weight or 1)
+    return mix
+
+def get_max_rss() -> float:
+    """Peak resident memory of the process in megabytes"""
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+def setup_process(api_url: str, stub_url: str):
+    """Send Bot API requests and requests to external APIs of this process to the fake servers"""
+    telebot.apihelper.API_URL = api_url
+    asyncio_helper.API_URL = api_url
+    from net.http_client import get_http_client # pylint: disable=import-outside-toplevel
+    adapter = StubAdapter(stub_url, pool_connections=10, pool_maxsize=100)
+    get_http_client().session.mount("http://", adapter)
+    get_http_client().session.mount("https://", adapter)
+
+def start_bot(api_url: str, stub_url: str, db: bool,
+processes: int = 1) -> Tuple[Any, threading.Thread]:
+    """Create StartApp, or the supervisor of worker processes, that uses the fake servers
+    and start polling in a thread"""
+    os.environ.setdefault("TBOTTOKEN", "123:load-test")
+    os.environ.setdefault("LOGLEVEL", "WARNING")
+    os.environ.setdefault("TBOT_LOGLEVEL", "ERROR")
+    # The fake Bot API has no flood limits, sessions are not slowed down by the bot ones
+    os.environ.setdefault("SEND_GLOBAL_RATE", "0")
+    os.environ.setdefault("SEND_CHAT_RATE", "0")
+    if db:
+        os.environ["CONECTION_PGDB"] = f"sqlite:///{tempfile.mkdtemp()}/load_test.db"
+    setup_process(api_url, stub_url)
+    if processes > 1:
+        from bot_supervisor import Supervisor, SupervisorConfig # pylint: disable=import-outside-toplevel
+        supervisor = Supervisor(START_COMMANDS, SupervisorConfig(processes=processes),
+            functools.partial(setup_process, api_url, stub_url))
+        supervisor.start()
+        polling = threading.Thread(target=supervisor.poll, name="LoadTestPolling", daemon=True)
+        polling.start()
+        return supervisor, polling
+    from start_app import StartApp # pylint: disable=import-outside-toplevel
+    app = StartApp(START_COMMANDS)
+    polling = threading.Thread(target=app.start_polling, name="LoadTestPolling", daemon=True)
+    polling.start()
+    return app, polling
+
+def run(args: argparse.Namespace) -> Dict[str, Any]:
+    """Run the bot with fake servers, replay sessions and get the report"""
+    rss_start = get_max_rss()
+    api: Optional[FakeTelegramApi] = None
+    stub = UpstreamStub(args.upstream_latency)
+    stub.start()
+    load_test: Optional[LoadTest] = None
+
+    def on_reply(chat_id: int, method: str, replied: float):
+        if load_test is not None:
+            load_test.on_reply(chat_id, method, replied)
+
+    api = FakeTelegramApi(on_reply)
+    api.start()
+    load_test = LoadTest(api)
+    app, polling = start_bot(api.api_url, stub.url, args.db, args.processes)
+    rss_ready = get_max_rss()
+
+    chat_ids = itertools.count(1000000)
+    load_test.replay([Session(name, next(chat_ids)) for name in args.mix], 10, args.timeout)
+    load_test.latencies.clear()
+    sessions = get_sessions(args.mix, args.sessions, chat_ids, args.seed)
+    unfinished = load_test.replay(sessions, args.rate, args.timeout)
+
+    elapsed = max(load_test.last_reply - load_test.first_sent, 1e-9)
+    answered = sum(len(values) for values in load_test.latencies.values())
+    report = {
+        "sessions": args.sessions,
+        "rate": args.rate,
+        "upstream_latency": args.upstream_latency,
+        "db": args.db,
+        "runtime": os.environ.get("BOT_RUNTIME") or "sync",
+        "processes": args.processes,
+        "answered_updates": answered,
+        "unfinished_sessions": unfinished,
+        "throughput": answered / elapsed,
+        "latency_ms": percentiles(list(itertools.chain(*load_test.latencies.values()))),
+        "scenarios_ms": {name: percentiles(values)
+            for name, values in sorted(load_test.latencies.items())},
+        "max_rss_mb": {"start": rss_start, "ready": rss_ready, "end": get_max_rss()},
+        "telegram_methods": dict(api.methods),
+        "upstream_requests": stub.requests,
+    }
+    if getattr(app, "dispatcher", None) is not None:
+        report["dispatcher"] = str(app.dispatcher.stats())
+    if args.processes > 1:
+        app.stop()
+        polling.join(5)
+    elif not app.is_async:
+        app.bot.stop_polling()
+        polling.join(5)
+    api.stop()
+    stub.stop()
+    return report
+
+def print_report(report: Dict[str, Any]):
+    """Print the report as text"""
+    def format_latency(values: Dict[str, float]) -> str:
+        return " ".join(f"{name}={value:.1f}ms" for name, value in values.items())
+    print(f"{report['runtime']} runtime, {report['processes']} processes, "
+        f"{report['sessions']} sessions at {report['rate']}/s, "
+        f"upstream latency {report['upstream_latency'] * 1000:.0f}ms, db={report['db']}")
+    print(f"answered updates: {report['answered_updates']}, "
+        f"unfinished sessions: {report['unfinished_sessions']}, "
+        f"throughput: {report['throughput']:.1f} updates/s")
+    print(f"latency: {format_latency(report['latency_ms'])}")
+    for name, values in report["scenarios_ms"].items():
+        print(f"  {name}: {format_latency(values)}")
+    rss = report["max_rss_mb"]
+    print(f"max rss: start={rss['start']:.1f}MB ready={rss['ready']:.1f}MB end={rss['end']:.1f}MB")
+    if "dispatcher" in report:
+        print(f"dispatcher: {report['dispatcher']}")
+
+def main():
+    """Parse arguments and run the load test"""
+    parser = argparse.ArgumentParser(description=__doc__,
+        formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=300, help="number of sessions")
+    parser.add_argument("--rate", type=float, default=50, help="sessions started per second")
+    parser.add_argument("--upstream-latency", type=float, default=0.05,
+        help="latency of external APIs in seconds")
+    parser.add_argument("--mix", type=parse_mix, default=parse_mix(",".join(SCENARIOS)),
+        help=f"scenario weights, for example start=1,joke=2; scenarios: {', '.join(SCENARIOS)}")
+    parser.add_argument("--db", action="store_true", help="log messages to a SQLite database")
+    parser.add_argument("--processes", type=int, default=1,
+        help="number of worker processes of the supervisor, 1 runs StartApp in this process")
+    parser.add_argument("--timeout", type=float, default=30,
+        help="seconds to wait for unfinished sessions")
+    parser.add_argument("--seed", type=int, default=1, help="seed of the scenario choice")
+    parser.add_argument("--json", help="also write the report to this JSON file")
+    args = parser.parse_args()
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == "__main__":
+    main()
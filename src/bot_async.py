@@ -0,0 +1,90 @@
+"""The module contains classes for running the bot on AsyncTeleBot"""
+
+import asyncio
+import threading
+from typing import Callable, Dict, Optional
+import telebot
+from telebot import types, util
+from telebot.async_telebot import AsyncTeleBot
+from telebot.asyncio_filters import AdvancedCustomFilter
+from telebot.callback_data import CallbackDataFilter
+from bot_sender import FloodLimitedTeleBot
+from bot_state import MemoryStateStore, StateHandlerBackend
+
+class AsyncBotCallbackCustomFilter(AdvancedCustomFilter): # pylint: disable=too-few-public-methods
+    """Callback query custom filter for AsyncTeleBot"""
+    key = 'config'
+    async def check(self, message: types.CallbackQuery, text: CallbackDataFilter):
+        return text.check(query=message)
+
+class SyncBotAdapter:
+    """Allows synchronous atomic functions to work on AsyncTeleBot.
+    Handlers are registered on AsyncTeleBot and run in worker threads,
+    Bot API methods are called through a synchronous TeleBot within flood limits,
+    next step handlers are kept by the adapter in its next step backend."""
+
+    __adapters: Dict[int, "SyncBotAdapter"] = {}
+    __adapters_lock = threading.Lock()
+
+    def __init__(self, bot: AsyncTeleBot, next_step_backend: Optional[StateHandlerBackend] = None):
+        self.async_bot = bot
+        self.sync_bot = FloodLimitedTeleBot(bot.token, threaded=False)
+        self.next_step_backend = next_step_backend or StateHandlerBackend(
+            MemoryStateStore(), telebot.logger)
+        bot.message_handler(func=self.__has_next_step,
+            content_types=util.content_type_media)(self.__run_next_step)
+
+    @classmethod
+    def for_bot(cls, bot: AsyncTeleBot,
+    next_step_backend: Optional[StateHandlerBackend] = None) -> "SyncBotAdapter":
+        """Get the adapter of the bot. The first call registers
+        the next step handler, so it must be made before other handlers"""
+        with cls.__adapters_lock:
+            adapter = cls.__adapters.get(id(bot))
+            if adapter is None:
+                adapter = cls(bot, next_step_backend)
+                cls.__adapters[id(bot)] = adapter
+            return adapter
+
+    def __getattr__(self, name: str):
+        return getattr(self.sync_bot, name)
+
+    def message_handler(self, **kwargs):
+        """Message handler decorator"""
+        def decorator(handler: Callable):
+            self.async_bot.message_handler(**kwargs)(self.__to_thread(handler))
+            return handler
+        return decorator
+
+    def callback_query_handler(self, func=None, **kwargs):
+        """Callback query handler decorator"""
+        def decorator(handler: Callable):
+            self.async_bot.callback_query_handler(func, **kwargs)(self.__to_thread(handler))
+            return handler
+        return decorator
+
+    def register_next_step_handler(self, message: types.Message, callback: Callable,
+    *args, **kwargs):
+        """Process the next message of the chat with the callback"""
+        self.next_step_backend.register_handler(message.chat.id,
+            telebot.Handler(callback, *args, **kwargs))
+
+    def clear_step_handler(self, message: types.Message):
+        """Remove next step handlers of the chat"""
+        self.next_step_backend.clear_handlers(message.chat.id)
+
+    async def __has_next_step(self, message: types.Message) -> bool:
+        if self.next_step_backend.blocking:
+            return await asyncio.to_thread(self.next_step_backend.has_handlers, message.chat.id)
+        return self.next_step_backend.has_handlers(message.chat.id)
+
+    async def __run_next_step(self, message: types.Message):
+        handlers = await asyncio.to_thread(self.next_step_backend.get_handlers, message.chat.id)
+        for handler in handlers or []:
+            await asyncio.to_thread(handler.callback, message, *handler.args, **handler.kwargs)
+
+    @staticmethod
+    def __to_thread(handler: Callable) -> Callable:
+        async def run_in_thread(update):
+            await asyncio.to_thread(handler, update)
+        return run_in_thread
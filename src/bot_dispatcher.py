@@ -0,0 +1,177 @@
+"""The module implements a concurrent dispatcher of incoming updates"""
+
+import collections
+import dataclasses
+import logging
+import threading
+import time
+from typing import Any, Callable, Deque, Dict, List, Tuple
+from telebot import types
+from bot_metrics import get_metrics
+from bot_threading import wait_event
+
+ProcessUpdates = Callable[[List[types.Update]], None]
+
+@dataclasses.dataclass
+class DispatcherStats: # pylint: disable=too-many-instance-attributes
+    """Snapshot of dispatcher counters"""
+    workers: int
+    queue_depth: int
+    queue_capacity: int
+    submitted: int
+    processed: int
+    failed: int
+    wait_time_avg: float
+    wait_time_max: float
+    backpressure_time: float
+
+    def __str__(self) -> str:
+        return (
+            f"workers={self.workers} depth={self.queue_depth}/{self.queue_capacity} "
+            f"submitted={self.submitted} processed={self.processed} failed={self.failed} "
+            f"wait_avg={self.wait_time_avg:.3f}s wait_max={self.wait_time_max:.3f}s "
+            f"backpressure={self.backpressure_time:.3f}s"
+        )
+
+QueuedUpdate = Tuple[float, types.Update]
+
+class UpdateDispatcher: # pylint: disable=too-many-instance-attributes
+    """Distributes updates between worker threads.
+    Every chat has its own queue, a free worker takes the next update of the next chat
+    in turn, and a chat is processed by one worker at a time, so updates of a chat keep
+    the order of arrival and a slow handler holds only its own chat.
+    The number of queued updates is bounded, when it is reached the producer (polling) waits."""
+
+    def __init__(self, process_updates: ProcessUpdates, logger: logging.Logger,
+    workers: int = 4, queue_size: int = 100, stats_interval: float = 0):
+        self.__process_updates = process_updates
+        self.__logger = logger
+        self.__workers_count = max(1, workers)
+        self.__queue_capacity = max(1, queue_size)
+        # Queues of chats that are waiting in ready or are being processed
+        self.__chats: Dict[Any, Deque[QueuedUpdate]] = {}
+        self.__ready: Deque[Any] = collections.deque()
+        self.__depth = 0
+        self.__threads: List[threading.Thread] = []
+        self.__stats_interval = stats_interval
+        self.__stop_event = threading.Event()
+        self.__lock = threading.Lock()
+        self.__has_ready = threading.Condition(self.__lock)
+        self.__has_room = threading.Condition(self.__lock)
+        self.__submitted = 0
+        self.__processed = 0
+        self.__failed = 0
+        self.__wait_time_sum = 0.0
+        self.__wait_time_max = 0.0
+        self.__backpressure_time = 0.0
+
+    def start(self):
+        """Start worker threads"""
+        self.__stop_event.clear()
+        for index in range(self.__workers_count):
+            thread = threading.Thread(target=self.__worker,
+                name=f"UpdateDispatcher-{index}", daemon=True)
+            thread.start()
+            self.__threads.append(thread)
+        if self.__stats_interval > 0:
+            thread = threading.Thread(target=self.__report_stats,
+                name="UpdateDispatcher-stats", daemon=True)
+            thread.start()
+        self.__logger.info("Dispatcher started: %d workers, queue capacity %d",
+            self.__workers_count, self.__queue_capacity)
+
+    def stop(self, timeout: float = 10):
+        """Process the queued updates and stop worker threads"""
+        with self.__lock:
+            self.__stop_event.set()
+            self.__has_ready.notify_all()
+        deadline = time.monotonic() + timeout
+        for thread in self.__threads:
+            thread.join(max(0, deadline - time.monotonic()))
+        self.__threads.clear()
+        self.__logger.info("Dispatcher stopped: %s", self.stats())
+
+    def submit(self, updates: List[types.Update]):
+        """Put updates into queues of their chats. Blocks while the queued updates
+        reach the capacity"""
+        for update in updates:
+            chat_id = self.get_chat_id(update)
+            started = time.monotonic()
+            with self.__lock:
+                while self.__depth >= self.__queue_capacity:
+                    self.__has_room.wait()
+                now = time.monotonic()
+                chat_queue = self.__chats.get(chat_id)
+                if chat_queue is None:
+                    chat_queue = self.__chats[chat_id] = collections.deque()
+                    self.__ready.append(chat_id)
+                chat_queue.append((now, update))
+                self.__depth += 1
+                self.__submitted += 1
+                self.__backpressure_time += now - started
+                self.__has_ready.notify()
+
+    def stats(self) -> DispatcherStats:
+        """Get current dispatcher counters"""
+        with self.__lock:
+            processed = self.__processed + self.__failed
+            return DispatcherStats(
+                workers=self.__workers_count,
+                queue_depth=self.__depth,
+                queue_capacity=self.__queue_capacity,
+                submitted=self.__submitted,
+                processed=self.__processed,
+                failed=self.__failed,
+                wait_time_avg=self.__wait_time_sum / processed if processed else 0.0,
+                wait_time_max=self.__wait_time_max,
+                backpressure_time=self.__backpressure_time,
+            )
+
+    @staticmethod
+    def get_chat_id(update: types.Update) -> int:
+        """Get the key that defines the processing order of the update"""
+        message = update.message or update.edited_message or update.channel_post
+        if message is None and update.callback_query is not None:
+            message = update.callback_query.message
+            if message is None:
+                return update.callback_query.from_user.id
+        if message is not None:
+            return message.chat.id
+        return update.update_id
+
+    def __worker(self):
+        while True:
+            with self.__lock:
+                while not self.__ready and not self.__stop_event.is_set():
+                    self.__has_ready.wait()
+                if not self.__ready:
+                    break
+                chat_id = self.__ready.popleft()
+                enqueued, update = self.__chats[chat_id].popleft()
+                self.__depth -= 1
+                self.__has_room.notify()
+            wait_time = time.monotonic() - enqueued
+            get_metrics().observe("bot_dispatch_wait_seconds", wait_time)
+            failed = False
+            try:
+                self.__process_updates([update])
+            except Exception as ex: # pylint: disable=broad-except
+                failed = True
+                self.__logger.exception(ex)
+            with self.__lock:
+                self.__wait_time_sum += wait_time
+                self.__wait_time_max = max(self.__wait_time_max, wait_time)
+                if failed:
+                    self.__failed += 1
+                else:
+                    self.__processed += 1
+                # The chat waits for its turn again or is done
+                if self.__chats[chat_id]:
+                    self.__ready.append(chat_id)
+                    self.__has_ready.notify()
+                else:
+                    del self.__chats[chat_id]
+
+    def __report_stats(self):
+        while not wait_event(self.__stop_event, self.__stats_interval):
+            self.__logger.info("Dispatcher stats: %s", self.stats())
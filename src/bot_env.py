@@ -0,0 +1,17 @@
+"""The module contains reading of numeric settings from environment variables"""
+
+import os
+
+def get_env_float(env_key: str, default: float) -> float:
+    """Get number from environment variables, the default if it is not set or not a number"""
+    try:
+        return float(os.environ.get(env_key, default))
+    except ValueError:
+        return default
+
+def get_env_int(env_key: str, default: int) -> int:
+    """Get integer from environment variables, the default if it is not set or not a number"""
+    try:
+        return int(get_env_float(env_key, default))
+    except (ValueError, OverflowError):
+        return default
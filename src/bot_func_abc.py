@@ -1,9 +1,14 @@
 """The module contains an abstract class from which
 the bot's atomic functions must be inherited."""
 
-from typing import List
+from typing import FrozenSet, List
 from abc import ABC, abstractmethod
 import telebot
+from telebot.async_telebot import AsyncTeleBot
+from bot_async import SyncBotAdapter
+from net.circuit_breaker import get_circuit_breakers
+from net.http_client import OwnerHttpClient, get_http_client
+from net.async_http_client import AsyncHttpClient, get_async_http_client
 
 class AtomicBotFunctionABC(ABC):
     """A class for describing the required fields and methods 
@@ -38,6 +43,44 @@ class AtomicBotFunctionABC(ABC):
     def set_handlers(self, bot: telebot.TeleBot):
         """Message handlers need to be set! """
 
+    def set_async_handlers(self, bot: AsyncTeleBot):
+        """Set message handlers for the asyncio runtime.
+        By default the handlers from set_handlers are registered
+        through an adapter and run in worker threads.
+        Override it to implement handlers as coroutines."""
+        self.set_handlers(SyncBotAdapter.for_bot(bot))
+
+    @property
+    def function_id(self) -> str:
+        """Name of the function that is the same in all bot processes"""
+        return f"{type(self).__module__}.{type(self).__name__}"
+
+    @property
+    def circuit_owner(self) -> str:
+        """Name of the function in circuit breakers of external APIs"""
+        return self.function_id
+
+    @property
+    def healthy(self) -> bool:
+        """The function is enabled and no circuit of its external APIs is open"""
+        return self.is_available(get_circuit_breakers().get_unhealthy_owners())
+
+    def is_available(self, unhealthy_owners: FrozenSet[str]) -> bool:
+        """Check that the function is enabled and is not among the owners of open circuits,
+        the owners are got once to check many functions"""
+        return self.state and self.circuit_owner not in unhealthy_owners
+
+    @property
+    def http(self) -> OwnerHttpClient:
+        """Shared HTTP client for requests to external APIs
+        with circuit breakers of the function"""
+        return get_http_client().for_owner(self.circuit_owner)
+
+    @property
+    def async_http(self) -> AsyncHttpClient:
+        """Shared asyncio HTTP client for requests to external APIs"""
+        return get_async_http_client()
+
     def detailed_function_description(self) -> str:
         """Detailed information description of the bot function"""
         txt = self.about + " - " +self.description
@@ -0,0 +1,99 @@
+"""The module contains the logging pipeline of the bot.
+Records are passed through a queue to a background thread that formats
+and writes them, so logging does not block update handlers."""
+
+import atexit
+import gzip
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import shutil
+from datetime import datetime, timezone
+from typing import Any, Dict, List
+
+SAMPLED = {"sampled": True}
+"""Extra fields of high-volume per-update records that are written with the sample rate"""
+
+class JsonLinesFormatter(logging.Formatter):
+    """Formats a record as one JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class SamplingFilter(logging.Filter):
+    """Passes the share of records marked as sampled, other records always pass"""
+
+    def __init__(self, rate: float):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if not getattr(record, "sampled", False) or self.rate >= 1:
+            return True
+        return random.random() < self.rate
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Puts records into a bounded queue without formatting them.
+    Messages are formatted by the listener thread, records are dropped when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+class BackgroundListener(logging.handlers.QueueListener):
+    """Queue listener that can be stopped more than once"""
+
+    def stop(self):
+        if self._thread is not None:
+            super().stop()
+
+def _gzip_rotator(source: str, dest: str):
+    """Compress the rotated log file"""
+    with open(source, "rb") as source_file, gzip.open(dest, "wb") as dest_file:
+        shutil.copyfileobj(source_file, dest_file)
+    os.remove(source)
+
+def get_rotating_handler(path: str, max_bytes: int, backup_count: int,
+compress: bool) -> logging.Handler:
+    """Get a handler that writes JSON lines to rotated, optionally gzipped files"""
+    handler = logging.handlers.RotatingFileHandler(path, maxBytes=max_bytes,
+        backupCount=backup_count, encoding="utf-8", delay=True)
+    if compress:
+        handler.namer = lambda name: name + ".gz"
+        handler.rotator = _gzip_rotator
+    handler.setFormatter(JsonLinesFormatter())
+    return handler
+
+def start_queued_logging(logger: logging.Logger, handlers: List[logging.Handler],
+queue_size: int = 10000, sample_rate: float = 1.0) -> BackgroundListener:
+    """Route records of the logger through a queue to the handlers written by a background thread.
+    The listener is stopped, and the queued records are written, at exit"""
+    log_queue: queue.Queue = queue.Queue(maxsize=queue_size)
+    queue_handler = DroppingQueueHandler(log_queue)
+    queue_handler.addFilter(SamplingFilter(sample_rate))
+    logger.addHandler(queue_handler)
+    listener = BackgroundListener(log_queue, *handlers, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    return listener
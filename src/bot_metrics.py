@@ -0,0 +1,260 @@
+"""The module contains in-process metrics of the bot and their export
+in the Prometheus text format"""
+
+import bisect
+import contextlib
+import functools
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from bot_env import get_env_float, get_env_int
+from bot_threading import wait_event
+
+Labels = Tuple[Tuple[str, str], ...]
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+QUANTILES = (0.5, 0.95, 0.99)
+
+class Histogram:
+    """Histogram with fixed bucket bounds"""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        """Count the value"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, quantile: float) -> float:
+        """Estimate the quantile by linear interpolation inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = quantile * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                if index == len(self.buckets):
+                    return self.buckets[-1]
+                lower = self.buckets[index - 1] if index else 0.0
+                return lower + (self.buckets[index] - lower) * (rank - seen) / count
+            seen += count
+        return self.buckets[-1]
+
+class MetricsRegistry:
+    """Counters, histograms and gauges of the bot.
+    A metric keeps at most max_series label sets, the rest are counted with "other" labels"""
+
+    def __init__(self, max_series: int = 500):
+        self.__max_series = max_series
+        self.__counters: Dict[str, Dict[Labels, float]] = {}
+        self.__histograms: Dict[str, Dict[Labels, Histogram]] = {}
+        self.__gauges: Dict[str, Callable[[], float]] = {}
+        self.__lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1, **labels: str):
+        """Increase the counter"""
+        with self.__lock:
+            series = self.__counters.setdefault(name, {})
+            key = self.__get_key(series, labels)
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels: str):
+        """Add the value to the histogram"""
+        with self.__lock:
+            series = self.__histograms.setdefault(name, {})
+            key = self.__get_key(series, labels)
+            if key not in series:
+                series[key] = Histogram()
+            series[key].observe(value)
+
+    @contextlib.contextmanager
+    def timer(self, name: str, **labels: str) -> Iterator[None]:
+        """Observe the time of the block in seconds"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def set_gauge(self, name: str, callback: Callable[[], float]):
+        """Read the gauge value from the callback on export"""
+        with self.__lock:
+            self.__gauges[name] = callback
+
+    def set_gauges(self, prefix: str, stats: Callable[[], Any], fields: Sequence[str]):
+        """Read gauges <prefix>_<field> from the fields of the stats object on export"""
+        for field in fields:
+            self.set_gauge(f"{prefix}_{field}", functools.partial(_read_field, stats, field))
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Get counters, histogram quantiles and gauges"""
+        with self.__lock:
+            counters = {name: dict(series) for name, series in self.__counters.items()}
+            histograms = {name: {key: (histogram.count, histogram.total,
+                    [histogram.quantile(quantile) for quantile in QUANTILES])
+                    for key, histogram in series.items()}
+                for name, series in self.__histograms.items()}
+            gauges = dict(self.__gauges)
+        return {"counters": counters, "histograms": histograms,
+            "gauges": {name: self.__read_gauge(callback) for name, callback in gauges.items()}}
+
+    def render(self) -> str:
+        """Get metrics in the Prometheus text format.
+        Quantiles of histograms are exported as <name>_quantile gauges"""
+        lines: List[str] = []
+        with self.__lock:
+            for name, series in sorted(self.__counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                lines.extend(f"{name}{_format_labels(key)} {value:g}"
+                    for key, value in series.items())
+            for name, series in sorted(self.__histograms.items()):
+                lines.extend(self.__render_histogram(name, series))
+            gauges = sorted(self.__gauges.items())
+        for name, callback in gauges:
+            lines.append(f"# TYPE {name} gauge")
+            lines.append(f"{name} {self.__read_gauge(callback):g}")
+        return "\n".join(lines) + "\n"
+
+    def __get_key(self, series: Dict[Labels, Any], labels: Dict[str, str]) -> Labels:
+        key = tuple(sorted((name, str(value)) for name, value in labels.items()))
+        if key in series or len(series) < self.__max_series:
+            return key
+        return tuple((name, "other") for name, _ in key)
+
+    @staticmethod
+    def __render_histogram(name: str, series: Dict[Labels, Histogram]) -> List[str]:
+        lines = [f"# TYPE {name} histogram"]
+        quantile_lines = [f"# TYPE {name}_quantile gauge"]
+        for key, histogram in series.items():
+            cumulative = 0
+            for bound, count in zip(histogram.buckets + (float("inf"),), histogram.counts):
+                cumulative += count
+                bucket_key = key + (("le", "+Inf" if bound == float("inf") else f"{bound:g}"),)
+                lines.append(f"{name}_bucket{_format_labels(bucket_key)} {cumulative}")
+            lines.append(f"{name}_sum{_format_labels(key)} {histogram.total:g}")
+            lines.append(f"{name}_count{_format_labels(key)} {histogram.count}")
+            for quantile in QUANTILES:
+                quantile_key = key + (("quantile", f"{quantile:g}"),)
+                quantile_lines.append(f"{name}_quantile{_format_labels(quantile_key)} "
+                    f"{histogram.quantile(quantile):g}")
+        return lines + quantile_lines
+
+    @staticmethod
+    def __read_gauge(callback: Callable[[], float]) -> float:
+        try:
+            return float(callback())
+        except Exception: # pylint: disable=broad-except
+            return float("nan")
+
+def _read_field(stats: Callable[[], Any], field: str) -> float:
+    return getattr(stats(), field)
+
+def _format_labels(key: Labels) -> str:
+    if not key:
+        return ""
+    labels = ",".join(f'{name}="{_escape(value)}"' for name, value in key)
+    return "{" + labels + "}"
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class MetricsExporter:
+    """Serves metrics on a local HTTP endpoint and dumps them to a file periodically"""
+
+    def __init__(self, registry: MetricsRegistry, logger: logging.Logger):
+        self.registry = registry
+        self.logger = logger
+        self.__server: Optional[ThreadingHTTPServer] = None
+        self.__dump_path: Optional[Path] = None
+        self.__stop_event = threading.Event()
+
+    @property
+    def port(self) -> int:
+        """Port of the metrics endpoint, 0 if it is not served"""
+        return self.__server.server_port if self.__server is not None else 0
+
+    def serve(self, host: str, port: int):
+        """Serve metrics on http://host:port/metrics"""
+        registry = self.registry
+
+        class Handler(BaseHTTPRequestHandler):
+            """Responds with the metrics text"""
+
+            def do_GET(self): # pylint: disable=invalid-name
+                """Handle GET request"""
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                """Disable request logging"""
+
+        self.__server = ThreadingHTTPServer((host, port), Handler)
+        self.__server.daemon_threads = True
+        threading.Thread(target=self.__server.serve_forever,
+            name="MetricsServer", daemon=True).start()
+        self.logger.info("Metrics are served on http://%s:%d/metrics", host, self.port)
+
+    def dump_periodically(self, path: str, interval: float):
+        """Write metrics to the file every interval seconds and on close"""
+        self.__dump_path = Path(path)
+        threading.Thread(target=self.__dump_loop, args=(interval,),
+            name="MetricsDump", daemon=True).start()
+
+    def dump(self):
+        """Write metrics to the file, readers never see a partly written file"""
+        if self.__dump_path is None:
+            return
+        temp_path = self.__dump_path.with_name(self.__dump_path.name + ".tmp")
+        try:
+            temp_path.write_text(self.registry.render(), encoding="utf-8")
+            os.replace(temp_path, self.__dump_path)
+        except OSError as ex:
+            self.logger.warning("Failed to dump metrics: %s", ex)
+
+    def close(self):
+        """Stop the endpoint and write the last dump"""
+        self.__stop_event.set()
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+        self.dump()
+
+    def __dump_loop(self, interval: float):
+        while not wait_event(self.__stop_event, interval):
+            self.dump()
+
+_METRICS = MetricsRegistry()
+
+def get_metrics() -> MetricsRegistry:
+    """Get the metrics registry shared by the whole bot"""
+    return _METRICS
+
+def start_metrics_exporter(logger: logging.Logger) -> Optional[MetricsExporter]:
+    """Start the metrics export configured by environment variables, None if it is disabled"""
+    port = get_env_int("METRICS_PORT", 0)
+    dump_path = os.environ.get("METRICS_PATH")
+    if not port and not dump_path:
+        return None
+    exporter = MetricsExporter(get_metrics(), logger)
+    if port:
+        exporter.serve(os.environ.get("METRICS_HOST", "127.0.0.1"), port)
+    if dump_path:
+        exporter.dump_periodically(dump_path, get_env_float("METRICS_DUMP_INTERVAL", 60))
+    return exporter
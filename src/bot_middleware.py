@@ -1,14 +1,25 @@
 """Module implements pre-process and post-process processing of incoming messages"""
 
+import asyncio
 import os
 import logging
+import time
+from datetime import datetime
+from typing import Any, Dict
 import telebot
 from telebot.handler_backends import BaseMiddleware
+from telebot import asyncio_handler_backends
 from db.storage_worker import StorageWorker
-from db.models_msg_log import User, Chat, Message
+from db.message_log_writer import MessageLogWriter, MessageLogWriterConfig, MessageLogRecord
+from db.identity_cache import IdentityCache
+from bot_env import get_env_float, get_env_int
+from bot_metrics import get_metrics, start_metrics_exporter
+from bot_logging import SAMPLED
+from bot_router import HandlerRoutingTable
 
 class Middleware(BaseMiddleware):
-    """Pre-process and post-process processing of incoming messages"""
+    """Pre-process and post-process processing of incoming messages.
+    Handling time and errors of updates are collected by commands and callback data prefixes"""
 
     def pre_process(self, message, data):
         raise NotImplementedError
@@ -22,97 +33,164 @@ class Middleware(BaseMiddleware):
         self.update_sensitive = True
         self.bot = bot
         self.storage_worker = self.__get_storage_worker()
+        self.log_writer = self.__get_log_writer(self.storage_worker)
+        self.metrics_exporter = start_metrics_exporter(logger)
 
-    def pre_process_message(self, message: telebot.types.Message, _unused):
+    def pre_process_message(self, message: telebot.types.Message, data: Dict[str, Any]):
         """Logging incoming messages"""
-        self.logger.info(self.__create_text_from_message(message))
+        data["started"] = time.perf_counter()
+        self.logger.info("| %s | %s %s --> %s", message.chat.id, message.from_user.username,
+            message.from_user.full_name, message.text, extra=SAMPLED)
 
-    def post_process_message(self, message: telebot.types.Message, _unused, exception=None):
+    def post_process_message(self, message: telebot.types.Message, data: Dict[str, Any],
+    exception=None):
         """Post-processing, logging exceptions and user actions"""
+        self.__observe_update("message", message, data, exception)
         self.__save_message(message, None)
         if exception:
             self.logger.exception(exception)
 
-    @staticmethod
-    def __create_text_from_message(message: telebot.types.Message)-> str:
-        return (
-            f'| {message.chat.id} | {message.from_user.username} '
-            f'{message.from_user.full_name} --> {message.text}'
-        )
-
-    def pre_process_callback_query(self, call: telebot.types.CallbackQuery, _unused):
+    def pre_process_callback_query(self, call: telebot.types.CallbackQuery,
+    data: Dict[str, Any]):
         """Logging incoming callback query"""
-        self.logger.info(self.__create_text_from_callback_query(call))
+        data["started"] = time.perf_counter()
+        self.logger.info("| %s | %s %s --> %s | %s %s --> %s", call.message.chat.id,
+            call.message.from_user.username, call.message.from_user.full_name, call.message.text,
+            call.from_user.username, call.from_user.full_name, call.data, extra=SAMPLED)
 
     def post_process_callback_query(self, call: telebot.types.CallbackQuery,
-    _unused, exception=None):
+    data: Dict[str, Any], exception=None):
         """Post-processing, logging exceptions and user actions"""
+        self.__observe_update("callback_query", call, data, exception)
         if exception:
             self.logger.exception(exception)
         self.__save_message(call.message, f"{call.from_user.username} --> {call.data}")
 
     @staticmethod
-    def __create_text_from_callback_query(call: telebot.types.CallbackQuery)-> str:
-        return (
-            f'| {call.message.chat.id} | {call.message.from_user.username} '
-            f'{call.message.from_user.full_name} --> {call.message.text} | '
-            f'{call.from_user.username} {call.from_user.full_name} --> {call.data}'
-        )
+    def __observe_update(update_type: str, update: Any, data: Dict[str, Any], exception):
+        """Collect handling time and errors by the command or the callback data prefix"""
+        route = HandlerRoutingTable.get_route_key(update, update_type) or "none"
+        metrics = get_metrics()
+        if "started" in data:
+            metrics.observe("bot_update_seconds", time.perf_counter() - data["started"],
+                update_type=update_type, route=route)
+        if exception:
+            metrics.inc("bot_update_errors_total", update_type=update_type, route=route)
 
     def __get_storage_worker(self)-> StorageWorker | None:
         conection_string = os.environ.get("CONECTION_PGDB")
         if conection_string:
             storage_worker = StorageWorker(conection_string)
-            self.logger.info(f"Added storage_worker with CONECTION_PGDB = {conection_string}")
+            self.logger.info("Added storage_worker with CONECTION_PGDB = %s", conection_string)
             return storage_worker
 
         self.logger.info("Not added storage_worker")
         return None
 
+    def __get_log_writer(self, storage_worker: StorageWorker | None)-> MessageLogWriter | None:
+        if storage_worker is None or os.environ.get("DB_LOG_MODE", "").lower() == "sync":
+            return None
+        config = MessageLogWriterConfig(
+            batch_size=get_env_int("DB_LOG_BATCH_SIZE", 100),
+            flush_interval=get_env_float("DB_LOG_FLUSH_INTERVAL", 1.0),
+            queue_size=get_env_int("DB_LOG_QUEUE_SIZE", 10000),
+        )
+        identity_cache = IdentityCache(
+            max_size=get_env_int("DB_IDENTITY_CACHE_SIZE", 10000),
+            ttl=get_env_float("DB_IDENTITY_CACHE_TTL", 3600),
+        )
+        log_writer = MessageLogWriter(storage_worker, self.logger, config, identity_cache)
+        log_writer.start()
+        get_metrics().set_gauge("bot_message_log_queue_depth", lambda: log_writer.queue_depth)
+        get_metrics().set_gauges("bot_identity_cache", identity_cache.stats,
+            ("size", "hits", "misses"))
+        return log_writer
+
+    def close(self):
+        """Save the queued message log and the last metrics"""
+        if self.log_writer:
+            self.log_writer.close()
+        if self.metrics_exporter:
+            self.metrics_exporter.close()
+
     def __save_message(self, message: telebot.types.Message, data: str | None):
         try:
             if self.storage_worker:
-                user = self.storage_worker.get_user(message.from_user.id)
-                if user is None:
-                    user = self.__new_user_from_tgmessage(message)
-                    user = self.storage_worker.save_user(user)
-                chat = self.storage_worker.get_chat(message.chat.id)
-                if chat is None:
-                    chat = self.__new_chat_from_tgmessage(message)
-                    chat = self.storage_worker.save_chat(chat)
-                message = self.__new_message(user, chat, message.text, data)
-                self.storage_worker.save_message(message)
+                record = MessageLogRecord(
+                    user=self.__new_user_from_tgmessage(message),
+                    chat=self.__new_chat_from_tgmessage(message),
+                    message=self.__new_message(message, data),
+                )
+                if self.log_writer:
+                    self.log_writer.put(record)
+                else:
+                    self.storage_worker.record_message(record.user, record.chat, record.message)
         except Exception as ex : # pylint: disable=broad-except
             self.logger.info("Failed to save to DB")
             self.logger.exception(ex)
 
 
-    def __new_user_from_tgmessage(self, message: telebot.types.Message)-> User:
-        user = User()
-        user.id = message.from_user.id
-        user.username = message.from_user.username
-        user.first_name = message.from_user.first_name
-        user.last_name = message.from_user.last_name
-        user.full_name = message.from_user.full_name
-        user.language_code = message.from_user.language_code
-        user.is_bot = message.from_user.is_bot
-        return user
-
-    def __new_chat_from_tgmessage(self, message: telebot.types.Message)-> Chat:
-        chat = Chat()
-        chat.id = message.chat.id
-        chat.bio = message.chat.bio
+    def __new_user_from_tgmessage(self, message: telebot.types.Message)-> Dict[str, Any]:
+        return {
+            "id": message.from_user.id,
+            "username": message.from_user.username,
+            "first_name": message.from_user.first_name,
+            "last_name": message.from_user.last_name,
+            "full_name": message.from_user.full_name,
+            "language_code": message.from_user.language_code,
+            "is_bot": message.from_user.is_bot,
+        }
+
+    def __new_chat_from_tgmessage(self, message: telebot.types.Message)-> Dict[str, Any]:
         if message.chat.description:
-            chat.description = message.chat.description
+            description = message.chat.description
         else:
-            chat.description = f"{message.chat.type} - {message.chat.username}"
-        return chat
-
-    def __new_message(self, user: User, chat: Chat, txt: str, data: str | None)-> Message:
-        message = Message()
-        message.user = user
-        message.chat = chat
-        message.full_user_name = f"{user.username} - {user.full_name}"
-        message.text = txt
-        message.call_data = data
-        return message
+            description = f"{message.chat.type} - {message.chat.username}"
+        return {
+            "id": message.chat.id,
+            "bio": message.chat.bio,
+            "description": description,
+        }
+
+    def __new_message(self, message: telebot.types.Message, data: str | None)-> Dict[str, Any]:
+        return {
+            "user_id": message.from_user.id,
+            "chat_id": message.chat.id,
+            "full_user_name": f"{message.from_user.username} - {message.from_user.full_name}",
+            "date_time": datetime.now(),
+            "text": message.text,
+            "call_data": data,
+        }
+
+class AsyncMiddleware(asyncio_handler_backends.BaseMiddleware):
+    """Runs the synchronous Middleware in worker threads"""
+
+    def __init__(self, middleware: Middleware):
+        super().__init__()
+        self.update_types = middleware.update_types
+        self.update_sensitive = True
+        self.middleware = middleware
+
+    async def pre_process(self, message, data):
+        raise NotImplementedError
+
+    async def post_process(self, message, data, exception):
+        raise NotImplementedError
+
+    async def pre_process_message(self, message: telebot.types.Message, data):
+        """Logging incoming messages"""
+        await asyncio.to_thread(self.middleware.pre_process_message, message, data)
+
+    async def post_process_message(self, message: telebot.types.Message, data, exception=None):
+        """Post-processing, logging exceptions and user actions"""
+        await asyncio.to_thread(self.middleware.post_process_message, message, data, exception)
+
+    async def pre_process_callback_query(self, call: telebot.types.CallbackQuery, data):
+        """Logging incoming callback query"""
+        await asyncio.to_thread(self.middleware.pre_process_callback_query, call, data)
+
+    async def post_process_callback_query(self, call: telebot.types.CallbackQuery,
+    data, exception=None):
+        """Post-processing, logging exceptions and user actions"""
+        await asyncio.to_thread(self.middleware.post_process_callback_query,
+            call, data, exception)
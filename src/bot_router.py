@@ -0,0 +1,201 @@
+"""The module contains routing of updates to handlers and to atomic functions
+that are not loaded yet"""
+
+import asyncio
+import itertools
+import logging
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from telebot import types, util
+from telebot.async_telebot import AsyncTeleBot
+from telebot.callback_data import CallbackDataFilter
+from bot_func_abc import AtomicBotFunctionABC
+from bot_sender import FloodLimitedTeleBot
+from load_atomic import LazyAtomicFunction, PluginReport, count_handlers, log_plugin_reports
+
+Routes = Tuple[List[dict], int, Dict[str, List[dict]], List[dict]]
+
+class HandlerRoutingTable:
+    """Maps commands and callback data prefixes to the handlers that can process them.
+    Handlers without a commands or a callback data filter are candidates for every update.
+    Routes are rebuilt when a handler list is replaced or grows,
+    invalidate must be called after handlers are reordered in place"""
+
+    ROUTED_UPDATE_TYPES = ("message", "callback_query")
+
+    def __init__(self):
+        self.__routes: Dict[str, Routes] = {}
+        self.__lock = threading.Lock()
+
+    def get_handlers(self, handlers: List[dict], update: Any, update_type: str) -> List[dict]:
+        """Get the handlers that can process the message or the callback query, in their order"""
+        routes, generic = self.__get_routes(handlers, update_type)
+        key = self.get_route_key(update, update_type)
+        if key is None:
+            return generic
+        return routes.get(key, generic)
+
+    def invalidate(self):
+        """Rebuild routes on the next update"""
+        with self.__lock:
+            self.__routes.clear()
+
+    @staticmethod
+    def get_route_key(update: Any, update_type: str) -> Optional[str]:
+        """Get the command of the message or the prefix of the callback data"""
+        if update_type == "message":
+            if update.content_type == "text" and util.is_command(update.text or ""):
+                return util.extract_command(update.text)
+        elif update_type == "callback_query" and update.data:
+            return update.data.split(":", 1)[0]
+        return None
+
+    def __get_routes(self, handlers: List[dict],
+    update_type: str) -> Tuple[Dict[str, List[dict]], List[dict]]:
+        cached = self.__routes.get(update_type)
+        if cached is None or cached[0] is not handlers or cached[1] != len(handlers):
+            with self.__lock:
+                snapshot = list(handlers)
+                keys = [self.__get_handler_keys(handler, update_type) for handler in snapshot]
+                generic = [handler for handler, handler_keys in zip(snapshot, keys)
+                    if handler_keys is None]
+                routes = {key: [handler for handler, handler_keys in zip(snapshot, keys)
+                        if handler_keys is None or key in handler_keys]
+                    for handler_keys in keys if handler_keys for key in handler_keys}
+                cached = (handlers, len(snapshot), routes, generic)
+                self.__routes[update_type] = cached
+        return cached[2], cached[3]
+
+    @staticmethod
+    def __get_handler_keys(handler: dict, update_type: str) -> Optional[List[str]]:
+        """Get the commands or callback data prefixes of the handler, None if it has none"""
+        filters = handler.get("filters", {})
+        if update_type == "message" and filters.get("commands"):
+            return list(filters["commands"])
+        config = filters.get("config")
+        if update_type == "callback_query" and isinstance(config, CallbackDataFilter):
+            return [config.factory.prefix]
+        return None
+
+class LazyFunctionRouter:
+    """Finds updates for not loaded functions by commands and callback data prefixes,
+    loads these functions and places their handlers before the default handlers.
+    Must be created after all functions except the default one have set their handlers"""
+
+    ROUTED_HANDLER_LISTS = ("message_handlers", "callback_query_handlers")
+
+    def __init__(self, bot, functions_list: List[AtomicBotFunctionABC],
+    set_handlers: Callable[[AtomicBotFunctionABC], None], logger: logging.Logger):
+        self.bot = bot
+        self.__set_handlers = set_handlers
+        self.__logger = logger
+        self.__commands: Dict[str, LazyAtomicFunction] = {}
+        self.__prefixes: Dict[str, LazyAtomicFunction] = {}
+        for funct in functions_list:
+            if isinstance(funct, LazyAtomicFunction) and funct.state:
+                for cmd in funct.commands:
+                    self.__commands[cmd] = funct
+                for prefix in funct.callback_prefixes:
+                    self.__prefixes[prefix] = funct
+        self.__boundaries = {name: len(getattr(bot, name)) for name in self.ROUTED_HANDLER_LISTS}
+        self.__lock = threading.Lock()
+
+    def has_unloaded_functions(self, updates: List[types.Update]) -> bool:
+        """Check that some updates are for not loaded functions"""
+        return bool(self.__commands) and any(self.__find_function(update) for update in updates)
+
+    def load_functions(self, updates: List[types.Update]):
+        """Import functions on their first update and register their handlers"""
+        for update in updates:
+            funct = self.__find_function(update)
+            if funct is not None:
+                self.__load(funct)
+
+    def load_function(self, function_id: str):
+        """Import the function by its id, for example to run its saved next step handler"""
+        for funct in itertools.chain(self.__commands.values(), self.__prefixes.values()):
+            if funct.function_id == function_id:
+                self.__load(funct)
+                return
+
+    def __load(self, funct: LazyAtomicFunction):
+        """Import the function and place its handlers before the default handlers"""
+        with self.__lock:
+            if funct.function is not None or not funct.state:
+                return
+            counts = {name: len(getattr(self.bot, name)) for name in self.ROUTED_HANDLER_LISTS}
+            try:
+                report = funct.load()
+                start = time.perf_counter()
+                handlers = count_handlers(self.bot)
+                self.__set_handlers(funct.function)
+                report.handlers_time = time.perf_counter() - start
+                report.handlers = count_handlers(self.bot) - handlers
+                self.__logger.info("%s - loaded on demand", funct)
+            except Exception as ex: # pylint: disable=broad-except
+                self.__logger.error(ex)
+                funct.state = False
+                self.__logger.warning("%s - start EXCEPTION!", funct)
+                report = PluginReport(funct.module_name, status="failed",
+                    functions=[funct.class_name], error=repr(ex))
+            self.__move_handlers_before_defaults(counts)
+            log_plugin_reports([report], self.__logger)
+
+    def __find_function(self, update: types.Update) -> Optional[LazyAtomicFunction]:
+        """Get the not loaded function that handles the update"""
+        funct = None
+        if update.message and util.is_command(update.message.text or ""):
+            funct = self.__commands.get(util.extract_command(update.message.text))
+        elif update.callback_query and update.callback_query.data:
+            funct = self.__prefixes.get(update.callback_query.data.split(":")[0])
+        if funct is None or funct.function is not None or not funct.state:
+            return None
+        return funct
+
+    def __move_handlers_before_defaults(self, counts: Dict[str, int]):
+        """Move handlers added after counts were taken before the default handlers.
+        Lists are replaced, not changed, so updates being processed are not affected"""
+        for name, count in counts.items():
+            handlers = getattr(self.bot, name)
+            boundary = self.__boundaries[name]
+            added = handlers[count:]
+            setattr(self.bot, name, handlers[:boundary] + added + handlers[boundary:count])
+            self.__boundaries[name] = boundary + len(added)
+
+class RoutedTeleBot(FloodLimitedTeleBot):
+    """TeleBot that checks only the handlers routed by the command
+    or the callback data prefix of the update instead of all handlers.
+    Messages are sent within flood limits"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.routing_table = HandlerRoutingTable()
+
+    def _notify_command_handlers(self, handlers, new_messages, update_type):
+        if update_type not in HandlerRoutingTable.ROUTED_UPDATE_TYPES:
+            super()._notify_command_handlers(handlers, new_messages, update_type)
+            return
+        for message in new_messages:
+            super()._notify_command_handlers(
+                self.routing_table.get_handlers(handlers, message, update_type),
+                [message], update_type)
+
+class RoutedAsyncTeleBot(AsyncTeleBot):
+    """AsyncTeleBot that checks only the handlers routed by the command
+    or the callback data prefix of the update instead of all handlers"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.routing_table = HandlerRoutingTable()
+
+    async def _process_updates(self, handlers, messages, update_type):
+        if update_type not in HandlerRoutingTable.ROUTED_UPDATE_TYPES:
+            await super()._process_updates(handlers, messages, update_type)
+            return
+        tasks = []
+        for message in messages:
+            tasks.append(super()._process_updates(
+                self.routing_table.get_handlers(handlers, message, update_type),
+                [message], update_type))
+        await asyncio.gather(*tasks)
@@ -0,0 +1,248 @@
+"""The module contains flood limits of outgoing bot messages and a sender
+that combines them"""
+
+import dataclasses
+import functools
+import inspect
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional
+import telebot
+from telebot import types
+from bot_env import get_env_float, get_env_int
+
+@dataclasses.dataclass
+class BotSenderConfig:
+    """Outgoing messages limits"""
+    global_rate: float = 30
+    chat_rate: float = 1
+    chat_burst: int = 5
+    max_retries: int = 3
+    max_chats: int = 10000
+
+class TokenBucket:
+    """Token bucket rate limiter"""
+
+    def __init__(self, rate: float, capacity: float, clock: Callable[[], float] = time.monotonic):
+        self.rate = rate
+        self.capacity = max(1.0, capacity)
+        self.__clock = clock
+        self.__tokens = self.capacity
+        self.__updated = clock()
+        self.__lock = threading.Lock()
+
+    def reserve(self) -> float:
+        """Take a token and get the number of seconds to wait before using it"""
+        with self.__lock:
+            now = self.__clock()
+            self.__tokens = min(self.capacity, self.__tokens + (now - self.__updated) * self.rate)
+            self.__updated = now
+            self.__tokens -= 1
+            if self.__tokens >= 0 or self.rate <= 0:
+                return 0.0
+            return -self.__tokens / self.rate
+
+    def acquire(self):
+        """Wait for a token"""
+        delay = self.reserve()
+        if delay > 0:
+            time.sleep(delay)
+
+    def is_full(self) -> bool:
+        """Check that the bucket has not been used recently"""
+        with self.__lock:
+            elapsed = self.__clock() - self.__updated
+            return self.__tokens + elapsed * self.rate >= self.capacity
+
+class FloodLimiter:
+    """Keeps Bot API calls within Telegram flood limits.
+    Calls wait for tokens of the global and the per-chat bucket in the calling thread,
+    so messages of one chat keep their order. A 429 response is retried after retry_after"""
+
+    def __init__(self, config: Optional[BotSenderConfig] = None):
+        self.__config = config or get_bot_sender_config()
+        self.__global_bucket = TokenBucket(self.__config.global_rate, self.__config.global_rate)
+        self.__chat_buckets: OrderedDict[Any, TokenBucket] = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def call(self, chat_id: Any, method: Callable, /, *args, **kwargs) -> Any:
+        """Call a Bot API method on behalf of the chat, only the global limit is applied
+        to calls without a chat"""
+        retries = self.__config.max_retries
+        while True:
+            self.__global_bucket.acquire()
+            if chat_id is not None:
+                self.__get_chat_bucket(chat_id).acquire()
+            try:
+                return method(*args, **kwargs)
+            except telebot.apihelper.ApiTelegramException as ex:
+                if ex.error_code != 429 or retries <= 0:
+                    raise
+                retries -= 1
+                retry_after = (ex.result_json or {}).get("parameters", {}).get("retry_after", 1)
+                logging.getLogger(__name__).warning(
+                    "Flood limit for chat %s, retry after %s seconds", chat_id, retry_after)
+                time.sleep(retry_after)
+
+    def __get_chat_bucket(self, chat_id: Any) -> TokenBucket:
+        with self.__lock:
+            bucket = self.__chat_buckets.get(chat_id)
+            if bucket is None:
+                bucket = TokenBucket(self.__config.chat_rate, self.__config.chat_burst)
+                self.__chat_buckets[chat_id] = bucket
+                self.__forget_idle_chats()
+            self.__chat_buckets.move_to_end(chat_id)
+            return bucket
+
+    def __forget_idle_chats(self):
+        """Remove buckets of the least recently used chats that are full again"""
+        while len(self.__chat_buckets) > self.__config.max_chats:
+            chat_id, bucket = next(iter(self.__chat_buckets.items()))
+            if not bucket.is_full():
+                break
+            del self.__chat_buckets[chat_id]
+
+def _limited(name: str) -> Callable:
+    """Get the TeleBot method that is called through the flood limiter of the bot"""
+    method = getattr(telebot.TeleBot, name)
+    signature = inspect.signature(method)
+
+    @functools.wraps(method)
+    def call(self, *args, **kwargs):
+        chat_id = signature.bind_partial(self, *args, **kwargs).arguments.get("chat_id")
+        return self.flood_limiter.call(chat_id, method, self, *args, **kwargs)
+    return call
+
+class FloodLimitedTeleBot(telebot.TeleBot):
+    """TeleBot that sends and edits messages through its flood limiter,
+    so every function of the bot shares the limits, reply_to included"""
+
+    def __init__(self, *args, flood_limiter: Optional[FloodLimiter] = None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.flood_limiter = flood_limiter or FloodLimiter()
+
+    send_message = _limited("send_message")
+    forward_message = _limited("forward_message")
+    copy_message = _limited("copy_message")
+    send_photo = _limited("send_photo")
+    send_audio = _limited("send_audio")
+    send_document = _limited("send_document")
+    send_video = _limited("send_video")
+    send_animation = _limited("send_animation")
+    send_voice = _limited("send_voice")
+    send_sticker = _limited("send_sticker")
+    send_location = _limited("send_location")
+    send_contact = _limited("send_contact")
+    send_poll = _limited("send_poll")
+    send_dice = _limited("send_dice")
+    send_media_group = _limited("send_media_group")
+    edit_message_text = _limited("edit_message_text")
+    edit_message_caption = _limited("edit_message_caption")
+    edit_message_media = _limited("edit_message_media")
+    edit_message_reply_markup = _limited("edit_message_reply_markup")
+
+class BotSender:
+    """Sends several texts combined into few messages and photos in media groups.
+    Flood limits are kept by the bot, see FloodLimitedTeleBot"""
+
+    MAX_TEXT_LENGTH = 4096
+    MAX_MEDIA_GROUP = 10
+
+    __senders: Dict[int, "BotSender"] = {}
+    __senders_lock = threading.Lock()
+
+    def __init__(self, bot: telebot.TeleBot):
+        self.bot = bot
+
+    @classmethod
+    def for_bot(cls, bot: telebot.TeleBot) -> "BotSender":
+        """Get the sender shared by all functions of the bot"""
+        with cls.__senders_lock:
+            sender = cls.__senders.get(id(bot))
+            if sender is None:
+                sender = cls(bot)
+                cls.__senders[id(bot)] = sender
+            return sender
+
+    def send_texts(self, chat_id: Any, texts: List[str], separator: str = "\n\n",
+    **kwargs) -> List[types.Message]:
+        """Send texts combined into as few messages as possible"""
+        return [self.bot.send_message(chat_id, text, **kwargs)
+            for text in self.combine_texts(texts, separator)]
+
+    def send_photos(self, chat_id: Any, photos: List[Any], **kwargs) -> List[types.Message]:
+        """Send photos in media groups of up to ten. When a group is rejected,
+        for example for a URL that is not a photo, its photos are sent one by one"""
+        messages: List[types.Message] = []
+        for start in range(0, len(photos), self.MAX_MEDIA_GROUP):
+            group = photos[start:start + self.MAX_MEDIA_GROUP]
+            if len(group) > 1:
+                media = [types.InputMediaPhoto(photo) for photo in group]
+                try:
+                    messages.extend(self.bot.send_media_group(chat_id, media, **kwargs))
+                    continue
+                except telebot.apihelper.ApiTelegramException as ex:
+                    logging.getLogger(__name__).warning(
+                        "Media group is rejected, photos are sent one by one: %s", ex)
+            messages.extend(self.__send_each_photo(chat_id, group, **kwargs))
+        return messages
+
+    def __send_each_photo(self, chat_id: Any, photos: List[Any],
+    **kwargs) -> List[types.Message]:
+        """Send photos one by one skipping rejected ones, raise the error if all are rejected"""
+        messages: List[types.Message] = []
+        error: Optional[Exception] = None
+        for photo in photos:
+            try:
+                messages.append(self.bot.send_photo(chat_id, photo, **kwargs))
+            except telebot.apihelper.ApiTelegramException as ex:
+                logging.getLogger(__name__).warning("Photo %s is rejected: %s", photo, ex)
+                error = ex
+        if error is not None and not messages:
+            raise error
+        return messages
+
+    @classmethod
+    def combine_texts(cls, texts: List[str], separator: str = "\n\n") -> List[str]:
+        """Join texts into messages no longer than the Telegram limit"""
+        messages: List[str] = []
+        current = ""
+        for text in texts:
+            if current and len(current) + len(separator) + len(text) <= cls.MAX_TEXT_LENGTH:
+                current += separator + text
+                continue
+            if current:
+                messages.append(current)
+            *parts, current = cls.split_text(text, separator)
+            messages.extend(parts)
+        if current:
+            messages.append(current)
+        return messages
+
+    @classmethod
+    def split_text(cls, text: str, separator: str = "\n\n") -> List[str]:
+        """Split a text longer than the Telegram limit at the last separator, line break
+        or space that fits, so formatting entities of a line are not cut"""
+        parts: List[str] = []
+        while len(text) > cls.MAX_TEXT_LENGTH:
+            for boundary in (separator, "\n", " "):
+                position = text.rfind(boundary, 1, cls.MAX_TEXT_LENGTH + 1) if boundary else -1
+                if position > 0:
+                    parts.append(text[:position])
+                    text = text[position + len(boundary):]
+                    break
+            else:
+                parts.append(text[:cls.MAX_TEXT_LENGTH])
+                text = text[cls.MAX_TEXT_LENGTH:]
+        parts.append(text)
+        return parts
+
+def get_bot_sender_config() -> BotSenderConfig:
+    """Get outgoing messages limits from environment variables"""
+    return BotSenderConfig(
+        global_rate=get_env_float("SEND_GLOBAL_RATE", 30),
+        chat_rate=get_env_float("SEND_CHAT_RATE", 1),
+        chat_burst=get_env_int("SEND_CHAT_BURST", 5),
+    )
@@ -0,0 +1,382 @@
+"""The module contains stores of conversation state with expiry
+and the next step handler backend that keeps handlers in them.
+A shared store (SQLite or PostgreSQL) lets several bot processes continue
+conversations started by each other and keeps them over restarts."""
+
+import json
+import logging
+import threading
+import time
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+import telebot
+from telebot.handler_backends import HandlerBackend
+from sqlalchemy import Column, Float, LargeBinary, MetaData, String, Table
+from sqlalchemy import create_engine, delete, insert, select
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy_utils import database_exists, create_database
+
+Clock = Callable[[], float]
+
+class StateStore(ABC):
+    """Key-value store of conversation state, values expire after their time to live"""
+
+    shared: bool = False
+    """Values are visible to other processes and must be bytes"""
+
+    PURGE_INTERVAL = 60.0
+
+    @abstractmethod
+    def put(self, key: str, value: Any, ttl: float):
+        """Set the value of the key for ttl seconds"""
+
+    @abstractmethod
+    def update(self, key: str, function: Callable[[Optional[Any]], Any], ttl: float):
+        """Replace the value of the key with the function of the current value,
+        None if it is missing or expired, in one step. The new value is kept for ttl seconds"""
+
+    @abstractmethod
+    def pop(self, key: str) -> Optional[Any]:
+        """Remove the key and get its value, None if it is missing or expired"""
+
+    @abstractmethod
+    def keys(self, prefix: str) -> List[str]:
+        """Get the keys with the prefix that are not expired"""
+
+    @abstractmethod
+    def contains(self, key: str) -> bool:
+        """Check that the key has a value that is not expired"""
+
+    @abstractmethod
+    def delete(self, key: str):
+        """Remove the key"""
+
+    @abstractmethod
+    def purge_expired(self) -> int:
+        """Remove expired values, get their number"""
+
+class MemoryStateStore(StateStore):
+    """Store in the memory of the process, expired values are purged
+    on access and periodically on writes"""
+
+    def __init__(self, clock: Clock = time.time):
+        self.__clock = clock
+        self.__values: Dict[str, Tuple[float, Any]] = {}
+        self.__lock = threading.Lock()
+        self.__purged = clock()
+
+    def __len__(self) -> int:
+        return len(self.__values)
+
+    def put(self, key: str, value: Any, ttl: float):
+        now = self.__clock()
+        with self.__lock:
+            self.__values[key] = (now + ttl, value)
+        if now - self.__purged >= self.PURGE_INTERVAL:
+            self.purge_expired()
+
+    def update(self, key: str, function: Callable[[Optional[Any]], Any], ttl: float):
+        now = self.__clock()
+        with self.__lock:
+            entry = self.__values.get(key)
+            value = entry[1] if entry is not None and entry[0] > now else None
+            self.__values[key] = (now + ttl, function(value))
+
+    def pop(self, key: str) -> Optional[Any]:
+        with self.__lock:
+            entry = self.__values.pop(key, None)
+        if entry is None or entry[0] <= self.__clock():
+            return None
+        return entry[1]
+
+    def keys(self, prefix: str) -> List[str]:
+        now = self.__clock()
+        with self.__lock:
+            return [key for key, (expires_at, _) in self.__values.items()
+                if key.startswith(prefix) and expires_at > now]
+
+    def contains(self, key: str) -> bool:
+        entry = self.__values.get(key)
+        return entry is not None and entry[0] > self.__clock()
+
+    def delete(self, key: str):
+        with self.__lock:
+            self.__values.pop(key, None)
+
+    def purge_expired(self) -> int:
+        now = self.__clock()
+        with self.__lock:
+            self.__purged = now
+            expired = [key for key, (expires_at, _) in self.__values.items() if expires_at <= now]
+            for key in expired:
+                del self.__values[key]
+        return len(expired)
+
+class SqlStateStore(StateStore):
+    """Store in a table of SQLite or PostgreSQL database,
+    expired rows are purged periodically on writes"""
+
+    shared = True
+
+    def __init__(self, connection_string: str, clock: Clock = time.time):
+        self.__clock = clock
+        self.__engine = create_engine(connection_string)
+        if not database_exists(self.__engine.url):
+            create_database(self.__engine.url)
+        metadata = MetaData()
+        self.__table = Table("bot_state", metadata,
+            Column("key", String(200), primary_key=True),
+            Column("value", LargeBinary, nullable=False),
+            Column("expires_at", Float, nullable=False, index=True))
+        metadata.create_all(self.__engine)
+        self.__purged = clock()
+
+    def put(self, key: str, value: Any, ttl: float):
+        now = self.__clock()
+        row = {"key": key, "value": value, "expires_at": now + ttl}
+        dialect = self.__engine.dialect.name
+        with self.__engine.begin() as connection:
+            if dialect in ("postgresql", "sqlite"):
+                dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+                statement = dialect_insert(self.__table).values(row)
+                connection.execute(statement.on_conflict_do_update(index_elements=["key"],
+                    set_={"value": statement.excluded.value,
+                        "expires_at": statement.excluded.expires_at}))
+            else:
+                connection.execute(delete(self.__table).where(self.__table.c.key == key))
+                connection.execute(insert(self.__table).values(row))
+        if now - self.__purged >= self.PURGE_INTERVAL:
+            self.purge_expired()
+
+    def update(self, key: str, function: Callable[[Optional[Any]], Any], ttl: float):
+        try:
+            self.__update(key, function, ttl)
+        except IntegrityError:
+            # Another process inserted the key at the same time, now its row is locked
+            self.__update(key, function, ttl)
+
+    def __update(self, key: str, function: Callable[[Optional[Any]], Any], ttl: float):
+        """Read and replace the row in one transaction. The row is locked for update,
+        SQLite locks the database for writes from the start of the transaction"""
+        table = self.__table
+        with self.__engine.begin() as connection:
+            if self.__engine.dialect.name == "sqlite":
+                connection.exec_driver_sql("BEGIN IMMEDIATE")
+            row = connection.execute(select(table.c.value, table.c.expires_at)
+                .where(table.c.key == key).with_for_update()).first()
+            now = self.__clock()
+            value = row.value if row is not None and row.expires_at > now else None
+            values = {"value": function(value), "expires_at": now + ttl}
+            if row is None:
+                connection.execute(insert(table).values(key=key, **values))
+            else:
+                connection.execute(table.update().where(table.c.key == key).values(values))
+
+    def pop(self, key: str) -> Optional[Any]:
+        table = self.__table
+        with self.__engine.begin() as connection:
+            if self.__engine.dialect.delete_returning:
+                row = connection.execute(delete(table).where(table.c.key == key)
+                    .returning(table.c.value, table.c.expires_at)).first()
+            else:
+                row = connection.execute(select(table.c.value, table.c.expires_at)
+                    .where(table.c.key == key).with_for_update()).first()
+                connection.execute(delete(table).where(table.c.key == key))
+        if row is None or row.expires_at <= self.__clock():
+            return None
+        return row.value
+
+    def contains(self, key: str) -> bool:
+        table = self.__table
+        with self.__engine.connect() as connection:
+            return connection.execute(select(table.c.key).where(
+                table.c.key == key, table.c.expires_at > self.__clock())).first() is not None
+
+    def keys(self, prefix: str) -> List[str]:
+        table = self.__table
+        with self.__engine.connect() as connection:
+            return list(connection.execute(select(table.c.key).where(
+                table.c.key.startswith(prefix, autoescape=True),
+                table.c.expires_at > self.__clock())).scalars())
+
+    def delete(self, key: str):
+        with self.__engine.begin() as connection:
+            connection.execute(delete(self.__table).where(self.__table.c.key == key))
+
+    def purge_expired(self) -> int:
+        now = self.__clock()
+        self.__purged = now
+        with self.__engine.begin() as connection:
+            return connection.execute(delete(self.__table)
+                .where(self.__table.c.expires_at <= now)).rowcount
+
+CallbackReference = Tuple[str, str]
+"""Function id of the atomic function and the name of its method"""
+
+class _SharedKeys:
+    """Keys of a shared store that may have values. Keys written by the process are added
+    at once, keys of other processes are read at most every interval seconds,
+    so lookups of missing keys do not query the store"""
+
+    def __init__(self, store: StateStore, prefix: str, interval: float,
+    clock: Clock = time.monotonic):
+        self.__store = store
+        self.__prefix = prefix
+        self.__interval = interval
+        self.__clock = clock
+        self.__keys: Set[str] = set()
+        self.__read_at: Optional[float] = None
+        self.__lock = threading.Lock()
+
+    def __contains__(self, key: str) -> bool:
+        with self.__lock:
+            now = self.__clock()
+            if self.__read_at is None or now - self.__read_at >= self.__interval:
+                self.__read_at = now
+                self.__keys.update(self.__store.keys(self.__prefix))
+            return key in self.__keys
+
+    def add(self, key: str):
+        """Add a key written by the process"""
+        with self.__lock:
+            self.__keys.add(key)
+
+    def discard(self, key: str):
+        """Remove a key that was popped or deleted"""
+        with self.__lock:
+            self.__keys.discard(key)
+
+def _append_handler(saved: Optional[bytes], data: Tuple[CallbackReference, tuple, dict]) -> bytes:
+    """Add the saved form of a handler to the JSON list of handlers of the chat"""
+    return json.dumps((json.loads(saved) if saved else []) + [data]).encode()
+
+def _skip_owner(function_id: str):
+    """Default owner loader of the backend, functions that are not registered are not loaded"""
+    del function_id
+
+class StateHandlerBackend(HandlerBackend):
+    """Keeps next step handlers of chats in a state store for ttl seconds.
+    In a shared store a handler is saved as JSON with a reference to the method of an atomic
+    function and its arguments, the process that gets the next message finds the function
+    among its own, loading it with load_owner if it is not loaded yet.
+    Other callbacks, like closures and lambdas, and arguments that are not JSON
+    are kept in the memory of the process.
+    Handlers registered by other processes are seen after at most KEYS_INTERVAL seconds,
+    updates of a chat go to the same process, so it is usually the one that registered them"""
+
+    KEY_PREFIX = "next_step:"
+    KEYS_INTERVAL = 1.0
+
+    def __init__(self, store: StateStore, logger: logging.Logger, ttl: float = 3600):
+        super().__init__()
+        self.store = store
+        self.ttl = ttl
+        self.load_owner: Callable[[str], Any] = _skip_owner
+        self.__logger = logger
+        self.__local = MemoryStateStore() if store.shared else store
+        self.__owners: Dict[str, Any] = {}
+        self.__shared_keys = _SharedKeys(store, self.KEY_PREFIX, self.KEYS_INTERVAL)
+
+    @property
+    def blocking(self) -> bool:
+        """Access to the store does input and output"""
+        return self.store.shared
+
+    def register_owner(self, owner: Any):
+        """Allow saving references to methods of the atomic function"""
+        self.__owners[owner.function_id] = owner
+
+    def register_handler(self, handler_group_id, handler: telebot.Handler):
+        key = f"{self.KEY_PREFIX}{handler_group_id}"
+        data = self.__dump(handler) if self.store.shared else None
+        if data is not None:
+            self.store.update(key, lambda saved: _append_handler(saved, data), self.ttl)
+            self.__shared_keys.add(key)
+        else:
+            self.__local.update(key, lambda handlers: (handlers or []) + [handler], self.ttl)
+
+    def clear_handlers(self, handler_group_id):
+        key = f"{self.KEY_PREFIX}{handler_group_id}"
+        self.__local.delete(key)
+        if self.store.shared:
+            self.store.delete(key)
+            self.__shared_keys.discard(key)
+
+    def get_handlers(self, handler_group_id) -> Optional[List[telebot.Handler]]:
+        key = f"{self.KEY_PREFIX}{handler_group_id}"
+        handlers: List[telebot.Handler] = self.__local.pop(key) or []
+        # telebot asks for handlers on every message, most chats have none
+        # and the shared store is only read for chats with known keys
+        if self.store.shared and key in self.__shared_keys:
+            self.__shared_keys.discard(key)
+            handlers.extend(self.__load(self.store.pop(key)))
+        return handlers or None
+
+    def has_handlers(self, handler_group_id) -> bool:
+        """Check that the chat has next step handlers"""
+        key = f"{self.KEY_PREFIX}{handler_group_id}"
+        return self.__local.contains(key) or (self.store.shared and key in self.__shared_keys
+            and self.store.contains(key))
+
+    def __dump(self, handler: telebot.Handler) -> Optional[Tuple[CallbackReference, tuple, dict]]:
+        """Get the saved form of the handler, None if it can only be kept in memory"""
+        reference = self.__get_reference(handler.callback)
+        if reference is not None:
+            try:
+                json.dumps((handler.args, handler.kwargs), allow_nan=False)
+                return reference, handler.args, handler.kwargs
+            except (TypeError, ValueError) as ex:
+                self.__logger.warning("Arguments of %s are kept in memory: %s", reference, ex)
+        else:
+            self.__logger.warning("Next step handler %r is kept in memory",
+                getattr(handler.callback, "__qualname__", handler.callback))
+        return None
+
+    def __load(self, data: Optional[bytes]) -> List[telebot.Handler]:
+        """Get handlers from their saved form"""
+        try:
+            saved = json.loads(data) if data else []
+        except ValueError as ex:
+            self.__logger.warning("Next step handlers are not loaded: %s", ex)
+            return []
+        handlers = []
+        for (function_id, name), args, kwargs in saved:
+            callback = self.__resolve((function_id, name))
+            if callback is not None:
+                handlers.append(telebot.Handler(callback, *args, **kwargs))
+        return handlers
+
+    def __get_reference(self, callback: Callable) -> Optional[CallbackReference]:
+        """Get the function id and the attribute name of the method of a registered function"""
+        owner = getattr(callback, "__self__", None)
+        function_id = getattr(owner, "function_id", None)
+        if function_id is None or self.__owners.get(function_id) is not owner:
+            return None
+        # Names of private methods are mangled, the attribute is found by the function
+        for klass in type(owner).__mro__:
+            for name, value in vars(klass).items():
+                if value is callback.__func__:
+                    return function_id, name
+        return None
+
+    def __resolve(self, reference: CallbackReference) -> Optional[Callable]:
+        """Get the method by the reference"""
+        function_id, name = reference
+        if function_id not in self.__owners:
+            self.load_owner(function_id)
+        owner = self.__owners.get(function_id)
+        if owner is None or not hasattr(owner, name):
+            self.__logger.warning("Next step handler %s.%s is not found", function_id, name)
+            return None
+        return getattr(owner, name)
+
+def create_state_store(kind: str, connection_string: Optional[str] = None) -> StateStore:
+    """Create a store by its kind: memory, sqlite or postgres"""
+    if kind == "memory":
+        return MemoryStateStore()
+    if kind in ("sqlite", "postgres"):
+        if not connection_string:
+            raise ValueError(f"Connection string of the {kind} state store is not set")
+        return SqlStateStore(connection_string)
+    raise ValueError(f"Unknown state store {kind}, use memory, sqlite or postgres")
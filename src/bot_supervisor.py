@@ -0,0 +1,353 @@
+"""The module implements the multi-process mode of the bot.
+The supervisor receives updates and distributes them between worker processes
+by chat id, every worker runs its own StartApp, so handlers of different chats
+are not limited by one interpreter lock. Updates of one chat always go to the same worker
+and keep their order."""
+
+import dataclasses
+import functools
+import logging
+import multiprocessing
+import os
+import queue
+import signal
+import sys
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+import requests
+from telebot import apihelper
+from bot_env import get_env_float, get_env_int
+from bot_logging import get_rotating_handler, start_queued_logging
+from bot_metrics import get_metrics, start_metrics_exporter
+from bot_threading import wait_event
+from bot_webhook import WebhookConfig, WebhookServer
+
+Update = Dict[str, Any]
+
+@dataclasses.dataclass
+class SupervisorConfig:
+    """Settings of worker processes"""
+    processes: int = 2
+    queue_size: int = 100
+    health_timeout: float = 60.0
+
+@dataclasses.dataclass
+class WorkerProcess:
+    """Worker process with its queue of update batches and its heartbeat.
+    The queue is kept when the process is restarted gracefully, so queued updates are not lost.
+    A process killed while it reads the queue may hold its lock, then the queue is replaced
+    and the updates that can still be read are moved to the new queue"""
+    index: int
+    updates: Any
+    heartbeat: Any
+    process: Optional[multiprocessing.process.BaseProcess] = None
+    restarts: int = 0
+
+def get_partition_key(update: Update) -> int:
+    """Get the chat id of the update, updates without a chat are partitioned by the user id"""
+    for name in ("message", "edited_message", "channel_post", "edited_channel_post"):
+        if name in update:
+            return update[name]["chat"]["id"]
+    callback_query = update.get("callback_query")
+    if callback_query is not None and callback_query.get("message"):
+        return callback_query["message"]["chat"]["id"]
+    for value in update.values():
+        if isinstance(value, dict) and isinstance(value.get("from"), dict):
+            return value["from"]["id"]
+    return update["update_id"]
+
+def _worker_log_path(index: int) -> str:
+    """Every worker writes its own log, rotation of a shared file is not safe"""
+    root, ext = os.path.splitext(os.environ.get("LOG_PATH", "start_app.log"))
+    return f"{root}.worker-{index}{ext}"
+
+def run_worker(index: int, start_commands: List[str], updates: Any, heartbeat: Any,
+setup: Optional[Callable[[], None]] = None):
+    """Entry point of a worker process"""
+    # The supervisor stops workers through their queues after the updates already queued
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    parent = multiprocessing.parent_process()
+    if parent is not None:
+        threading.Thread(target=lambda: parent.join() or updates.put(None),
+            name="SupervisorWatch", daemon=True).start()
+    metrics_port = get_env_int("METRICS_PORT", 0)
+    if metrics_port:
+        os.environ["METRICS_PORT"] = str(metrics_port + 1 + index)
+    if os.environ.get("METRICS_PATH"):
+        os.environ["METRICS_PATH"] += f".worker-{index}"
+    os.environ["LOG_PATH"] = _worker_log_path(index)
+    if setup is not None:
+        setup()
+    from start_app import StartApp # pylint: disable=import-outside-toplevel
+    StartApp(start_commands).start_worker(updates, heartbeat)
+
+class Supervisor:
+    """Runs worker processes and distributes updates received by long polling
+    or by the webhook between them by chat id.
+    Workers that exit or stop taking updates for the health timeout are restarted,
+    SIGHUP restarts all workers one by one after the updates queued to them,
+    SIGTERM and SIGINT stop receiving updates and stop workers after the queued updates"""
+
+    _PROCESSES_ENV_KEY = "BOT_PROCESSES"
+    _WORKER_QUEUE_SIZE_ENV_KEY = "WORKER_QUEUE_SIZE"
+    _WORKER_HEALTH_TIMEOUT_ENV_KEY = "WORKER_HEALTH_TIMEOUT"
+    _TBOTTOKEN_ENV_KEY = "TBOTTOKEN"
+    _UPDATES_MODE_ENV_KEY = "UPDATES_MODE"
+
+    HEALTH_CHECK_INTERVAL = 1.0
+    POLL_TIMEOUT = 20
+    STOP_TIMEOUT = 30.0
+    PUT_RETRY_INTERVAL = 0.05
+    MOVE_TIMEOUT = 0.1
+
+    def __init__(self, start_commands: List[str], config: Optional[SupervisorConfig] = None,
+    setup: Optional[Callable[[], None]] = None, target: Callable[..., None] = run_worker):
+        self.logger = self.get_logger()
+        self.config = config or self.get_config()
+        self.__run_worker = functools.partial(target, start_commands=start_commands, setup=setup)
+        self.__workers: List[WorkerProcess] = []
+        self.__stop_event = threading.Event()
+        self.__lock = threading.Lock()
+        # Guards the queues of workers, the monitor replaces the queue of a restarted worker
+        self.__queue_lock = threading.Lock()
+
+    @classmethod
+    def is_enabled(cls) -> bool:
+        """Check that BOT_PROCESSES asks for more than one process"""
+        return get_env_int(cls._PROCESSES_ENV_KEY, 1) > 1
+
+    @classmethod
+    def get_config(cls) -> SupervisorConfig:
+        """Get settings from environment variables"""
+        return SupervisorConfig(
+            processes=max(1, get_env_int(cls._PROCESSES_ENV_KEY, 2)),
+            queue_size=max(1, get_env_int(cls._WORKER_QUEUE_SIZE_ENV_KEY, 100)),
+            health_timeout=get_env_float(cls._WORKER_HEALTH_TIMEOUT_ENV_KEY, 60),
+        )
+
+    @staticmethod
+    def get_logger() -> logging.Logger:
+        """Get the supervisor logger, records are written by a background thread"""
+        log = logging.getLogger(__name__)
+        log.setLevel(os.environ.get("LOGLEVEL") or "INFO")
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(
+            logging.Formatter("%(name)s %(asctime)s %(levelname)s %(message)s"))
+        handler = get_rotating_handler(f"{__name__}.log", max_bytes=10 * 1024 * 1024,
+            backup_count=5, compress=True)
+        start_queued_logging(log, [handler, console_handler])
+        return log
+
+    def run(self):
+        """Start workers and receive updates until SIGTERM or SIGINT"""
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.__stop_event.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: self.__stop_event.set())
+        if hasattr(signal, "SIGHUP"):
+            signal.signal(signal.SIGHUP, lambda signum, frame: threading.Thread(
+                target=self.restart_workers, name="SupervisorRestart", daemon=True).start())
+        exporter = start_metrics_exporter(self.logger)
+        self.start()
+        try:
+            if os.environ.get(self._UPDATES_MODE_ENV_KEY, "").lower() == "webhook":
+                self.serve_webhook()
+            else:
+                self.poll()
+        finally:
+            self.stop()
+            if exporter is not None:
+                exporter.close()
+
+    def start(self):
+        """Start worker processes and their health checks"""
+        self.logger.critical("-= START SUPERVISOR: %d workers =-", self.config.processes)
+        context = multiprocessing.get_context("spawn")
+        for index in range(self.config.processes):
+            worker = WorkerProcess(index, context.Queue(self.config.queue_size),
+                context.Value("d", time.time(), lock=False))
+            self.__start_process(worker)
+            self.__workers.append(worker)
+        get_metrics().set_gauge("bot_workers_alive", lambda: sum(
+            1 for worker in self.__workers if worker.process and worker.process.is_alive()))
+        threading.Thread(target=self.__monitor, name="SupervisorMonitor", daemon=True).start()
+
+    def submit(self, updates: List[Update]):
+        """Put updates into the queues of their workers. Blocks while a queue is full"""
+        batches: Dict[int, List[Update]] = {}
+        for update in updates:
+            index = get_partition_key(update) % len(self.__workers)
+            batches.setdefault(index, []).append(update)
+        for index, batch in batches.items():
+            self.__put(self.__workers[index], batch)
+
+    def poll(self):
+        """Receive updates by long polling until the supervisor is stopped"""
+        token = os.environ[self._TBOTTOKEN_ENV_KEY]
+        offset = 0
+        while not self.__stop_event.is_set():
+            try:
+                updates = apihelper.get_updates(token, offset=offset, limit=100,
+                    timeout=self.POLL_TIMEOUT, long_polling_timeout=self.POLL_TIMEOUT)
+            except (apihelper.ApiException, requests.exceptions.RequestException) as ex:
+                self.logger.error("Failed to get updates: %s", ex)
+                wait_event(self.__stop_event, 3)
+                continue
+            if updates:
+                offset = updates[-1]["update_id"] + 1
+                self.submit(updates)
+        if offset:
+            # Confirm the queued updates, so they are not received again after a restart
+            try:
+                apihelper.get_updates(token, offset=offset, limit=1)
+            except (apihelper.ApiException, requests.exceptions.RequestException) as ex:
+                self.logger.warning("Failed to confirm updates: %s", ex)
+
+    def serve_webhook(self):
+        """Receive updates by the webhook until the supervisor is stopped"""
+        config = WebhookConfig.from_env()
+        server = WebhookServer(self.submit, self.logger, config.path, config.secret_token,
+            parse=False)
+        server.start(config.host, config.port, config.workers)
+        try:
+            if config.url:
+                apihelper.set_webhook(os.environ[self._TBOTTOKEN_ENV_KEY],
+                    **config.get_webhook_params())
+            self.__stop_event.wait()
+        finally:
+            server.stop()
+
+    def restart_workers(self):
+        """Restart workers one by one, each after the updates queued to it"""
+        self.logger.warning("Restarting workers")
+        for worker in self.__workers:
+            with self.__lock:
+                if self.__stop_event.is_set():
+                    return
+                self.__stop_process(worker)
+                worker.restarts += 1
+                self.__start_process(worker)
+        self.logger.warning("Workers restarted")
+
+    def stop(self):
+        """Stop workers after the updates queued to them"""
+        self.__stop_event.set()
+        with self.__lock:
+            deadline = time.monotonic() + self.STOP_TIMEOUT
+            for worker in self.__workers:
+                self.__ask_to_stop(worker)
+            for worker in self.__workers:
+                self.__wait_stopped(worker, deadline)
+        self.logger.critical("-= STOP SUPERVISOR =-")
+
+    def __start_process(self, worker: WorkerProcess):
+        worker.heartbeat.value = time.time()
+        worker.process = multiprocessing.get_context("spawn").Process(target=self.__run_worker,
+            args=(worker.index,),
+            kwargs={"updates": worker.updates, "heartbeat": worker.heartbeat},
+            name=f"BotWorker-{worker.index}")
+        worker.process.start()
+        self.logger.info("Worker %d started, pid %d", worker.index, worker.process.pid)
+
+    def __stop_process(self, worker: WorkerProcess):
+        """Stop the worker after its queued updates"""
+        self.__ask_to_stop(worker)
+        self.__wait_stopped(worker, time.monotonic() + self.STOP_TIMEOUT)
+
+    def __ask_to_stop(self, worker: WorkerProcess):
+        """Queue the end of updates for the worker"""
+        if worker.process is not None and worker.process.is_alive():
+            try:
+                worker.updates.put(None, timeout=self.STOP_TIMEOUT)
+            except queue.Full:
+                self.logger.warning("Queue of worker %d is full", worker.index)
+
+    def __wait_stopped(self, worker: WorkerProcess, deadline: float):
+        """Wait for the worker to exit, terminate it after the deadline"""
+        if worker.process is None:
+            return
+        worker.process.join(max(0, deadline - time.monotonic()))
+        if worker.process.is_alive():
+            self.logger.warning("Worker %d does not stop, terminating", worker.index)
+            self.__kill_process(worker)
+
+    def __kill_process(self, worker: WorkerProcess):
+        worker.process.terminate()
+        worker.process.join(5)
+        if worker.process.is_alive():
+            worker.process.kill()
+            worker.process.join()
+
+    def __monitor(self):
+        """Restart workers that exited or do not take updates for the health timeout"""
+        while not wait_event(self.__stop_event, self.HEALTH_CHECK_INTERVAL):
+            for worker in self.__workers:
+                with self.__lock:
+                    if self.__stop_event.is_set():
+                        return
+                    reason = self.__check_health(worker)
+                    if reason is None:
+                        continue
+                    self.logger.error("Worker %d %s (exit code %s), restarting",
+                        worker.index, reason, worker.process.exitcode)
+                    get_metrics().inc("bot_worker_restarts_total",
+                        worker=str(worker.index), reason=reason)
+                    if worker.process.is_alive():
+                        self.__kill_process(worker)
+                    self.__replace_queue(worker)
+                    worker.restarts += 1
+                    self.__start_process(worker)
+
+    def __put(self, worker: WorkerProcess, batch: List[Update]):
+        """Put the batch into the queue of the worker, waiting while the queue is full.
+        The queue is taken again on every try, as the monitor replaces the queue
+        of a restarted worker. After the stop the batch is dropped if the queue stays full"""
+        deadline = None
+        while True:
+            with self.__queue_lock:
+                try:
+                    worker.updates.put_nowait(batch)
+                    return
+                except queue.Full:
+                    pass
+            if self.__stop_event.is_set():
+                deadline = deadline or time.monotonic() + self.STOP_TIMEOUT
+                if time.monotonic() > deadline:
+                    self.logger.error("Queue of worker %d is full, %d updates are dropped",
+                        worker.index, len(batch))
+                    return
+            time.sleep(self.PUT_RETRY_INTERVAL)
+
+    def __replace_queue(self, worker: WorkerProcess):
+        """Give the worker a new queue and move the batches left in the old one in their order.
+        Batches are not read if the killed process held the lock of the old queue"""
+        old_updates = worker.updates
+        moved = 0
+        with self.__queue_lock:
+            worker.updates = multiprocessing.get_context("spawn").Queue(self.config.queue_size)
+            while True:
+                try:
+                    worker.updates.put_nowait(old_updates.get(timeout=self.MOVE_TIMEOUT))
+                except queue.Empty:
+                    break
+                moved += 1
+        try:
+            lost = old_updates.qsize()
+        except NotImplementedError:
+            lost = 0
+        old_updates.close()
+        old_updates.cancel_join_thread()
+        if lost:
+            self.logger.error("Worker %d: %d batches are lost with the old queue",
+                worker.index, lost)
+        elif moved:
+            self.logger.warning("Worker %d: %d batches are moved to the new queue",
+                worker.index, moved)
+
+    def __check_health(self, worker: WorkerProcess) -> Optional[str]:
+        """Get the reason to restart the worker, None if it is healthy"""
+        if not worker.process.is_alive():
+            return "exited"
+        if time.time() - worker.heartbeat.value > self.config.health_timeout:
+            return "not_responding"
+        return None
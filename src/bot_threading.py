@@ -0,0 +1,11 @@
+"""The module contains threading helpers shared by the bot modules"""
+
+import threading
+from typing import Optional
+
+def wait_event(event: threading.Event, timeout: Optional[float] = None) -> bool:
+    """Wait until the event is set or the timeout passes, get whether it is set.
+    telebot.util.OrEvent replaces wait of an Event instance with a function without arguments,
+    so pylint takes that signature for every Event created in the bot.
+    The event is passed here as an argument and its wait is not inferred from telebot"""
+    return event.wait(timeout)
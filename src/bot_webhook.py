@@ -0,0 +1,209 @@
+"""The module implements an HTTP server that receives updates from Telegram webhooks"""
+
+import dataclasses
+import functools
+import hmac
+import json
+import logging
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from typing import Any, Callable, Dict, List, Optional
+from urllib.parse import urlsplit
+from telebot import types
+from bot_env import get_env_int
+
+ProcessUpdates = Callable[[List[Any]], None]
+
+@dataclasses.dataclass
+class WebhookConfig:
+    """Settings of the webhook server and of the setWebhook method"""
+    url: str = ""
+    secret_token: str = ""
+    host: str = "0.0.0.0"
+    port: int = 8443
+    path: str = "/webhook"
+    workers: int = 8
+
+    @classmethod
+    def from_env(cls) -> "WebhookConfig":
+        """Get settings from environment variables,
+        the path is taken from WEBHOOK_PATH or from the path of WEBHOOK_URL"""
+        url = os.environ.get("WEBHOOK_URL", "")
+        return cls(
+            url=url,
+            secret_token=os.environ.get("WEBHOOK_SECRET", ""),
+            host=os.environ.get("WEBHOOK_HOST", "0.0.0.0"),
+            port=get_env_int("WEBHOOK_PORT", 8443),
+            path=os.environ.get("WEBHOOK_PATH") or urlsplit(url).path or "/webhook",
+            workers=get_env_int("WEBHOOK_WORKERS", 8),
+        )
+
+    def get_webhook_params(self) -> Dict[str, Any]:
+        """Get parameters of setWebhook"""
+        return {
+            "url": self.url,
+            "secret_token": self.secret_token or None,
+            "max_connections": self.workers,
+        }
+
+class PooledHTTPServer(HTTPServer):
+    """HTTP server that handles requests in a fixed pool of threads.
+    At most max_pending connections wait for a free thread, by default one per thread,
+    other connections are answered 503 at once"""
+
+    REJECT_TIMEOUT = 1.0
+
+    def __init__(self, address, handler_class, workers: int, max_pending: Optional[int] = None):
+        super().__init__(address, handler_class)
+        workers = max(1, workers)
+        self.__executor = ThreadPoolExecutor(max_workers=workers,
+            thread_name_prefix="WebhookWorker")
+        self.__slots = threading.BoundedSemaphore(
+            workers + (max_pending if max_pending is not None else workers))
+
+    def process_request(self, request, client_address):
+        if not self.__slots.acquire(blocking=False): # pylint: disable=consider-using-with
+            self.__reject(request)
+            return
+        try:
+            future = self.__executor.submit(self.__process_request, request, client_address)
+        except RuntimeError:
+            self.__slots.release()
+            self.shutdown_request(request)
+            return
+        future.add_done_callback(functools.partial(self.__close_cancelled, request))
+
+    def __process_request(self, request, client_address):
+        try:
+            self.finish_request(request, client_address)
+        except Exception: # pylint: disable=broad-except
+            self.handle_error(request, client_address)
+        finally:
+            self.__close(request)
+
+    def __close_cancelled(self, request, future: Future):
+        """Close connections that were waiting when the server was closed"""
+        if future.cancelled():
+            self.__close(request)
+
+    def __close(self, request):
+        self.shutdown_request(request)
+        self.__slots.release()
+
+    def __reject(self, request):
+        """Answer 503 without reading the request, all threads are busy"""
+        try:
+            request.settimeout(self.REJECT_TIMEOUT)
+            request.sendall(b"HTTP/1.1 503 Service Unavailable\r\n"
+                b"Content-Length: 0\r\nConnection: close\r\n\r\n")
+        except OSError:
+            pass
+        finally:
+            self.shutdown_request(request)
+
+    def server_close(self):
+        super().server_close()
+        self.__executor.shutdown(wait=False, cancel_futures=True)
+
+class WebhookServer:
+    """Receives updates posted by Telegram to the webhook path,
+    checks the secret token and passes the updates on.
+    Updates are acknowledged as soon as they are queued, processing is done by the dispatcher.
+    GET requests to the root path answer OK for health checks of load balancers.
+    With parse set to False updates are passed on as decoded JSON objects.
+    Connections that send nothing for REQUEST_TIMEOUT seconds are closed,
+    so idle keep-alive connections and partial bodies do not hold the threads"""
+
+    SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+    MAX_BODY_SIZE = 1024 * 1024
+    REQUEST_TIMEOUT = 10.0
+
+    def __init__(self, process_updates: ProcessUpdates, logger: logging.Logger,
+    path: str = "/webhook", secret_token: Optional[str] = None, parse: bool = True):
+        self.__process_updates = process_updates
+        self.__parse = parse
+        self.__logger = logger
+        self.path = path
+        self.__secret_token = secret_token or ""
+        self.__server: Optional[PooledHTTPServer] = None
+
+    @property
+    def port(self) -> int:
+        """Port of the server, 0 if it is not started"""
+        return self.__server.server_port if self.__server is not None else 0
+
+    def start(self, host: str, port: int, workers: int = 8):
+        """Start serving in a background thread"""
+        if not self.__secret_token:
+            self.__logger.warning("Webhook secret token is not set, updates are not verified")
+        self.__server = PooledHTTPServer((host, port), self.__get_handler(), workers)
+        threading.Thread(target=self.__server.serve_forever,
+            name="WebhookServer", daemon=True).start()
+        self.__logger.info("Webhook server listens on %s:%d%s", host, self.port, self.path)
+
+    def stop(self):
+        """Stop serving"""
+        if self.__server is not None:
+            self.__server.shutdown()
+            self.__server.server_close()
+            self.__server = None
+
+    def handle_update(self, secret_token: str, body: bytes) -> int:
+        """Check the secret token and pass the update on, get the HTTP status of the answer"""
+        if not hmac.compare_digest(secret_token.encode("utf-8"),
+                self.__secret_token.encode("utf-8")):
+            return 403
+        try:
+            update = json.loads(body)
+            if not isinstance(update, dict) or "update_id" not in update:
+                raise ValueError("update_id is missing")
+            if self.__parse:
+                update = types.Update.de_json(update)
+        except (ValueError, TypeError, KeyError) as ex:
+            self.__logger.warning("Invalid webhook update: %s", ex)
+            return 400
+        self.__process_updates([update])
+        return 200
+
+    def __get_handler(self) -> type:
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Webhook request handler"""
+            protocol_version = "HTTP/1.1"
+            timeout = server.REQUEST_TIMEOUT
+
+            def do_POST(self): # pylint: disable=invalid-name
+                """Receive an update"""
+                if self.path.split("?")[0] != server.path:
+                    self.__answer(404)
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length") or 0)
+                except ValueError:
+                    length = -1
+                if length < 0 or length > server.MAX_BODY_SIZE:
+                    self.__answer(400 if length < 0 else 413)
+                    self.close_connection = True
+                    return
+                body = self.rfile.read(length)
+                self.__answer(server.handle_update(
+                    self.headers.get(server.SECRET_HEADER, ""), body))
+
+            def do_GET(self): # pylint: disable=invalid-name
+                """Answer health checks"""
+                self.__answer(200 if self.path == "/" else 404)
+
+            def __answer(self, status: int):
+                body = b"OK" if status == 200 else b""
+                self.send_response(status)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args): # pylint: disable=redefined-builtin
+                """Disable request logging"""
+
+        return Handler
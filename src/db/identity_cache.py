@@ -0,0 +1,63 @@
+"""The module contains an in-process cache of users and chats saved in the database"""
+
+import dataclasses
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple
+
+CacheKey = Tuple[str, Any]
+
+@dataclasses.dataclass
+class IdentityCacheStats:
+    """Cache counters"""
+    size: int
+    hits: int
+    misses: int
+
+class IdentityCache:
+    """Bounded LRU cache with TTL of users and chats rows known to be in the database.
+    A row is a hit only if all its fields are equal to the cached ones,
+    so a changed profile is always written again."""
+
+    def __init__(self, max_size: int = 10000, ttl: float = 3600):
+        self.__max_size = max(1, max_size)
+        self.__ttl = ttl
+        self.__rows: OrderedDict[CacheKey, Tuple[float, Dict[str, Any]]] = OrderedDict()
+        self.__lock = threading.Lock()
+        self.__hits = 0
+        self.__misses = 0
+
+    def is_known(self, table: str, row: Dict[str, Any]) -> bool:
+        """Check that the row is saved in the database with the same fields"""
+        key = (table, row["id"])
+        with self.__lock:
+            cached = self.__rows.get(key)
+            if cached is not None:
+                expires, cached_row = cached
+                if expires > time.monotonic() and cached_row == row:
+                    self.__rows.move_to_end(key)
+                    self.__hits += 1
+                    return True
+                del self.__rows[key]
+            self.__misses += 1
+            return False
+
+    def remember(self, table: str, row: Dict[str, Any]):
+        """Remember the row saved in the database"""
+        key = (table, row["id"])
+        with self.__lock:
+            self.__rows[key] = (time.monotonic() + self.__ttl, dict(row))
+            self.__rows.move_to_end(key)
+            while len(self.__rows) > self.__max_size:
+                self.__rows.popitem(last=False)
+
+    def invalidate(self, table: str, row_id: Any):
+        """Forget the row"""
+        with self.__lock:
+            self.__rows.pop((table, row_id), None)
+
+    def stats(self) -> IdentityCacheStats:
+        """Get cache counters"""
+        with self.__lock:
+            return IdentityCacheStats(len(self.__rows), self.__hits, self.__misses)
@@ -0,0 +1,112 @@
+"""The module contains a background writer that saves the message log in batches"""
+
+import atexit
+import dataclasses
+import logging
+import queue
+import threading
+import time
+from typing import Any, Dict, List, Optional
+from db.storage_worker import StorageWorker
+from db.identity_cache import IdentityCache
+
+@dataclasses.dataclass
+class MessageLogRecord:
+    """Rows of the users, chats and messages tables for one update"""
+    user: Dict[str, Any]
+    chat: Dict[str, Any]
+    message: Dict[str, Any]
+
+@dataclasses.dataclass
+class MessageLogWriterConfig:
+    """Message log writer settings"""
+    batch_size: int = 100
+    flush_interval: float = 1.0
+    queue_size: int = 10000
+
+class MessageLogWriter:
+    """Write-behind message log.
+    Records are queued by the update handlers and saved by a background thread
+    in one transaction per batch, when the batch is full or the flush interval passes.
+    Users and chats found in the identity cache with the same fields are not written again."""
+
+    def __init__(self, storage_worker: StorageWorker, logger: logging.Logger,
+    config: Optional[MessageLogWriterConfig] = None,
+    identity_cache: Optional[IdentityCache] = None):
+        self.__config = config or MessageLogWriterConfig()
+        self.__storage_worker = storage_worker
+        self.__logger = logger
+        self.__queue: queue.Queue = queue.Queue(maxsize=self.__config.queue_size)
+        self.identity_cache = identity_cache
+        self.__thread: Optional[threading.Thread] = None
+        self.dropped = 0
+
+    def start(self):
+        """Start the background thread"""
+        self.__thread = threading.Thread(target=self.__run, name="MessageLogWriter", daemon=True)
+        self.__thread.start()
+        atexit.register(self.close)
+
+    @property
+    def queue_depth(self) -> int:
+        """Number of records waiting to be saved"""
+        return self.__queue.qsize()
+
+    def put(self, record: MessageLogRecord):
+        """Queue the record for saving. The record is dropped if the queue is full"""
+        try:
+            self.__queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+            self.__logger.warning("Message log queue is full, dropped %d records", self.dropped)
+
+    def close(self, timeout: float = 10):
+        """Save the queued records and stop the background thread"""
+        if self.__thread is None:
+            return
+        self.__queue.put(None)
+        self.__thread.join(timeout)
+        self.__thread = None
+        atexit.unregister(self.close)
+
+    def __run(self):
+        batch: List[MessageLogRecord] = []
+        deadline = time.monotonic() + self.__config.flush_interval
+        stopping = False
+        while not stopping:
+            try:
+                record = self.__queue.get(timeout=max(0, deadline - time.monotonic()))
+                if record is None:
+                    stopping = True
+                else:
+                    batch.append(record)
+            except queue.Empty:
+                pass
+            if stopping or len(batch) >= self.__config.batch_size or time.monotonic() >= deadline:
+                self.__flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.__config.flush_interval
+
+    def __flush(self, batch: List[MessageLogRecord]):
+        if not batch:
+            return
+        users = self.__unknown_rows("users", [record.user for record in batch])
+        chats = self.__unknown_rows("chats", [record.chat for record in batch])
+        try:
+            self.__storage_worker.save_messages_batch(
+                users, chats, [record.message for record in batch])
+            if self.identity_cache:
+                for user in users:
+                    self.identity_cache.remember("users", user)
+                for chat in chats:
+                    self.identity_cache.remember("chats", chat)
+        except Exception as ex: # pylint: disable=broad-except
+            self.__logger.info("Failed to save %d messages to DB", len(batch))
+            self.__logger.exception(ex)
+
+    def __unknown_rows(self, table: str, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Get the last version of each row that is not in the identity cache"""
+        rows = list({row["id"]: row for row in rows}.values())
+        if self.identity_cache is None:
+            return rows
+        return [row for row in rows if not self.identity_cache.is_known(table, row)]
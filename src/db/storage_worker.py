@@ -1,10 +1,28 @@
 """The module contains the implementation of methods for working with the database"""
 
-from typing import List
-from sqlalchemy import create_engine
+import functools
+from typing import Any, Callable, Dict, List, TypeVar, cast
+from sqlalchemy import create_engine, insert
+from sqlalchemy.dialects import postgresql, sqlite
 from sqlalchemy.orm import sessionmaker, scoped_session
 from sqlalchemy_utils import database_exists, create_database
 from db.models_msg_log import Base, User, Chat, Message
+from bot_metrics import get_metrics
+
+Method = TypeVar("Method", bound=Callable[..., Any])
+
+def _timed(method: Method) -> Method:
+    """Collect time and errors of the database method"""
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        metrics = get_metrics()
+        try:
+            with metrics.timer("bot_db_seconds", method=method.__name__):
+                return method(*args, **kwargs)
+        except Exception:
+            metrics.inc("bot_db_errors_total", method=method.__name__)
+            raise
+    return cast(Method, wrapper)
 
 class StorageWorker:
     """Database operations"""
@@ -18,12 +36,14 @@ class StorageWorker:
         session = sessionmaker(autocommit=False, autoflush=False, bind=self.__engine)
         self.__db_session = scoped_session(session)
 
+    @_timed
     def save_message(self, msg: Message):
         """Save message"""
         with self.__db_session() as session:
             session.add(msg)
             session.commit()
 
+    @_timed
     def save_user(self, user: User)-> User:
         """Save user"""
         with self.__db_session() as session:
@@ -32,6 +52,7 @@ class StorageWorker:
             session.refresh(user)
             return user
 
+    @_timed
     def save_chat(self, chat: Chat)-> Chat:
         """Save chat"""
         with self.__db_session() as session:
@@ -40,24 +61,78 @@ class StorageWorker:
             session.refresh(chat)
             return chat
 
+    @_timed
+    def upsert_user(self, user: Dict[str, Any]):
+        """Insert user or update the existing one in one statement"""
+        with self.__db_session() as session:
+            self.__upsert(session, User, [user])
+            session.commit()
+
+    @_timed
+    def upsert_chat(self, chat: Dict[str, Any]):
+        """Insert chat or update the existing one in one statement"""
+        with self.__db_session() as session:
+            self.__upsert(session, Chat, [chat])
+            session.commit()
+
+    def record_message(self, user: Dict[str, Any], chat: Dict[str, Any],
+    message: Dict[str, Any]):
+        """Ensure user and chat and insert message in one transaction"""
+        self.save_messages_batch([user], [chat], [message])
+
+    @_timed
+    def save_messages_batch(self, users: List[Dict[str, Any]], chats: List[Dict[str, Any]],
+    messages: List[Dict[str, Any]]):
+        """Upsert users and chats and insert messages in one transaction"""
+        with self.__db_session() as session:
+            self.__upsert(session, User, users)
+            self.__upsert(session, Chat, chats)
+            if messages:
+                session.execute(insert(Message), messages)
+            session.commit()
+
+    def __upsert(self, session, model: type[Base], rows: List[Dict[str, Any]]):
+        """Insert rows or update existing ones with the same primary key"""
+        if not rows:
+            return
+        rows = list({row["id"]: row for row in rows}.values())
+        table = model.__table__
+        dialect = self.__engine.dialect.name
+        if dialect in ("postgresql", "sqlite"):
+            dialect_insert = postgresql.insert if dialect == "postgresql" else sqlite.insert
+            statement = dialect_insert(table)
+            update_columns = {
+                column.name: statement.excluded[column.name]
+                for column in table.columns if column.name != "id"
+            }
+            session.execute(statement.on_conflict_do_update(
+                index_elements=["id"], set_=update_columns), rows)
+        else:
+            for row in rows:
+                session.merge(model(**row))
+
+    @_timed
     def get_messages(self) -> List[Message]:
         """Get list messages"""
         with self.__db_session() as session:
             messages = session.query(Message).all()
             return messages
 
+    @_timed
     def get_user_messages(self, user: User) -> List[Message]:
         """Get list users"""
         with self.__db_session() as session:
             messages = session.query(Message).filter(User.id == user.id).all()
             return messages
 
+    @_timed
     def get_user(self, user_id: str) -> User:
         """Get user"""
         with self.__db_session() as session:
             user = session.get(User, user_id)
             return user
 
+    @_timed
     def get_chat(self, chat_id: str) -> Chat:
         """Get chat"""
         with self.__db_session() as session:
@@ -1,11 +1,11 @@
 """Модуль, присылающий цитаты"""
 
-from typing import List
-import requests
+from typing import List, Optional
 import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from net.prefetch import PrefetchBuffer
 
 
 class AtomicExampleBotFunction(AtomicBotFunctionABC):
@@ -22,9 +22,12 @@ class AtomicExampleBotFunction(AtomicBotFunctionABC):
 
     bot: telebot.TeleBot
     example_keyboard_factory: CallbackData
+    quotes: PrefetchBuffer
 
     def set_handlers(self, bot: telebot.TeleBot):
         self.bot = bot
+        self.quotes = PrefetchBuffer(self.commands[0], self.get_quote)
+        self.quotes.start()
         self.example_keyboard_factory = CallbackData(
             't_key_button', prefix=self.commands[0]
         )
@@ -48,14 +51,14 @@ class AtomicExampleBotFunction(AtomicBotFunctionABC):
 
     def get_quotes(self, num_quotes: int) -> List[str]:
         """Получает цитаты из API Breaking Bad."""
-        quotes = []
-        for _ in range(num_quotes):
-            response = requests.get(
-                "https://api.breakingbadquotes.xyz/v1/quotes", timeout=10
-            )
-            if response.status_code == 200:
-                data = response.json()[0]
-                quote = data['quote']
-                author = data['author']
-                quotes.append(f"Цитата: {quote}\nАвтор: {author}")
-        return quotes
+        return self.quotes.take(num_quotes)
+
+    def get_quote(self) -> Optional[str]:
+        """Получает одну цитату из API Breaking Bad."""
+        response = self.http.get("https://api.breakingbadquotes.xyz/v1/quotes")
+        if response.status_code != 200:
+            return None
+        data = response.json()[0]
+        quote = data['quote']
+        author = data['author']
+        return f"Цитата: {quote}\nАвтор: {author}"
@@ -9,6 +9,8 @@ import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from net.api_quota import QuotaLimit, QuotaPolicy
+from net.response_cache import CachePolicy
 
 
 class AtomicCoinMarketFunction(AtomicBotFunctionABC):
@@ -31,6 +33,13 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
     # API configuration
     API_URL_BASE = "https://pro-api.coinmarketcap.com/v1/"
     SANDBOX_URL_BASE = "https://sandbox-api.coinmarketcap.com/v1/"
+    # Basic plan: 30 requests per minute and 10 000 credits per month,
+    # the sandbox key is used for development
+    QUOTA = QuotaPolicy("coinmarketcap", "COINMARKETCAP_API_KEY",
+        limits=(QuotaLimit(30, 60), QuotaLimit(10000, 30 * 86400)),
+        key_header="X-CMC_PRO_API_KEY", default_key="b54bcf4d-1bca-4e8e-9a24-22ff2c3d462c")
+    QUOTES_CACHE = CachePolicy(ttl=60)
+    INFO_CACHE = CachePolicy(ttl=86400)
 
     def set_handlers(self, bot: telebot.TeleBot):
         """Set message handlers"""
@@ -78,23 +87,11 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
                 logging.exception("Error processing callback: %s", ex)
                 bot.answer_callback_query(call.id, f"Ошибка: {str(ex)}")
 
-    def __get_api_key(self) -> str:
-        """Get CoinMarketCap API key from environment variables"""
-        api_key = os.environ.get("COINMARKETCAP_API_KEY")
-        if not api_key:
-            logging.warning("COINMARKETCAP_API_KEY not found in environment variables")
-            # Fallback to sandbox key for development
-            return "b54bcf4d-1bca-4e8e-9a24-22ff2c3d462c"
-        return api_key
-
     def __make_api_request(
-        self, endpoint: str, params: Dict[str, Any] = None
+        self, endpoint: str, params: Dict[str, Any] = None, cache: CachePolicy = None
     ) -> Dict[str, Any]:
-        """Make a request to the CoinMarketCap API"""
-        headers = {
-            "Accepts": "application/json",
-            "X-CMC_PRO_API_KEY": self.__get_api_key(),
-        }
+        """Make a request to the CoinMarketCap API with a key from the quota"""
+        headers = {"Accepts": "application/json"}
 
         # Use sandbox for development, production for real deployment
         use_sandbox = os.environ.get("USE_SANDBOX", "False").lower() == "true"
@@ -102,9 +99,9 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
         url = f"{base_url}{endpoint}"
 
         try:
-            response = requests.get(url, headers=headers, params=params, timeout=10)
-            response.raise_for_status()
-            return response.json()
+            # Identical concurrent requests share one call and the API credits it costs
+            return self.http.get_json(url, params=params, cache=cache or self.QUOTES_CACHE,
+                quota=self.QUOTA, headers=headers)
         except requests.exceptions.RequestException as e:
             logging.error("API request error: %s", e)
             raise RuntimeError(f"Ошибка API запроса: {str(e)}") from e
@@ -228,7 +225,9 @@ class AtomicCoinMarketFunction(AtomicBotFunctionABC):
     def __fetch_coin_data(self, coin_id: str):
         """Fetch coin data from API"""
         # Get coin metadata
-        metadata = self.__make_api_request("cryptocurrency/info", {"id": coin_id})
+        metadata = self.__make_api_request(
+            "cryptocurrency/info", {"id": coin_id}, cache=self.INFO_CACHE
+        )
 
         # Get coin quotes
         quotes = self.__make_api_request(
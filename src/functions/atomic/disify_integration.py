@@ -1,9 +1,12 @@
 """Module implementation of the atomic function of the telegram bot: DisifyIntegrationFunction"""
 
+import asyncio
 from typing import List
+import aiohttp
 import requests
 import telebot
 from telebot import types
+from telebot.async_telebot import AsyncTeleBot
 from bot_func_abc import AtomicBotFunctionABC
 
 class DisifyIntegrationFunction(AtomicBotFunctionABC):
@@ -36,20 +39,45 @@ class DisifyIntegrationFunction(AtomicBotFunctionABC):
             email = args[1]
 
             try:
-                response = requests.get(f"{self.API_URL}{email}", timeout=self.TIMEOUT)
+                response = self.http.get(f"{self.API_URL}{email}", timeout=self.TIMEOUT)
                 response.raise_for_status()
             except requests.RequestException as err:
                 status = getattr(err.response, "status_code", "N/A")
                 bot.send_message(message.chat.id, f"Ошибка запроса (код {status}).")
                 return
 
-            data = response.json()
+            bot.send_message(message.chat.id, self.__format_reply(response.json()))
 
-            reply = (
-                f"domain: {data.get('domain')}\n"
-                f"Format Valid: {data.get('format')}\n"
-                f"Alias: {data.get('alias')}\n"
-                f"Disposable: {data.get('disposable')}\n"
-                f"DNS Valid: {data.get('dns')}\n"
-            )
-            bot.send_message(message.chat.id, reply)
+    def set_async_handlers(self, bot: AsyncTeleBot):
+        """Set coroutine message handlers for Disify email verification command"""
+
+        @bot.message_handler(commands=self.commands)
+        async def disify_handler(message: types.Message):
+            args = message.text.strip().split()
+            if len(args) < 2:
+                await bot.send_message(message.chat.id, "Укажите email: `/disify test@example.com`")
+                return
+
+            email = args[1]
+
+            try:
+                response = await self.async_http.get(f"{self.API_URL}{email}")
+                response.raise_for_status()
+            except aiohttp.ClientResponseError as err:
+                await bot.send_message(message.chat.id, f"Ошибка запроса (код {err.status}).")
+                return
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                await bot.send_message(message.chat.id, "Ошибка запроса (код N/A).")
+                return
+
+            await bot.send_message(message.chat.id, self.__format_reply(response.json()))
+
+    @staticmethod
+    def __format_reply(data: dict) -> str:
+        return (
+            f"domain: {data.get('domain')}\n"
+            f"Format Valid: {data.get('format')}\n"
+            f"Alias: {data.get('alias')}\n"
+            f"Disposable: {data.get('disposable')}\n"
+            f"DNS Valid: {data.get('dns')}\n"
+        )
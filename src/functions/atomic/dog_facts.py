@@ -3,12 +3,14 @@
 """
 
 from typing import List
+import functools
 import logging
 import telebot
 import requests
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from net.fanout import fan_out
 
 
 
@@ -56,26 +58,10 @@ class DogFactBotFunction(AtomicBotFunctionABC):
                     self.bot.send_message(chat_id=message.chat.id, text="Неверный формат числа.")
                     return
 
-            all_facts = []
-            while len(all_facts) < num_facts:
-                try:
-                    response = requests.get(
-                        DogFactBotFunction.DOG_FACT_API_URL,
-                        params={'limit': min(num_facts - len(all_facts), 10)},
-                        timeout=5
-                    )
-
-                    if response.status_code == 200:
-                        facts_data = response.json()
-                        new_facts = facts_data['facts']
-                        all_facts.extend(new_facts)
-                    else:
-                        error_message = f"Статус-код: {response.status_code}.Текст: {response.text}"
-                        logging.error(error_message)
-                        break
-                except requests.exceptions.RequestException as e:
-                    logging.error("Произошла ошибка при запросе к API: %s", e)
-                    break
+            # Запрашиваем страницы по 10 фактов параллельно
+            pages = fan_out([functools.partial(self.get_facts, min(num_facts - offset, 10))
+                for offset in range(0, num_facts, 10)])
+            all_facts = [fact for page in pages for fact in page]
 
             # Убедимся, что мы собрали хотя бы одно сообщение
             if not all_facts:
@@ -89,6 +75,23 @@ class DogFactBotFunction(AtomicBotFunctionABC):
             )
             self.bot.send_message(chat_id=message.chat.id, text=msg)
 
+    def get_facts(self, limit: int) -> List[str]:
+        """
+        Получает страницу фактов о собаках.
+
+        :param limit: Количество фактов на странице, не больше 10.
+        :return: Список фактов, пустой при ошибке.
+        """
+        try:
+            response = self.http.get(DogFactBotFunction.DOG_FACT_API_URL, params={'limit': limit})
+            if response.status_code == 200:
+                return response.json()['facts']
+            error_message = f"Статус-код: {response.status_code}.Текст: {response.text}"
+            logging.error(error_message)
+        except requests.exceptions.RequestException as e:
+            logging.error("Произошла ошибка при запросе к API: %s", e)
+        return []
+
     def check_bot_state(self) -> bool:
         """
         Проверяет состояние бота перед выполнением основной функции.
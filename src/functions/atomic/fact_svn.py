@@ -1,11 +1,9 @@
 """Модуль с функцией для вывода случайных фактов с использованием API."""
 
-from typing import List
-import json
-import requests
-from requests.exceptions import RequestException
+from typing import Optional
 from telebot.types import Message
 from bot_func_abc import AtomicBotFunctionABC
+from net.prefetch import PrefetchBuffer
 
 
 class FactSvNFunction(AtomicBotFunctionABC):
@@ -18,30 +16,33 @@ class FactSvNFunction(AtomicBotFunctionABC):
     "фактов с внешнего API команда так же может выводить несколько фактов"
     state = True
 
+    facts: PrefetchBuffer
+
     def set_handlers(self, bot):
         """Устанавливает обработчики команд для бота."""
+        self.facts = PrefetchBuffer(self.commands[0], self.get_fact)
+        self.facts.start()
 
         @bot.message_handler(commands=self.commands)
         def handle_factsvn(message: Message):
             """Обработчик команды /factsvn."""
-            try:
-                arr = message.text.strip().split()
-                count = 1  # По умолчанию один факт
-                if len(arr) == 2 and arr[1].isdigit():
-                    count = int(arr[1])
-                    count = min(count, 10)  # ограничим до 10 фактов
-
-                facts: List[str] = []
-                for i in range(count):
-                    response = requests.get(
-                        "https://uselessfacts.jsph.pl/api/v2/facts/random?language=en", timeout=5
-                    )
-                    response.raise_for_status()
-                    fact = response.json().get("text", "Не удалось получить факт.")
-                    facts.append(f"{i + 1}. {fact}")
-
-                message_text = "💡 Did you know?\n\n" + "\n\n".join(facts)
-                bot.send_message(message.chat.id, message_text)
-
-            except (RequestException, json.JSONDecodeError) as e:
-                bot.send_message(message.chat.id, f"Произошла ошибка: {e}")
+            arr = message.text.strip().split()
+            count = 1  # По умолчанию один факт
+            if len(arr) == 2 and arr[1].isdigit():
+                count = int(arr[1])
+                count = min(count, 10)  # ограничим до 10 фактов
+
+            facts = self.facts.take(count)
+            if not facts:
+                bot.send_message(message.chat.id, "Не удалось получить факт.")
+                return
+
+            message_text = "💡 Did you know?\n\n" + "\n\n".join(
+                f"{i + 1}. {fact}" for i, fact in enumerate(facts))
+            bot.send_message(message.chat.id, message_text)
+
+    def get_fact(self) -> Optional[str]:
+        """Получает один случайный факт."""
+        response = self.http.get("https://uselessfacts.jsph.pl/api/v2/facts/random?language=en")
+        response.raise_for_status()
+        return response.json().get("text")
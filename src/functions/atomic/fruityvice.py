@@ -6,6 +6,7 @@ import requests
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from net.response_cache import CachePolicy
 
 class AtomicFruitBotFunction(AtomicBotFunctionABC):
     """Реализация функции бота для работы с вывода списка фруктов и
@@ -25,8 +26,9 @@ class AtomicFruitBotFunction(AtomicBotFunctionABC):
     bot: telebot.TeleBot
     fruit_keyboard_factory: CallbackData
 
+    FRUITS_CACHE = CachePolicy(ttl=24 * 3600, stale_ttl=24 * 3600)
+
     def __init__(self):
-        self.cache = {}
         self.api_url = "https://fruityvice.com/api/fruit"
 
     def set_handlers(self, bot: telebot.TeleBot):
@@ -76,9 +78,8 @@ class AtomicFruitBotFunction(AtomicBotFunctionABC):
     def get_all_fruits(self) -> str:
         """Получить список всех фруктов"""
         try:
-            response = requests.get(f"{self.api_url}/all", timeout=10)
-            response.raise_for_status()
-            fruits = response.json()
+            fruits = self.http.get_json_items(f"{self.api_url}/all", fields=("name",),
+                cache=self.FRUITS_CACHE)
             fruit_list = "\n".join([f"• {fruit['name']}" for fruit in fruits])
             return f"🍍 Доступные фрукты:\n{fruit_list}\n\n(показано {len(fruits)})"
         except requests.exceptions.RequestException as e:
@@ -88,9 +89,7 @@ class AtomicFruitBotFunction(AtomicBotFunctionABC):
     def get_fruit_info(self, name: str) -> str:
         """Получить информацию о конкретном фрукте"""
         try:
-            response = requests.get(f"{self.api_url}/{name.lower()}", timeout=10)
-            response.raise_for_status()
-            fruit = response.json()
+            fruit = self.http.get_json(f"{self.api_url}/{name.lower()}", cache=self.FRUITS_CACHE)
 
             nutritions = fruit.get('nutritions', {})
             info = (
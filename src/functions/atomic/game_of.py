@@ -98,14 +98,10 @@ class GameOfThronesQuotesBotFunction(AtomicBotFunctionABC):
             parse_mode="Markdown"
         )
 
-    @staticmethod
-    def __get_got_quote(slug: str) -> dict:
+    def __get_got_quote(self, slug: str) -> dict:
         """Get random quote for specific character"""
         try:
-            response = requests.get(
-                f"https://api.gameofthronesquotes.xyz/v1/author/{slug}/2",
-                timeout=5
-            )
+            response = self.http.get(f"https://api.gameofthronesquotes.xyz/v1/author/{slug}/2")
             response.raise_for_status()
             data = response.json()
             return data[0] if isinstance(data, list) and len(data) > 0 else None
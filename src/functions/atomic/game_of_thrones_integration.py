@@ -9,6 +9,7 @@ import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from net.response_cache import CachePolicy
 
 
 class IceAndFireFunction(AtomicBotFunctionABC):
@@ -26,6 +27,7 @@ class IceAndFireFunction(AtomicBotFunctionABC):
     BASE_URL = "https://anapioficeandfire.com/api/"
     TIMEOUT = 15
     PAGE_SIZE = 10
+    CHARACTERS_CACHE = CachePolicy(ttl=3600, stale_ttl=24 * 3600)
 
     bot: telebot.TeleBot
     characters_callback_factory: CallbackData
@@ -86,12 +88,12 @@ class IceAndFireFunction(AtomicBotFunctionABC):
     def send_characters_page(self, chat_id: int, page: int = 1, call=None):
         """Отправляет список персонажей с кнопками выбора и пагинацией."""
         try:
-            response = requests.get(
-                f"{self.BASE_URL}characters?page={page}&pageSize={self.PAGE_SIZE}",
+            characters = self.http.get_json(
+                f"{self.BASE_URL}characters",
+                params={"page": page, "pageSize": self.PAGE_SIZE},
+                cache=self.CHARACTERS_CACHE,
                 timeout=self.TIMEOUT
             )
-            response.raise_for_status()
-            characters = response.json()
         except requests.RequestException:
             logging.exception("Ошибка при получении списка персонажей")
             if call:
@@ -118,9 +120,7 @@ class IceAndFireFunction(AtomicBotFunctionABC):
         """Показывает информацию о выбранном персонаже."""
         url = f"{self.BASE_URL}characters/{char_id}"
         try:
-            response = requests.get(url, timeout=self.TIMEOUT)
-            response.raise_for_status()
-            character = response.json()
+            character = self.http.get_json(url, cache=self.CHARACTERS_CACHE, timeout=self.TIMEOUT)
         except requests.RequestException:
             logging.exception("Ошибка при получении информации о персонаже")
             self.bot.send_message(call.message.chat.id,
@@ -1,10 +1,10 @@
 """Module implement github API"""
 
 from typing import List
-import requests
 import telebot
 from telebot import types
 from bot_func_abc import AtomicBotFunctionABC
+from bot_sender import BotSender
 
 
 class GithubAPICommits(AtomicBotFunctionABC):
@@ -42,8 +42,8 @@ class GithubAPICommits(AtomicBotFunctionABC):
             else:
                 messeges = self.get_data()
 
-            for commit in messeges:
-                bot.send_message(text=commit, chat_id=message.chat.id)
+            if messeges:
+                BotSender.for_bot(bot).send_texts(message.chat.id, messeges)
 
     def get_data(self, count: int = 5):
         """Get data from githab """
@@ -53,7 +53,7 @@ class GithubAPICommits(AtomicBotFunctionABC):
         repo = "system-integration-bot-2"
         url = f'https://api.github.com/repos/{owner}/{repo}/commits?per_page={count}'
 
-        response = requests.get(url, timeout=30)
+        response = self.http.get(url)
 
         list_commits = []
         list_commits = response.json()
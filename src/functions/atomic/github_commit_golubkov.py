@@ -53,7 +53,7 @@ class IPLookupBotFunction(AtomicBotFunctionABC):
         url = f"http://api.ipstack.com/{ip_address}?access_key={api_key}"
 
         try:
-            response = requests.get(url, timeout=10)
+            response = self.http.get(url)
             response.raise_for_status()
             data = response.json()
 
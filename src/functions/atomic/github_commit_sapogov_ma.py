@@ -1,11 +1,16 @@
 """Модуль для работы с ISO-кодами стран и их административными единицами."""
 
-from typing import List
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, FrozenSet, Iterable, List, Optional, Tuple
 import requests
 import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from net.country_dataset import CountryDataset, Divisions
+from net.fanout import fan_out
+from net.response_cache import CachePolicy
 
 class CountryCodesBot(AtomicBotFunctionABC):
     """Класс для получения ISO-кодов стран и их административных единиц."""
@@ -20,64 +25,76 @@ class CountryCodesBot(AtomicBotFunctionABC):
 
     bot: telebot.TeleBot
     example_keyboard_factory: CallbackData
+    dataset: CountryDataset
+
+    COUNTRIES_URL = "https://restcountries.com/v3.1/all"
+    DIVISIONS_URL = "https://rawcdn.githack.com/kamikazechaser/administrative-divisions-db/"
+    COUNTRIES_CACHE = CachePolicy(ttl=24 * 3600, stale_ttl=7 * 24 * 3600)
+    DATASET_DEADLINE = 120
+    DATASET_WORKERS = 2
 
     def set_handlers(self, bot: telebot.TeleBot):
         """Устанавливает обработчики событий для бота."""
         self.bot = bot
+        # Локальная копия кодов и адм.ед., пока её нет, данные запрашиваются у API
+        self.dataset = CountryDataset(self.__load_dataset)
+        self.dataset.refresh_if_stale()
 
         @bot.message_handler(commands=self.commands)  # Use self.commands here
         def handle_countries_command(message: types.Message):
             """Обрабатывает команду получения списка стран."""
+            self.dataset.refresh_if_stale()
             iso_country_codes = self.get_iso_country_codes()
             text = '\n'.join(iso_country_codes)
 
             bot.reply_to(message, f"Вот ISO-коды стран:\n{text}\n\nВведите код страны:")
-            bot.register_next_step_handler(message, handle_user_input)
-
-        def handle_user_input(message: types.Message):
-            """Обрабатывает ввод кода страны от пользователя."""
-            country_code = message.text.strip().upper()
-
-            if country_code in self.get_iso_country_codes():
-                administrative_divisions = self.get_administrative_divisions(country_code)
-
-                if administrative_divisions:
-                    text = '\n'.join(administrative_divisions)
-                    bot.reply_to(message, f"Адм.ед. для страны с кодом {country_code}:\n{text}")
-                else:
-                    bot.reply_to(message, f"Не найти адм.ед. для страны с кодом {country_code}")
+            bot.register_next_step_handler(message, self.__handle_user_input)
+
+    def __handle_user_input(self, message: types.Message):
+        """Обрабатывает ввод кода страны от пользователя."""
+        country_code = message.text.strip().upper()
+        if self.dataset.is_ready():
+            known = self.dataset.has_country(country_code)
+        else:
+            known = country_code in self.get_iso_country_codes()
+
+        if known:
+            administrative_divisions = self.get_administrative_divisions(country_code)
+
+            if administrative_divisions:
+                text = '\n'.join(administrative_divisions)
+                self.bot.reply_to(message, f"Адм.ед. для страны с кодом {country_code}:\n{text}")
             else:
-                bot.reply_to(message, f"Код страны {country_code} не найден в доступных ISO")
+                self.bot.reply_to(message, f"Не найти адм.ед. для страны с кодом {country_code}")
+        else:
+            self.bot.reply_to(message, f"Код страны {country_code} не найден в доступных ISO")
 
     def get_iso_country_codes(self):
         """Получает список ISO-кодов стран."""
-        url = "https://restcountries.com/v3.1/all"
-        response = requests.get(url, timeout=10)  # Добавлен таймаут
-
-        if response.status_code == 200:
-            countries_data = response.json()
-            country_codes = []
+        if self.dataset.is_ready():
+            return list(self.dataset.get_codes())
+        try:
+            countries_data = self.__fetch_countries(self.COUNTRIES_CACHE)
+        except (requests.exceptions.RequestException, ValueError):
+            print("Ошибка при получении данных")
+            return []  # Возвращаем пустой список в случае ошибки
 
-            for country in countries_data:
-                if 'cca2' in country:
-                    country_codes.append(country['cca2'])
+        country_codes = []
+        for country in countries_data:
+            if 'cca2' in country:
+                country_codes.append(country['cca2'])
 
-            return country_codes
-        print("Ошибка при получении данных")
-        return []  # Возвращаем пустой список в случае ошибки
+        return country_codes
 
     def get_administrative_divisions(self, country_code):
         """Получает административные единицы страны по её коду."""
-        url_part1 = "https://rawcdn.githack.com/kamikazechaser/administrative-divisions-db/"
-        url_part2 = f"master/api/{country_code}.json"
-
-        # Соединяем части обратно
-        url = url_part1 + url_part2
+        divisions = self.dataset.get_divisions(country_code)
+        if divisions is not None:
+            return list(divisions)
+        url = f"{self.DIVISIONS_URL}master/api/{country_code}.json"
 
         try:
-            response = requests.get(url, timeout=10)  # Добавлен таймаут
-            response.raise_for_status()
-            divisions = response.json()
+            divisions = self.http.get_json_items(url, cache=self.COUNTRIES_CACHE)
             return divisions
         except requests.exceptions.HTTPError as err:
             print(f"Произошла ошибка HTTP: {err}")
@@ -85,3 +102,30 @@ class CountryCodesBot(AtomicBotFunctionABC):
         except requests.exceptions.Timeout as timeout_err:
             print(f"Время ожидания истекло: {timeout_err}")
         return []  # Return an empty list on timeout error
+
+    def __fetch_countries(self, cache: Optional[CachePolicy] = None) -> List[Dict[str, str]]:
+        """Запрашивает только cca2 и разбирает массив по одной стране"""
+        return self.http.get_json_items(self.COUNTRIES_URL, params={"fields": "cca2"},
+            fields=("cca2",), cache=cache)
+
+    def __fetch_divisions(self, country_code: str) -> Tuple[str, List[str]]:
+        """Запрашивает адм.ед. страны, у стран без них ответ 404"""
+        url = f"{self.DIVISIONS_URL}master/api/{country_code}.json"
+        try:
+            return country_code, self.http.get_json_items(url)
+        except requests.exceptions.HTTPError as err:
+            if err.response is not None and err.response.status_code == 404:
+                return country_code, []
+            raise
+
+    def __load_dataset(self, codes: Optional[FrozenSet[str]]) -> Divisions:
+        """Загружает адм.ед. стран с кодами для локальной копии, всех стран без кодов.
+        Запросы идут в своих DATASET_WORKERS потоках, не занимая общий пул и лимит хоста.
+        Для стран, которые не удалось загрузить, возвращается None"""
+        codes_to_load: Iterable[str] = codes if codes is not None else [
+            country["cca2"] for country in self.__fetch_countries() if "cca2" in country]
+        calls = [functools.partial(self.__fetch_divisions, code) for code in codes_to_load]
+        with ThreadPoolExecutor(max_workers=self.DATASET_WORKERS,
+            thread_name_prefix="CountryDataset") as executor:
+            loaded: Dict[str, List[str]] = dict(fan_out(calls, self.DATASET_DEADLINE, executor))
+        return {code: loaded.get(code) for code in codes_to_load}
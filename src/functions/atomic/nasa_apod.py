@@ -1,13 +1,14 @@
 """Module implementation of the atomic function for NASA's 
 Astronomy Picture of the Day (APOD) API and Earth API."""
 
-import os
 import logging
 from typing import List, Dict, Any, Optional
 import requests
 import telebot
 from telebot import types
 from bot_func_abc import AtomicBotFunctionABC
+from net.api_quota import QuotaLimit, QuotaPolicy
+from net.response_cache import CachePolicy
 
 
 class AtomicNasaApodFunction(AtomicBotFunctionABC):
@@ -25,6 +26,11 @@ class AtomicNasaApodFunction(AtomicBotFunctionABC):
     # API configuration
     APOD_API_URL = "https://api.nasa.gov/planetary/apod"
     EARTH_API_URL = "https://api.nasa.gov/planetary/earth/imagery"
+    TODAY_APOD_CACHE = CachePolicy(ttl=1800, stale_ttl=1800)
+    # 1000 requests per hour with a key, DEMO_KEY allows 30 per hour and 50 per day
+    QUOTA = QuotaPolicy("nasa", "NASA_API_KEY", limits=(QuotaLimit(1000, 3600),),
+        key_param="api_key", default_key="DEMO_KEY",
+        default_limits=(QuotaLimit(30, 3600), QuotaLimit(50, 86400)))
     def __init__(self):
         self.bot = None
         self.logger = logging.getLogger(__name__)
@@ -92,26 +98,15 @@ class AtomicNasaApodFunction(AtomicBotFunctionABC):
                 self.logger.critical("Неожиданная ошибка при обработке команды Earth: %s", ex)
                 bot.reply_to(message, "Произошла ошибка. Координаты стран СНГ не поддерживаются.")
 
-    def __get_api_key(self) -> str:
-        """Get NASA API key from environment variables"""
-        api_key = os.environ.get("NASA_API_KEY")
-        if not api_key:
-            self.logger.warning("NASA_API_KEY не найден в переменных окружения")
-            # Fallback to demo key for development
-            return "DEMO_KEY"
-        return api_key
-
-    def __make_api_request(self, url: str, params: Optional[Dict[str, Any]] = None) -> Any:
-        """Make a request to NASA APIs"""
-        if params is None:
-            params = {}
-
-        # Always include the API key
-        params["api_key"] = self.__get_api_key()
-
+    def __make_api_request(self, url: str, params: Optional[Dict[str, Any]] = None,
+    cache: Optional[CachePolicy] = None) -> Any:
+        """Make a request to NASA APIs with a key from the quota.
+        Only JSON responses can be cached"""
         try:
             self.logger.debug("Запрос к NASA API: %s с параметрами %s", url, params)
-            response = requests.get(url, params=params, timeout=10)
+            if cache is not None:
+                return self.http.get_json(url, params=params, cache=cache, quota=self.QUOTA)
+            response = self.http.get(url, params=params, quota=self.QUOTA)
             response.raise_for_status()
             # Check if response is JSON or binary data
             content_type = response.headers.get('Content-Type', '')
@@ -129,7 +124,7 @@ class AtomicNasaApodFunction(AtomicBotFunctionABC):
         self.bot.send_message(chat_id, "Получаю астрономическое фото дня...")
 
         try:
-            data = self.__make_api_request(self.APOD_API_URL)
+            data = self.__make_api_request(self.APOD_API_URL, cache=self.TODAY_APOD_CACHE)
             self.__send_apod_data(chat_id, data)
         except (telebot.apihelper.ApiException, KeyError, ValueError) as ex:
             logging.exception("Ошибка при обработке данных: %s", ex)
@@ -3,7 +3,6 @@
 from typing import List
 import telebot
 from telebot import types
-import requests
 from bot_func_abc import AtomicBotFunctionABC
 
 class OpenLibraryBotFunction(AtomicBotFunctionABC):
@@ -27,7 +26,7 @@ class OpenLibraryBotFunction(AtomicBotFunctionABC):
             name = "+".join(message.text.replace(" ", "+").split("+")[1:])
             req = ("https://openlibrary.org/search.json?q=" + name +
                    "&page=1&limit=1&mode=everything")
-            r = requests.get(url=req, timeout=5)
+            r = self.http.get(url=req)
             bookdata = r.json()
             reply = (f"Автор: {bookdata['docs'][0]['author_name'][0]}, \nГод издания: "
                      f"{bookdata['docs'][0]['first_publish_year']}, "
@@ -41,12 +40,12 @@ class OpenLibraryBotFunction(AtomicBotFunctionABC):
             print(name)
             req = ("https://openlibrary.org/search/authors.json?q=" +
                    name + "&page=1&limit=3&mode=everything")
-            r = requests.get(url=req, timeout=5)
+            r = self.http.get(url=req)
             bookdata = r.json()
             print(bookdata)
-            r = requests.get(
+            r = self.http.get(
                 f"https://openlibrary.org/authors/{str(dict(bookdata)['docs'][0]['key'])}/"
-                f"works.json?limit=3", timeout=5)
+                f"works.json?limit=3")
             print(r.json())
             reply = f"Автор: {bookdata['docs'][0]['name']}\nПопулярные работы:\n"
             c = 1
@@ -8,6 +8,8 @@ import requests
 import telebot
 from telebot import types
 from bot_func_abc import AtomicBotFunctionABC
+from bot_sender import BotSender
+from net.prefetch import PrefetchBuffer
 
 class AtomicRandomDuckBotFunction(AtomicBotFunctionABC):
 
@@ -27,10 +29,13 @@ class AtomicRandomDuckBotFunction(AtomicBotFunctionABC):
 
     def __init__(self):
         self.bot = None
+        self.images = None
 
     def set_handlers(self, bot: telebot.TeleBot):
         """Set message handlers"""
         self.bot = bot
+        self.images = PrefetchBuffer(self.commands[0], self._get_random_duck_image)
+        self.images.start()
 
         @bot.message_handler(commands=self.commands)
         def handle_commands(message: types.Message):
@@ -62,16 +67,17 @@ class AtomicRandomDuckBotFunction(AtomicBotFunctionABC):
             self.bot.send_message(message.chat.id,
                                   f"Не удалось получить {'изо-ние' if count == 1 else 'изо-ния'}.")
             return
-        for img in images:
-            self.bot.send_photo(message.chat.id, img)
+        BotSender.for_bot(self.bot).send_photos(message.chat.id, images)
 
     def _get_random_duck_images(self, count=1, extension=None):
+        if extension is None:
+            return list(dict.fromkeys(self.images.take(count)))
         images = []
         for _ in range(count * 7):
             if len(images) >= count:
                 break
             try:
-                response = requests.get("https://random-d.uk/api/v2/random", timeout=5)
+                response = self.http.get("https://random-d.uk/api/v2/random")
                 response.raise_for_status()
                 img_url = response.json().get("url")
                 if not isinstance(img_url, str):
@@ -83,3 +89,9 @@ class AtomicRandomDuckBotFunction(AtomicBotFunctionABC):
             except (requests.exceptions.RequestException, ValueError) as ex:
                 logging.warning("Failed to fetch duck image: %s", ex)
         return images
+
+    def _get_random_duck_image(self):
+        response = self.http.get("https://random-d.uk/api/v2/random")
+        response.raise_for_status()
+        img_url = response.json().get("url")
+        return img_url if isinstance(img_url, str) and img_url else None
@@ -1,12 +1,12 @@
 """Модуль для реализации функции бота для получения случайных картинок собак."""
 
-import logging
-from typing import List
-import requests
+from typing import List, Optional
 import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from bot_sender import BotSender
+from net.prefetch import PrefetchBuffer
 
 
 class AtomicRandomDogBotFunction(AtomicBotFunctionABC):
@@ -22,11 +22,14 @@ class AtomicRandomDogBotFunction(AtomicBotFunctionABC):
 
     bot: telebot.TeleBot
     dog_keyboard_factory: CallbackData
+    images: PrefetchBuffer
 
     def set_handlers(self, bot: telebot.TeleBot):
         """Set message handlers"""
         self.bot = bot
         self.dog_keyboard_factory = CallbackData('dog_button', prefix=self.commands[0])
+        self.images = PrefetchBuffer(self.commands[0], self.__get_random_dog_image)
+        self.images.start()
 
         self.bot.message_handler(commands=self.commands)(self.random_dog_message_handler)
 
@@ -40,8 +43,7 @@ class AtomicRandomDogBotFunction(AtomicBotFunctionABC):
         """Helper method to send dog images based on the button pressed."""
         count = int(dog_button)
         images = self.__get_random_dog_images(count)
-        for img in images:
-            self.bot.send_photo(chat_id=message.chat.id, photo=img)
+        BotSender.for_bot(self.bot).send_photos(message.chat.id, images)
 
     def random_dog_message_handler(self, message: types.Message):
         """Handler for random dog message commands."""
@@ -49,23 +51,17 @@ class AtomicRandomDogBotFunction(AtomicBotFunctionABC):
         self.bot.send_message(chat_id=message.chat.id, text="Choose qty pic:", reply_markup=markup)
 
     def __get_random_dog_images(self, count=1):
-        """Fetches a given number of random dog images from Random Dog API."""
+        """Gets a given number of random dog images, prefetched in the background."""
+        return self.images.take(count)
+
+    def __get_random_dog_image(self) -> Optional[str]:
+        """Fetches a random dog image from Random Dog API, None if it is not a picture."""
         image_extensions = ('jpg', 'jpeg', 'png', 'gif')
-        images = []
-        attempts = 0
-        while len(images) < count and attempts < count * 2:
-            try:
-                response = requests.get("https://random.dog/woof.json", timeout=5)
-                img_url = response.json().get("url")
-                if not isinstance(img_url, str) or not img_url.endswith(image_extensions):
-                    attempts += 1
-                    continue
-                images.append(img_url)
-                attempts += 1
-            except (requests.exceptions.RequestException, ValueError) as ex:
-                logging.exception(ex)
-                attempts += 1
-        return images
+        response = self.http.get("https://random.dog/woof.json")
+        img_url = response.json().get("url")
+        if not isinstance(img_url, str) or not img_url.endswith(image_extensions):
+            return None
+        return img_url
 
     def __gen_markup(self):
         markup = types.InlineKeyboardMarkup()
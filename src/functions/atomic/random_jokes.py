@@ -10,6 +10,9 @@ import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from bot_sender import BotSender
+from net.response_cache import CachePolicy
+from net.prefetch import PrefetchBuffer
 
 
 class AtomicRandomJokeBotFunction(AtomicBotFunctionABC):
@@ -30,15 +33,20 @@ class AtomicRandomJokeBotFunction(AtomicBotFunctionABC):
                    """
     state = True
     BASE_URL = "https://official-joke-api.appspot.com"
+    TYPES_CACHE = CachePolicy(ttl=24 * 3600, stale_ttl=24 * 3600)
+    JOKE_CACHE = CachePolicy(ttl=24 * 3600)
 
     def __init__(self):
         self.bot = None
         self.joke_type_keyboard_factory = None
+        self.random_jokes = None
 
     def set_handlers(self, bot: telebot.TeleBot):
         """Set message handlers"""
         self.bot = bot
         self.joke_type_keyboard_factory = CallbackData('joke_type', prefix='joke')
+        self.random_jokes = PrefetchBuffer(self.commands[0], self._fetch_random_joke)
+        self.random_jokes.start()
 
         @bot.message_handler(commands=self.commands)
         def handle_commands(message: types.Message):
@@ -128,8 +136,9 @@ class AtomicRandomJokeBotFunction(AtomicBotFunctionABC):
             if 1 <= count <= 5:
                 jokes = self._get_multiple_jokes(count)
                 if jokes:
-                    for joke in jokes:
-                        self._format_and_send_joke(message.chat.id, joke)
+                    BotSender.for_bot(self.bot).send_texts(
+                        message.chat.id, [self._format_joke(joke) for joke in jokes],
+                        parse_mode='Markdown')
                 else:
                     self.bot.send_message(message.chat.id, "Не удалось получить шутки.")
             else:
@@ -139,29 +148,32 @@ class AtomicRandomJokeBotFunction(AtomicBotFunctionABC):
 
     def _format_and_send_joke(self, chat_id: int, joke: Dict[str, Any]):
         """Форматирует и отправляет шутку в чат."""
+        self.bot.send_message(chat_id, self._format_joke(joke), parse_mode='Markdown')
+
+    def _format_joke(self, joke: Dict[str, Any]) -> str:
+        """Форматирует шутку для отправки."""
         joke_text = f"*{joke.get('setup', '')}*\n\n{joke.get('punchline', '')}"
         joke_type = joke.get('type', 'unknown').capitalize()
         joke_id = joke.get('id', 'unknown')
         # Добавляем информацию о типе и ID шутки
         joke_info = f"\n\nТип шутки: {joke_type}\nID шутки: {joke_id}"
-        self.bot.send_message(chat_id, joke_text + joke_info, parse_mode='Markdown')
+        return joke_text + joke_info
 
     def _get_random_joke(self) -> Optional[Dict[str, Any]]:
-        """Получает одну случайную шутку."""
-        try:
-            response = requests.get(f"{self.BASE_URL}/random_joke", timeout=5)
-            response.raise_for_status()
-            return response.json()
-        except (requests.exceptions.RequestException, ValueError) as ex:
-            logging.warning("Failed to fetch random joke: %s", ex)
-            return None
+        """Получает одну случайную шутку из заранее загруженных."""
+        jokes = self.random_jokes.take(1)
+        return jokes[0] if jokes else None
+
+    def _fetch_random_joke(self) -> Dict[str, Any]:
+        """Загружает одну случайную шутку."""
+        response = self.http.get(f"{self.BASE_URL}/random_joke")
+        response.raise_for_status()
+        return response.json()
 
     def _get_joke_types(self) -> List[str]:
         """Получает список доступных типов шуток."""
         try:
-            response = requests.get(f"{self.BASE_URL}/types", timeout=5)
-            response.raise_for_status()
-            return response.json()
+            return self.http.get_json(f"{self.BASE_URL}/types", cache=self.TYPES_CACHE)
         except (requests.exceptions.RequestException, ValueError) as ex:
             logging.warning("Failed to fetch joke types: %s", ex)
             return []
@@ -169,7 +181,7 @@ class AtomicRandomJokeBotFunction(AtomicBotFunctionABC):
     def _get_joke_by_type(self, joke_type: str) -> Optional[Dict[str, Any]]:
         """Получает случайную шутку указанного типа."""
         try:
-            response = requests.get(f"{self.BASE_URL}/jokes/{joke_type}/random", timeout=5)
+            response = self.http.get(f"{self.BASE_URL}/jokes/{joke_type}/random")
             response.raise_for_status()
             jokes = response.json()
             # API возвращает список из одной шутки
@@ -181,9 +193,7 @@ class AtomicRandomJokeBotFunction(AtomicBotFunctionABC):
     def _get_joke_by_id(self, joke_id: int) -> Optional[Dict[str, Any]]:
         """Получает шутку по ID."""
         try:
-            response = requests.get(f"{self.BASE_URL}/jokes/{joke_id}", timeout=5)
-            response.raise_for_status()
-            return response.json()
+            return self.http.get_json(f"{self.BASE_URL}/jokes/{joke_id}", cache=self.JOKE_CACHE)
         except (requests.exceptions.RequestException, ValueError) as ex:
             logging.warning("Failed to fetch joke by ID %s: %s", joke_id, ex)
             return None
@@ -195,10 +205,10 @@ class AtomicRandomJokeBotFunction(AtomicBotFunctionABC):
                 return []
             if count == 10:
                 # Существует отдельный эндпоинт для 10 шуток
-                response = requests.get(f"{self.BASE_URL}/random_ten", timeout=5)
+                response = self.http.get(f"{self.BASE_URL}/random_ten")
             else:
                 # Для произвольного количества шуток
-                response = requests.get(f"{self.BASE_URL}/jokes/random/{count}", timeout=5)
+                response = self.http.get(f"{self.BASE_URL}/jokes/random/{count}")
             response.raise_for_status()
             return response.json()
         except (requests.exceptions.RequestException, ValueError) as ex:
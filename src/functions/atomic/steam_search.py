@@ -8,6 +8,7 @@ import requests
 from telebot import TeleBot, types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from bot_sender import BotSender
 
 class GameDealsFunction(AtomicBotFunctionABC):
     """Функция для поиска игровых сделок с использованием CheapShark API."""
@@ -99,7 +100,7 @@ class GameDealsFunction(AtomicBotFunctionABC):
             params['title'] = title
 
         try:
-            response = requests.get(url, params=params, timeout=10)
+            response = self.http.get(url, params=params)
             response.raise_for_status()
             return response.json()
         except requests.exceptions.RequestException as e:
@@ -113,11 +114,11 @@ class GameDealsFunction(AtomicBotFunctionABC):
             self.bot.send_message(chat_id, "Не найдено никаких сделок.")
             return
 
-        for deal in deals[:5]:  # Ограничиваем вывод первых 5 сделок
-            self.bot.send_message(
-                chat_id,
-                f"Название: {deal['title']}\n"
-                f"Цена: ${deal['salePrice']} (обычная: ${deal['normalPrice']})\n"
-                f"Скидка: {deal['savings']}%\n"
-                f"Ссылка: https://www.cheapshark.com/redirect?dealID={deal['dealID']}"
-            )
+        # Ограничиваем вывод первых 5 сделок и отправляем их одним сообщением
+        BotSender.for_bot(self.bot).send_texts(chat_id, [
+            f"Название: {deal['title']}\n"
+            f"Цена: ${deal['salePrice']} (обычная: ${deal['normalPrice']})\n"
+            f"Скидка: {deal['savings']}%\n"
+            f"Ссылка: https://www.cheapshark.com/redirect?dealID={deal['dealID']}"
+            for deal in deals[:5]
+        ])
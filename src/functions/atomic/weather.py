@@ -3,10 +3,11 @@
 в указанном городе через Telegram-бот с использованием API OpenWeatherMap.
 """
 
-import os
 import requests
 import telebot
 from bot_func_abc import AtomicBotFunctionABC
+from net.api_quota import QuotaLimit, QuotaPolicy
+from net.response_cache import CachePolicy
 
 class WeatherBotFunction(AtomicBotFunctionABC):
     """Модуль для получения текущей погоды через Telegram-бота."""
@@ -20,8 +21,14 @@ class WeatherBotFunction(AtomicBotFunctionABC):
     )
     state = True
 
+    # Бесплатный тариф: 60 запросов в минуту и 1 000 000 в месяц
+    QUOTA = QuotaPolicy("openweathermap", "OPENWEATHER_API_KEY",
+        limits=(QuotaLimit(60, 60), QuotaLimit(1000000, 30 * 86400)),
+        key_param="appid", default_key="dummy_key")
+    # Данные OpenWeatherMap обновляются раз в 10 минут
+    WEATHER_CACHE = CachePolicy(ttl=600)
+
     def __init__(self):
-        self.api_key = os.getenv("OPENWEATHER_API_KEY", "dummy_key")
         self.api_url = "http://api.openweathermap.org/data/2.5/weather"
 
     def set_handlers(self, bot: telebot.TeleBot):
@@ -46,14 +53,12 @@ class WeatherBotFunction(AtomicBotFunctionABC):
         """Получение данных о погоде из API OpenWeatherMap."""
         params = {
             "q": city,
-            "appid": self.api_key,
             "units": "metric",
             "lang": "ru"
         }
         try:
-            response = requests.get(self.api_url, params=params, timeout=10)
-            response.raise_for_status()
-            data = response.json()
+            data = self.http.get_json(self.api_url, params=params,
+                cache=self.WEATHER_CACHE, quota=self.QUOTA)
 
             if data.get("cod") != 200:
                 return None
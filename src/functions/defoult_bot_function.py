@@ -1,10 +1,26 @@
 """Default Bot Functions."""
 
-from typing import List
+import dataclasses
+from typing import Dict, List, Optional, Tuple
 import telebot
 from telebot import types
 from telebot.callback_data import CallbackData
 from bot_func_abc import AtomicBotFunctionABC
+from net.circuit_breaker import get_circuit_breakers
+
+@dataclasses.dataclass(frozen=True)
+class FunctionCatalog:
+    """Start menu lines and catalog pages rendered once.
+    Keyboards are kept as JSON, the form they are sent in"""
+    menu_lines: Tuple[str, ...]
+    menu_markup: str
+    pages: Tuple[Tuple[str, Optional[str]], ...]
+    function_pages: Tuple[int, ...]
+
+    def render_menu(self, available: Tuple[bool, ...]) -> str:
+        """Get the start menu of the available functions"""
+        lines = [line for line, ok in zip(self.menu_lines, available) if ok]
+        return "Доступные функции: \n" + "".join(lines)
 
 class DefoultBotFunction(AtomicBotFunctionABC):
     """Bot default functions. To display information about the connected functions"""
@@ -18,12 +34,19 @@ class DefoultBotFunction(AtomicBotFunctionABC):
     bot: telebot.TeleBot
     atom_functions_list: List[AtomicBotFunctionABC]
 
+    PAGE_SIZE = 5
+    MAX_PAGE_LENGTH = 4000
+    MENU_CACHE_SIZE = 64
+
     def __init__(self, start_comands: List[str], functions_list: List[AtomicBotFunctionABC]):
         self.commands = start_comands
         self.atom_functions_list = functions_list
         self.app_part = "app_key_button"
         self.keyboard_factory = CallbackData(self.app_part, "func_index", prefix=self.commands[0])
         self.button_data = "description"
+        # The catalog and the menus rendered from it are replaced together
+        self.__catalog: Tuple[FunctionCatalog, Dict[Tuple[bool, ...], str]] = \
+            (self.build_catalog(), {})
 
     def set_handlers(self, bot: telebot.TeleBot):
         """Set message handlers"""
@@ -31,16 +54,10 @@ class DefoultBotFunction(AtomicBotFunctionABC):
         self.bot = bot
         @self.bot.message_handler(commands=self.commands)
         def start_message(message):
-            txt = "Доступные функции: \n"
-            for funct in self.atom_functions_list:
-                txt += f"/{funct.commands[0]} - {funct.about} \n"
-
-            description_callback_data = self.keyboard_factory.new(
-                app_key_button=self.button_data,
-                func_index=0
-            )
-            reply_markup=self.__gen_markup_button("Description", description_callback_data)
-            self.bot.send_message(text=txt, chat_id=message.chat.id, reply_markup=reply_markup)
+            unhealthy = get_circuit_breakers().get_unhealthy_owners()
+            available = tuple(funct.is_available(unhealthy) for funct in self.atom_functions_list)
+            self.bot.send_message(text=self.get_menu(available), chat_id=message.chat.id,
+                reply_markup=self.catalog.menu_markup)
 
         @self.bot.callback_query_handler(func=None, config=self.keyboard_factory.filter())
         def example_keyboard_callback(call: types.CallbackQuery):
@@ -49,7 +66,9 @@ class DefoultBotFunction(AtomicBotFunctionABC):
             func_index = callback_data["func_index"]
             match (button):
                 case (self.button_data):
-                    self.__send_description_messages(call, func_index)
+                    self.__send_catalog_page(call, func_index)
+                case "catalog":
+                    self.__edit_catalog_page(call, func_index)
                 case _:
                     self.bot.answer_callback_query(call.id, call.data)
 
@@ -60,32 +79,87 @@ class DefoultBotFunction(AtomicBotFunctionABC):
             msg = f"To begin, enter one of the commands \n /{cmds}"
             self.bot.send_message(text=msg, chat_id=message.chat.id)
 
-    def __gen_markup_button(self, text: str, callback_data: str):
+    @property
+    def catalog(self) -> FunctionCatalog:
+        """Start menu lines and catalog pages of the functions"""
+        return self.__catalog[0]
+
+    def set_catalog(self, catalog: FunctionCatalog):
+        """Replace the catalog, menus of the previous catalog are dropped"""
+        self.__catalog = (catalog, {})
+
+    def get_menu(self, available: Tuple[bool, ...]) -> str:
+        """Get the start menu of the available functions, menus are rendered once
+        for the same available functions"""
+        catalog, menus = self.__catalog
+        menu = menus.get(available)
+        if menu is None:
+            menu = catalog.render_menu(available)
+            if len(menus) >= self.MENU_CACHE_SIZE:
+                menus.clear()
+            menus[available] = menu
+        return menu
+
+    def build_catalog(self) -> FunctionCatalog:
+        """Render the start menu and the catalog pages of the functions.
+        Call it again and pass the result to set_catalog when the list of functions changes"""
+        menu_lines = tuple(f"/{funct.commands[0]} - {funct.about} \n"
+            for funct in self.atom_functions_list)
+        menu_markup = self.__gen_markup([("Description", self.button_data, 0)])
+        page_texts: List[List[str]] = []
+        function_pages: List[int] = []
+        for funct in self.atom_functions_list:
+            txt = self.__get_atomic_function_description(funct)
+            page = page_texts[-1] if page_texts else None
+            if page is None or len(page) >= self.PAGE_SIZE \
+                or sum(map(len, page)) + len(txt) > self.MAX_PAGE_LENGTH:
+                page = []
+                page_texts.append(page)
+            page.append(txt)
+            function_pages.append(len(page_texts) - 1)
+        pages = []
+        for index, texts in enumerate(page_texts):
+            buttons = []
+            if index > 0:
+                buttons.append(("<- Prev", "catalog", index - 1))
+            if index + 1 < len(page_texts):
+                buttons.append(("Next ->", "catalog", index + 1))
+            footer = f"Страница {index + 1} из {len(page_texts)}"
+            pages.append(("\n\n".join(texts) + "\n\n" + footer,
+                self.__gen_markup(buttons) if buttons else None))
+        return FunctionCatalog(menu_lines, menu_markup, tuple(pages), tuple(function_pages))
+
+    def __gen_markup(self, buttons: List[Tuple[str, str, int]]) -> str:
+        """Get a keyboard with buttons in one row as JSON"""
         markup = types.InlineKeyboardMarkup()
-        markup.row_width = 1
-        markup.add(
-            types.InlineKeyboardButton(text, callback_data=callback_data)
-        )
-        return markup
-
-    def __send_description_messages(self, call: types.CallbackQuery, digit: str):
-        func_index = 0
-        if digit.isdigit():
-            func_index = int(digit)
-        funct = self.atom_functions_list[func_index]
-        txt = self.__get_atomic_function_description(funct)
-        next_index = func_index + 1
-        if next_index < len(self.atom_functions_list):
-            button_data = self.button_data
-            description_callback_data = self.keyboard_factory.new(
-                app_key_button=button_data,
-                func_index=next_index
-            )
-            reply_markup=self.__gen_markup_button("Next ->", description_callback_data)
-            self.bot.send_message(text=txt, chat_id=call.message.chat.id,
+        markup.row(*[types.InlineKeyboardButton(text, callback_data=self.keyboard_factory.new(
+                app_key_button=button, func_index=index))
+            for text, button, index in buttons])
+        return markup.to_json()
+
+    def __send_catalog_page(self, call: types.CallbackQuery, digit: str):
+        """Send the catalog page with the function as a new message"""
+        catalog = self.catalog
+        func_index = int(digit) if digit.isdigit() else 0
+        if func_index >= len(catalog.function_pages):
+            func_index = 0
+        self.bot.answer_callback_query(call.id)
+        if not catalog.pages:
+            return
+        txt, reply_markup = catalog.pages[catalog.function_pages[func_index]]
+        self.bot.send_message(text=txt, chat_id=call.message.chat.id,
             reply_markup=reply_markup, parse_mode="Markdown")
-        else:
-            self.bot.send_message(text=txt, chat_id=call.message.chat.id, parse_mode="Markdown")
+
+    def __edit_catalog_page(self, call: types.CallbackQuery, digit: str):
+        """Show another catalog page in the same message"""
+        pages = self.catalog.pages
+        page_index = int(digit) if digit.isdigit() else 0
+        self.bot.answer_callback_query(call.id)
+        if page_index >= len(pages):
+            return
+        txt, reply_markup = pages[page_index]
+        self.bot.edit_message_text(text=txt, chat_id=call.message.chat.id,
+            message_id=call.message.message_id, reply_markup=reply_markup, parse_mode="Markdown")
 
     def __get_atomic_function_description(self, funct: AtomicBotFunctionABC) -> str:
         authors = "\n "
@@ -1,26 +1,292 @@
 """The module contains the function of reading and loading atomic modules into a list"""
 
+import ast
+import dataclasses
+import importlib
 import inspect
+import json
+import logging
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 from pathlib import Path
-from typing import List
+from typing import Any, Dict, List, Optional, Tuple
+import telebot
+from bot_env import get_env_float
 from bot_func_abc import AtomicBotFunctionABC
 
-def load_atomic_functions(func_dir:str = "functions",
-atomic_dir:str = "atomic") -> List[AtomicBotFunctionABC]:
-    """Loading atomic functions into a list"""
+_BASE_CLASS_NAME = AtomicBotFunctionABC.__name__
+_METADATA_FIELDS = ("commands", "authors", "about", "description", "state")
+_STEP_HANDLER_METHODS = ("register_next_step_handler", "clear_step_handler")
+
+@dataclasses.dataclass
+class PluginReport: # pylint: disable=too-many-instance-attributes
+    """Startup report of an atomic module. Times are in seconds"""
+    module: str
+    status: str = "ok"
+    functions: List[str] = dataclasses.field(default_factory=list)
+    import_time: float = 0.0
+    init_time: float = 0.0
+    handlers_time: float = 0.0
+    handlers: int = 0
+    error: str = ""
+
+def load_atomic_functions(func_dir:str = "functions", atomic_dir:str = "atomic",
+reports: Optional[List[PluginReport]] = None) -> List[AtomicBotFunctionABC]:
+    """Loading atomic functions into a list.
+    Modules are imported concurrently. If a reports list is given, a module that fails
+    or does not load in time is skipped and reported, otherwise the error is raised"""
+    atomic_func_path = Path.cwd() / "src" / func_dir / atomic_dir
+    module_names = [f"{func_dir}.{atomic_dir}.{path.stem}"
+        for path in _get_module_files(atomic_func_path)]
+    function_objects = _load_modules(module_names, reports)
+    function_objects.sort(key=lambda f: f.commands[0], reverse=False)
+    return function_objects
+
+def load_lazy_atomic_functions(func_dir:str = "functions", atomic_dir:str = "atomic",
+reports: Optional[List[PluginReport]] = None) -> List[AtomicBotFunctionABC]:
+    """Loading atomic functions into a list without importing their modules.
+    Commands are read from the manifest, a module is imported on its first command.
+    Modules that can not be described by the manifest are imported right away"""
     atomic_func_path = Path.cwd() / "src" / func_dir / atomic_dir
-    suffix = ".py"
-    lst = os.listdir(atomic_func_path)
+    manifest = get_manifest(atomic_func_path)
     function_objects: List[AtomicBotFunctionABC] = []
-    for fn_str in lst:
-        if suffix in fn_str:
-            module_name = fn_str.removesuffix(suffix)
-            module = __import__(f"{func_dir}.{atomic_dir}.{module_name}", fromlist = ["*"])
-            for name, cls in inspect.getmembers(module):
-                if inspect.isclass(cls) and cls.__base__ is AtomicBotFunctionABC:
-                    obj: AtomicBotFunctionABC = cls()
-                    function_objects.append(obj)
-                    print(f"{name} - Added!")
+    eager_module_names: List[str] = []
+    for module_stem, entry in manifest.items():
+        module_name = f"{func_dir}.{atomic_dir}.{module_stem}"
+        if entry["eager"]:
+            eager_module_names.append(module_name)
+            continue
+        for spec in entry["functions"]:
+            function_objects.append(LazyAtomicFunction(module_name, spec))
+        if reports is not None:
+            reports.append(PluginReport(module_name, status="lazy",
+                functions=[spec["class_name"] for spec in entry["functions"]]))
+    function_objects.extend(_load_modules(eager_module_names, reports))
     function_objects.sort(key=lambda f: f.commands[0], reverse=False)
     return function_objects
+
+def load_module(module_name: str) -> Tuple[List[AtomicBotFunctionABC], PluginReport]:
+    """Import the module and create its atomic functions"""
+    report = PluginReport(module_name)
+    start = time.perf_counter()
+    module = importlib.import_module(module_name)
+    report.import_time = time.perf_counter() - start
+    start = time.perf_counter()
+    function_objects: List[AtomicBotFunctionABC] = []
+    for name, cls in inspect.getmembers(module):
+        if inspect.isclass(cls) and cls.__base__ is AtomicBotFunctionABC:
+            obj: AtomicBotFunctionABC = cls()
+            function_objects.append(obj)
+            report.functions.append(name)
+    report.init_time = time.perf_counter() - start
+    return function_objects, report
+
+def count_handlers(bot) -> int:
+    """Get the number of handlers registered on the bot"""
+    return sum(len(value) for name, value in vars(bot).items()
+        if name.endswith("_handlers") and isinstance(value, list))
+
+def log_plugin_reports(reports: List[PluginReport], logger: logging.Logger,
+report_path: Optional[str] = None):
+    """Log the reports, slowest modules first, and save them as JSON if a path is given"""
+    reports = sorted(reports, key=lambda r: r.import_time + r.init_time + r.handlers_time,
+        reverse=True)
+    for report in reports:
+        logger.info("plugin=%s status=%s import=%.3fs init=%.3fs set_handlers=%.3fs "
+            "handlers=%d functions=%s%s", report.module, report.status, report.import_time,
+            report.init_time, report.handlers_time, report.handlers, ",".join(report.functions),
+            f" error={report.error}" if report.error else "")
+    if report_path:
+        try:
+            with open(report_path, "w", encoding="utf-8") as file:
+                json.dump([dataclasses.asdict(report) for report in reports], file, indent=2)
+        except OSError as ex:
+            logger.warning("Failed to save startup report: %s", ex)
+
+def _load_modules(module_names: List[str],
+reports: Optional[List[PluginReport]]) -> List[AtomicBotFunctionABC]:
+    """Import modules concurrently, each within the timeout"""
+    if not module_names:
+        return []
+    timeout = get_env_float("PLUGIN_INIT_TIMEOUT", 10)
+    executor = ThreadPoolExecutor(max_workers=len(module_names), thread_name_prefix="PluginLoader")
+    futures = {name: executor.submit(load_module, name) for name in module_names}
+    deadline = time.monotonic() + timeout
+    function_objects: List[AtomicBotFunctionABC] = []
+    for module_name, future in futures.items():
+        try:
+            functions, report = future.result(timeout=max(0, deadline - time.monotonic()))
+            function_objects.extend(functions)
+        except FutureTimeoutError:
+            if reports is None:
+                raise
+            report = PluginReport(module_name, status="timeout",
+                error=f"not loaded in {timeout} seconds")
+        except Exception as ex: # pylint: disable=broad-except
+            if reports is None:
+                raise
+            report = PluginReport(module_name, status="failed", error=repr(ex))
+        if reports is not None:
+            reports.append(report)
+    executor.shutdown(wait=False, cancel_futures=True)
+    return function_objects
+
+class LazyAtomicFunction(AtomicBotFunctionABC): # pylint: disable=too-many-instance-attributes
+    """Atomic function described by the manifest and imported on demand"""
+
+    commands: List[str] = []
+    authors: List[str] = []
+    about: str = ""
+    description: str = ""
+    state: bool = True
+
+    def __init__(self, module_name: str, spec: Dict[str, Any]):
+        self.module_name = module_name
+        self.class_name: str = spec["class_name"]
+        self.commands = spec["commands"]
+        self.authors = spec["authors"]
+        self.about = spec["about"]
+        self.description = spec["description"]
+        self.state = spec["state"]
+        self.callback_prefixes: List[str] = spec["callback_prefixes"]
+        self.function: Optional[AtomicBotFunctionABC] = None
+
+    @property
+    def function_id(self) -> str:
+        """Name of the loaded function"""
+        return f"{self.module_name}.{self.class_name}"
+
+    def set_handlers(self, bot: telebot.TeleBot):
+        """Handlers are set when the function is loaded"""
+
+    def load(self) -> PluginReport:
+        """Import the module and create the function"""
+        start = time.perf_counter()
+        module = importlib.import_module(self.module_name)
+        report = PluginReport(self.module_name, functions=[self.class_name],
+            import_time=time.perf_counter() - start)
+        start = time.perf_counter()
+        self.function = getattr(module, self.class_name)()
+        report.init_time = time.perf_counter() - start
+        return report
+
+    def __str__(self) -> str:
+        return f"{self.class_name} (lazy)"
+
+def get_manifest(atomic_func_path: Path,
+cache_path: Optional[Path] = None) -> Dict[str, Dict[str, Any]]:
+    """Get descriptions of atomic modules.
+    Descriptions are cached on disk and rebuilt for modules changed since then"""
+    if cache_path is None:
+        cache_path = atomic_func_path / "__pycache__" / "atomic_manifest.json"
+    cache = _read_manifest_cache(cache_path)
+    manifest: Dict[str, Dict[str, Any]] = {}
+    for path in _get_module_files(atomic_func_path):
+        stat = path.stat()
+        entry = cache.get(path.stem)
+        if entry is None or entry.get("mtime_ns") != stat.st_mtime_ns \
+            or entry.get("size") != stat.st_size:
+            entry = _describe_module(path)
+            entry.update(mtime_ns=stat.st_mtime_ns, size=stat.st_size)
+        manifest[path.stem] = entry
+    if manifest != cache:
+        _write_manifest_cache(cache_path, manifest)
+    return manifest
+
+def _get_module_files(atomic_func_path: Path) -> List[Path]:
+    """Get python files of atomic modules"""
+    return sorted(path for path in atomic_func_path.iterdir()
+        if path.is_file() and path.suffix == ".py" and not path.name.startswith("_"))
+
+def _read_manifest_cache(cache_path: Path) -> Dict[str, Dict[str, Any]]:
+    try:
+        with open(cache_path, encoding="utf-8") as file:
+            return json.load(file)
+    except (OSError, ValueError):
+        return {}
+
+def _write_manifest_cache(cache_path: Path, manifest: Dict[str, Dict[str, Any]]):
+    try:
+        cache_path.parent.mkdir(exist_ok=True)
+        tmp_path = cache_path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, ensure_ascii=False)
+        tmp_path.replace(cache_path)
+    except OSError as ex:
+        logging.getLogger(__name__).warning("Failed to save atomic manifest: %s", ex)
+
+def _describe_module(path: Path) -> Dict[str, Any]:
+    """Read atomic functions of the module from its source code.
+    The module is marked eager if its functions can not be routed by commands
+    and callback data prefixes"""
+    try:
+        tree = ast.parse(path.read_text(encoding="utf-8"), filename=str(path))
+        functions = [_describe_class(node) for node in tree.body
+            if isinstance(node, ast.ClassDef) and any(
+                isinstance(base, ast.Name) and base.id == _BASE_CLASS_NAME for base in node.bases)]
+    except (SyntaxError, ValueError, KeyError, IndexError, TypeError, UnicodeDecodeError):
+        return {"eager": True, "functions": []}
+    if not functions or any(function is None for function in functions):
+        return {"eager": True, "functions": []}
+    return {"eager": False, "functions": functions}
+
+def _describe_class(node: ast.ClassDef) -> Optional[Dict[str, Any]]:
+    """Get metadata, commands and callback data prefixes of an atomic function class"""
+    spec: Dict[str, Any] = {"class_name": node.name}
+    for item in node.body:
+        if isinstance(item, ast.Assign) and len(item.targets) == 1:
+            target, value = item.targets[0], item.value
+        elif isinstance(item, ast.AnnAssign) and item.value is not None:
+            target, value = item.target, item.value
+        else:
+            continue
+        if isinstance(target, ast.Name) and target.id in _METADATA_FIELDS:
+            spec[target.id] = ast.literal_eval(value)
+    if any(field not in spec for field in _METADATA_FIELDS) or not spec["commands"]:
+        return None
+    prefixes = _get_callback_prefixes(node, spec["commands"])
+    if prefixes is None:
+        return None
+    spec["callback_prefixes"] = prefixes
+    return spec
+
+def _get_callback_prefixes(node: ast.ClassDef, commands: List[str]) -> Optional[List[str]]:
+    """Get callback data prefixes of the class.
+    None if its handlers can not be routed by commands and prefixes"""
+    prefixes: List[str] = []
+    has_callback_handlers = False
+    for call in (child for child in ast.walk(node) if isinstance(child, ast.Call)):
+        name = _get_call_name(call)
+        keywords = {keyword.arg: keyword.value for keyword in call.keywords}
+        if name == "CallbackData":
+            if "prefix" not in keywords:
+                return None
+            prefixes.append(_get_prefix(keywords["prefix"], commands))
+        elif name == "callback_query_handler":
+            has_callback_handlers = True
+        elif name == "message_handler":
+            if "commands" not in keywords:
+                return None
+        elif name.endswith("_handler") and name not in _STEP_HANDLER_METHODS:
+            return None
+    if has_callback_handlers and not prefixes:
+        return None
+    return prefixes
+
+def _get_call_name(call: ast.Call) -> str:
+    if isinstance(call.func, ast.Name):
+        return call.func.id
+    if isinstance(call.func, ast.Attribute):
+        return call.func.attr
+    return ""
+
+def _get_prefix(value: ast.expr, commands: List[str]) -> str:
+    """Get the prefix given as a literal or as self.commands[index]"""
+    if isinstance(value, ast.Subscript) and isinstance(value.value, ast.Attribute) \
+        and value.value.attr == "commands":
+        return commands[ast.literal_eval(value.slice)]
+    prefix = ast.literal_eval(value)
+    if not isinstance(prefix, str):
+        raise TypeError("Callback data prefix must be a string")
+    return prefix
@@ -0,0 +1,366 @@
+"""The module contains quotas of metered external APIs.
+Requests of every key are counted in rolling windows and the counters are saved
+to a local SQLite database, so they survive restarts and are shared by the processes of the bot"""
+
+import atexit
+import dataclasses
+import hashlib
+import logging
+import math
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Optional, Tuple
+import requests
+from sqlalchemy import Column, Float, Integer, MetaData, String, Table
+from sqlalchemy import create_engine, delete, select
+from sqlalchemy.dialects import sqlite
+from sqlalchemy.exc import SQLAlchemyError
+from bot_metrics import get_metrics
+
+Clock = Callable[[], float]
+Counters = Dict[Tuple[str, float, int], int]
+"""Number of requests by key id, window and bucket of the window"""
+
+class QuotaExceededError(requests.exceptions.RequestException):
+    """All keys of the API have used up their quota"""
+
+@dataclasses.dataclass(frozen=True)
+class QuotaLimit:
+    """At most requests per rolling window of seconds"""
+    requests: int
+    window: float
+
+@dataclasses.dataclass(frozen=True)
+class QuotaPolicy: # pylint: disable=too-many-instance-attributes
+    """Quota settings of a metered API.
+    Keys are read from the env_key variable, several keys are separated by commas
+    and requests are spread between them. Without keys default_key is used
+    with default_limits. The key is sent in the key_param query parameter
+    or the key_header header. When less than the reserve share of the quota is left,
+    cached responses are returned even if they have expired.
+    A request waits at most max_wait seconds for the quota"""
+    name: str
+    env_key: str
+    limits: Tuple[QuotaLimit, ...]
+    key_param: Optional[str] = None
+    key_header: Optional[str] = None
+    default_key: str = ""
+    default_limits: Tuple[QuotaLimit, ...] = ()
+    reserve: float = 0.1
+    max_wait: float = 5
+
+    def get_keys(self) -> Tuple[Tuple[str, ...], Tuple[QuotaLimit, ...]]:
+        """Get the configured keys and their limits"""
+        keys = tuple(key.strip() for key in os.environ.get(self.env_key, "").split(",")
+            if key.strip())
+        if keys:
+            return keys, self.limits
+        return (self.default_key,), self.default_limits or self.limits
+
+    def apply(self, key: str, kwargs: Dict[str, Any]) -> Dict[str, Any]:
+        """Get request arguments with the key"""
+        kwargs = dict(kwargs)
+        if self.key_param is not None:
+            kwargs["params"] = {**(kwargs.get("params") or {}), self.key_param: key}
+        if self.key_header is not None:
+            kwargs["headers"] = {**(kwargs.get("headers") or {}), self.key_header: key}
+        return kwargs
+
+def _get_key_id(key: str) -> str:
+    """Keys are counted by a hash, so they are not saved"""
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+def _get_header(response: requests.Response, name: str) -> Optional[float]:
+    """Get a number from the header"""
+    try:
+        return float(response.headers[name])
+    except (KeyError, ValueError):
+        return None
+
+class SqlQuotaStore:
+    """Counters of API keys in a SQLite database"""
+
+    def __init__(self, connection_string: str):
+        self.__engine = create_engine(connection_string)
+        metadata = MetaData()
+        self.__table = Table("api_quota", metadata,
+            Column("api", String(50), primary_key=True),
+            Column("key_id", String(16), primary_key=True),
+            Column("window", Float, primary_key=True),
+            Column("bucket", Integer, primary_key=True),
+            Column("count", Integer, nullable=False))
+        metadata.create_all(self.__engine)
+
+    def load(self, api: str) -> Counters:
+        """Get the counters of the API"""
+        table = self.__table
+        with self.__engine.connect() as connection:
+            rows = connection.execute(select(table.c.key_id, table.c.window, table.c.bucket,
+                table.c.count).where(table.c.api == api))
+            return {(row.key_id, row.window, row.bucket): row.count for row in rows}
+
+    def add(self, api: str, counters: Counters):
+        """Add the numbers of requests to the saved counters"""
+        if not counters:
+            return
+        table = self.__table
+        statement = sqlite.insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=["api", "key_id", "window", "bucket"],
+            set_={"count": table.c.count + statement.excluded.count})
+        with self.__engine.begin() as connection:
+            connection.execute(statement, [{"api": api, "key_id": key_id, "window": window,
+                "bucket": bucket, "count": count}
+                for (key_id, window, bucket), count in counters.items()])
+
+    def purge(self, api: str, first_buckets: Dict[float, int]):
+        """Remove buckets that have left their windows"""
+        table = self.__table
+        with self.__engine.begin() as connection:
+            for window, bucket in first_buckets.items():
+                connection.execute(delete(table).where(table.c.api == api,
+                    table.c.window == window, table.c.bucket < bucket))
+
+class ApiQuota: # pylint: disable=too-many-instance-attributes
+    """Usage of the keys of one API. Each window is split into BUCKETS buckets,
+    a request is counted in the bucket of its time and a window sums its last buckets.
+    Rate limit headers of responses lower the remaining quota until the shortest window
+    passes, a key that got 429 or has no remaining requests is not used until the reset time.
+    Counters are written to the store every SAVE_INTERVAL seconds
+    and read back with the requests of other processes. The store is accessed outside
+    the lock, requests are not delayed by other callers that save"""
+
+    BUCKETS = 60
+    SAVE_INTERVAL = 5.0
+    MIN_WAIT = 0.05
+
+    def __init__(self, policy: QuotaPolicy, store: Optional[SqlQuotaStore] = None,
+    clock: Clock = time.time):
+        keys, self.limits = policy.get_keys()
+        self.policy = policy
+        self.keys = {_get_key_id(key): key for key in keys}
+        self.__store = store
+        self.__clock = clock
+        self.__counters: Counters = {}
+        self.__unsaved: Counters = {}
+        self.__blocked: Dict[str, float] = {}
+        # Remaining requests and the limit by the last headers and the time they were read
+        self.__reported: Dict[str, Tuple[float, float, float]] = {}
+        self.__lock = threading.Lock()
+        # Saved counters are read by the first request
+        self.__saved = clock() - self.SAVE_INTERVAL
+        self.__saving = False
+
+    def acquire(self) -> str:
+        """Count a request and get the key with the largest share of the quota left.
+        While all keys are used up wait at most max_wait seconds for the quota,
+        then raise QuotaExceededError"""
+        deadline = self.__clock() + self.policy.max_wait
+        while True:
+            self.__save(force=False)
+            with self.__lock:
+                now = self.__clock()
+                key_id, wait = self.__choose(now)
+                if key_id is not None:
+                    self.__count(key_id, now)
+                    return self.keys[key_id]
+            if now + wait > deadline:
+                get_metrics().inc("bot_api_quota_exceeded_total", api=self.policy.name)
+                raise QuotaExceededError(
+                    f"Quota of {self.policy.name} is used up for {math.ceil(wait)} seconds")
+            time.sleep(wait)
+
+    def record(self, key: str, response: requests.Response):
+        """Read the rate limit headers of the response to the request with the key"""
+        key_id = _get_key_id(key)
+        remaining = _get_header(response, "X-RateLimit-Remaining")
+        limit = _get_header(response, "X-RateLimit-Limit")
+        with self.__lock:
+            now = self.__clock()
+            if response.status_code == 429 or remaining == 0:
+                self.__block(key_id, now, self.__get_reset(response, limit))
+            elif remaining is not None and limit:
+                self.__reported[key_id] = (remaining, limit, now)
+                self.__blocked.pop(key_id, None)
+
+    def release(self, key: str):
+        """Forget the remaining requests of the key after a request that got no response,
+        the key is chosen by its counters until the next response"""
+        with self.__lock:
+            self.__reported.pop(_get_key_id(key), None)
+
+    def is_low(self) -> bool:
+        """Check that every key has less than the reserve share of its quota left"""
+        with self.__lock:
+            now = self.__clock()
+            return all(self.__get_share(key_id, now)[0] < self.policy.reserve
+                for key_id in self.keys)
+
+    def save(self):
+        """Write the counters to the store"""
+        self.__save(force=True)
+
+    def __choose(self, now: float) -> Tuple[Optional[str], float]:
+        """Get the key with the largest share left or the time until a key is free"""
+        best, best_share, wait = None, 0.0, float("inf")
+        for key_id in self.keys:
+            share, free_in = self.__get_share(key_id, now)
+            if share > best_share:
+                best, best_share = key_id, share
+            elif share <= 0:
+                wait = min(wait, max(free_in, self.MIN_WAIT))
+        return best, wait
+
+    def __get_share(self, key_id: str, now: float) -> Tuple[float, float]:
+        """Get the share of the quota left and the time until a request is allowed"""
+        blocked_until = self.__blocked.get(key_id, 0)
+        if blocked_until > now:
+            return 0.0, blocked_until - now
+        share, free_in = 1.0, 0.0
+        for limit in self.limits:
+            width = limit.window / self.BUCKETS
+            first = int(now // width) - self.BUCKETS + 1
+            buckets = {bucket: count for (counted_id, window, bucket), count
+                in self.__counters.items()
+                if counted_id == key_id and window == limit.window and bucket >= first}
+            used = sum(buckets.values())
+            share = min(share, 1 - used / limit.requests)
+            if used >= limit.requests:
+                free_in = max(free_in, (min(buckets) + self.BUCKETS) * width - now)
+        reported = self.__reported.get(key_id)
+        if reported is not None:
+            remaining, reported_limit, reported_at = reported
+            if now - reported_at >= self.__get_window(None):
+                del self.__reported[key_id]
+            else:
+                share = min(share, remaining / reported_limit)
+        return max(share, 0.0), free_in
+
+    def __count(self, key_id: str, now: float):
+        for limit in self.limits:
+            bucket = (key_id, limit.window, int(now // (limit.window / self.BUCKETS)))
+            self.__counters[bucket] = self.__counters.get(bucket, 0) + 1
+            self.__unsaved[bucket] = self.__unsaved.get(bucket, 0) + 1
+        if key_id in self.__reported:
+            remaining, reported_limit, reported_at = self.__reported[key_id]
+            if remaining > 1:
+                self.__reported[key_id] = (remaining - 1, reported_limit, reported_at)
+            else:
+                # The last reported request is taken, the key waits for the window of the limit
+                self.__block(key_id, now, self.__get_window(reported_limit))
+
+    def __block(self, key_id: str, now: float, blocked_for: float):
+        """Do not use the key for blocked_for seconds"""
+        blocked_for = max(blocked_for, self.MIN_WAIT)
+        self.__blocked[key_id] = now + blocked_for
+        self.__reported.pop(key_id, None)
+        logging.getLogger(__name__).warning("Quota of %s key %s is used up for %.0f seconds",
+            self.policy.name, key_id, blocked_for)
+
+    def __save(self, force: bool):
+        """Drop buckets that have left their windows and exchange counters with the store,
+        if SAVE_INTERVAL has passed or with force. One save runs at a time"""
+        with self.__lock:
+            now = self.__clock()
+            if self.__saving or (not force and now - self.__saved < self.SAVE_INTERVAL):
+                return
+            self.__saved = now
+            first_buckets = {limit.window:
+                int(now // (limit.window / self.BUCKETS)) - self.BUCKETS + 1
+                for limit in self.limits}
+            if self.__store is None:
+                self.__unsaved = {}
+                self.__counters = _prune(self.__counters, first_buckets)
+                return
+            self.__saving = True
+            unsaved, self.__unsaved = self.__unsaved, {}
+        loaded = None
+        try:
+            self.__store.add(self.policy.name, unsaved)
+            self.__store.purge(self.policy.name, first_buckets)
+            loaded = self.__store.load(self.policy.name)
+        except SQLAlchemyError as ex:
+            logging.getLogger(__name__).warning("Failed to save quota of %s: %s",
+                self.policy.name, ex)
+        finally:
+            with self.__lock:
+                self.__saving = False
+                if loaded is None:
+                    # The counts are written with the next save
+                    self.__unsaved = _add_counts(unsaved, self.__unsaved)
+                else:
+                    # Requests counted during the save are not in the store yet
+                    self.__counters = _add_counts(loaded, self.__unsaved)
+                self.__counters = _prune(self.__counters, first_buckets)
+
+    def __get_reset(self, response: requests.Response, limit: Optional[float]) -> float:
+        """Get the time in seconds until the quota of the key is reset"""
+        reset = _get_header(response, "Retry-After") or _get_header(response, "X-RateLimit-Reset")
+        if reset is not None:
+            # The reset time is sent either in seconds or as a Unix time
+            return reset - self.__clock() if reset > 1e9 else reset
+        return self.__get_window(limit)
+
+    def __get_window(self, limit: Optional[float]) -> float:
+        """Get the window of the limit sent in headers, the shortest window if it is unknown"""
+        windows = [item.window for item in self.limits if item.requests == limit]
+        return max(windows) if windows else min(item.window for item in self.limits)
+
+def _add_counts(counters: Counters, counts: Counters) -> Counters:
+    """Add the counts to the counters"""
+    for bucket, count in counts.items():
+        counters[bucket] = counters.get(bucket, 0) + count
+    return counters
+
+def _prune(counters: Counters, first_buckets: Dict[float, int]) -> Counters:
+    """Get the counters without buckets that have left their windows"""
+    return {(key_id, window, bucket): count
+        for (key_id, window, bucket), count in counters.items()
+        if bucket >= first_buckets.get(window, bucket)}
+
+class ApiQuotaRegistry:
+    """Quotas of metered APIs by name"""
+
+    def __init__(self, store: Optional[SqlQuotaStore] = None, clock: Clock = time.time):
+        self.__store = store
+        self.__clock = clock
+        self.__quotas: Dict[str, ApiQuota] = {}
+        self.__lock = threading.Lock()
+
+    def get(self, policy: QuotaPolicy) -> ApiQuota:
+        """Get the quota of the API"""
+        with self.__lock:
+            quota = self.__quotas.get(policy.name)
+            if quota is None:
+                quota = ApiQuota(policy, self.__store, self.__clock)
+                self.__quotas[policy.name] = quota
+            return quota
+
+    def save(self):
+        """Write counters of all quotas to the store"""
+        with self.__lock:
+            quotas = list(self.__quotas.values())
+        for quota in quotas:
+            quota.save()
+
+_REGISTRY: Optional[ApiQuotaRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+def get_api_quotas() -> ApiQuotaRegistry:
+    """Get the quotas shared by all atomic functions.
+    Counters are saved to the SQLite file API_QUOTA_PATH, an empty path keeps them in memory"""
+    global _REGISTRY # pylint: disable=global-statement
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            path = os.environ.get("API_QUOTA_PATH", "api_quota.db")
+            store = None
+            if path:
+                try:
+                    store = SqlQuotaStore(f"sqlite:///{path}")
+                except SQLAlchemyError as ex:
+                    logging.getLogger(__name__).warning(
+                        "Quota counters are kept in memory, failed to open %s: %s", path, ex)
+            _REGISTRY = ApiQuotaRegistry(store)
+            atexit.register(_REGISTRY.save)
+        return _REGISTRY
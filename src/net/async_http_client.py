@@ -0,0 +1,112 @@
+"""The module contains a shared asyncio HTTP client for requests to external APIs"""
+
+import asyncio
+import dataclasses
+import json
+import random
+import time
+from typing import Any, Dict, Optional
+from urllib.parse import urlsplit
+import aiohttp
+from bot_metrics import get_metrics
+from net.http_client import HttpClient, HttpClientConfig, get_http_client
+
+@dataclasses.dataclass
+class AsyncHttpResponse:
+    """Fully read response of the asyncio HTTP client"""
+    url: str
+    status_code: int
+    headers: Dict[str, str]
+    content: bytes
+    request_info: aiohttp.RequestInfo
+
+    def json(self) -> Any:
+        """Decode response body as JSON"""
+        return json.loads(self.content)
+
+    @property
+    def text(self) -> str:
+        """Response body as text"""
+        return self.content.decode("utf-8", errors="replace")
+
+    def raise_for_status(self):
+        """Raise aiohttp.ClientResponseError for 4xx and 5xx responses"""
+        if self.status_code >= 400:
+            raise aiohttp.ClientResponseError(
+                request_info=self.request_info, history=(), status=self.status_code,
+                message=f"{self.status_code} error for url: {self.url}", headers=self.headers)
+
+class AsyncHttpClient:
+    """Asyncio counterpart of HttpClient with the same settings:
+    keep-alive connections, timeouts, retries with jittered backoff
+    and a limit of concurrent requests per host"""
+
+    def __init__(self, config: Optional[HttpClientConfig] = None):
+        self.__config = config or HttpClientConfig()
+        self.__session: Optional[aiohttp.ClientSession] = None
+
+    async def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None) -> AsyncHttpResponse:
+        """Send a GET request, retrying connection errors, 429 and 5xx responses"""
+        metrics = get_metrics()
+        host = urlsplit(url).netloc
+        start = time.perf_counter()
+        try:
+            response = await self.__get(url, params, headers)
+        except (aiohttp.ClientConnectionError, asyncio.TimeoutError) as ex:
+            metrics.observe("bot_http_request_seconds", time.perf_counter() - start, host=host)
+            metrics.inc("bot_http_errors_total", host=host, reason=type(ex).__name__)
+            raise
+        metrics.observe("bot_http_request_seconds", time.perf_counter() - start, host=host)
+        if response.status_code >= 400:
+            metrics.inc("bot_http_errors_total", host=host, reason=str(response.status_code))
+        return response
+
+    async def __get(self, url: str, params: Optional[Dict[str, Any]],
+    headers: Optional[Dict[str, str]]) -> AsyncHttpResponse:
+        session = self.__get_session()
+        attempt = 0
+        while True:
+            try:
+                async with session.get(url, params=params, headers=headers) as response:
+                    content = await response.read()
+                    if (response.status not in HttpClient.RETRY_STATUSES
+                            or attempt >= self.__config.retries):
+                        return AsyncHttpResponse(str(response.url), response.status,
+                            dict(response.headers), content, response.request_info)
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= self.__config.retries:
+                    raise
+            await asyncio.sleep(self.__backoff(attempt))
+            attempt += 1
+
+    async def close(self):
+        """Close the session and all pooled connections"""
+        if self.__session is not None:
+            await self.__session.close()
+            self.__session = None
+
+    def __get_session(self) -> aiohttp.ClientSession:
+        if self.__session is None or self.__session.closed:
+            timeout = self.__config.timeout
+            if isinstance(timeout, tuple):
+                client_timeout = aiohttp.ClientTimeout(connect=timeout[0], sock_read=timeout[1])
+            else:
+                client_timeout = aiohttp.ClientTimeout(total=timeout)
+            connector = aiohttp.TCPConnector(limit=0,
+                limit_per_host=self.__config.host_concurrency)
+            self.__session = aiohttp.ClientSession(connector=connector, timeout=client_timeout)
+        return self.__session
+
+    def __backoff(self, attempt: int) -> float:
+        delay = self.__config.backoff_factor * (2 ** attempt)
+        return delay + random.uniform(0, self.__config.backoff_jitter)
+
+_ASYNC_HTTP_CLIENT: Optional[AsyncHttpClient] = None
+
+def get_async_http_client() -> AsyncHttpClient:
+    """Get the asyncio HTTP client shared by all atomic functions"""
+    global _ASYNC_HTTP_CLIENT # pylint: disable=global-statement
+    if _ASYNC_HTTP_CLIENT is None:
+        _ASYNC_HTTP_CLIENT = AsyncHttpClient(get_http_client().config)
+    return _ASYNC_HTTP_CLIENT
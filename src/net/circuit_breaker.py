@@ -0,0 +1,109 @@
+"""The module contains circuit breakers for requests of atomic functions to external APIs"""
+
+import dataclasses
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Optional, Tuple
+import requests
+from bot_env import get_env_float, get_env_int
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Requests to the host are not sent because it has failed recently"""
+
+@dataclasses.dataclass
+class CircuitBreakerConfig:
+    """Circuit breaker settings.
+    After failure_threshold failures in a row requests fail fast for recovery_timeout seconds,
+    then one probe request is sent and its result closes or opens the circuit again"""
+    failure_threshold: int = 5
+    recovery_timeout: float = 30
+
+class CircuitBreaker:
+    """Circuit breaker of one function and host"""
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, config: CircuitBreakerConfig, clock: Callable[[], float] = time.monotonic):
+        self.__config = config
+        self.__clock = clock
+        self.__state = self.CLOSED
+        self.__failures = 0
+        self.__opened_at = 0.0
+        self.__lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        """Current state, an open circuit is reported half open when a probe is allowed"""
+        with self.__lock:
+            if self.__state == self.OPEN and self.__recovery_due():
+                return self.HALF_OPEN
+            return self.__state
+
+    def allow_request(self) -> bool:
+        """Check that a request can be sent.
+        One probe is sent per recovery timeout while the circuit is not closed"""
+        with self.__lock:
+            if self.__state == self.CLOSED:
+                return True
+            if self.__recovery_due():
+                self.__state = self.HALF_OPEN
+                self.__opened_at = self.__clock()
+                return True
+            return False
+
+    def record_success(self):
+        """Close the circuit"""
+        with self.__lock:
+            self.__state = self.CLOSED
+            self.__failures = 0
+
+    def record_failure(self):
+        """Count the failure and open the circuit after too many of them or a failed probe"""
+        with self.__lock:
+            self.__failures += 1
+            if self.__state == self.HALF_OPEN or self.__failures >= self.__config.failure_threshold:
+                self.__state = self.OPEN
+                self.__opened_at = self.__clock()
+
+    def __recovery_due(self) -> bool:
+        return self.__clock() - self.__opened_at >= self.__config.recovery_timeout
+
+class CircuitBreakerRegistry:
+    """Circuit breakers keyed by atomic function and host"""
+
+    def __init__(self, config: Optional[CircuitBreakerConfig] = None):
+        self.config = config or CircuitBreakerConfig()
+        self.__breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.__lock = threading.Lock()
+
+    def get(self, owner: str, host: str) -> CircuitBreaker:
+        """Get the circuit breaker of the function and host"""
+        with self.__lock:
+            breaker = self.__breakers.get((owner, host))
+            if breaker is None:
+                breaker = CircuitBreaker(self.config)
+                self.__breakers[(owner, host)] = breaker
+            return breaker
+
+    def get_unhealthy_owners(self) -> FrozenSet[str]:
+        """Get functions that have an open circuit"""
+        with self.__lock:
+            breakers = list(self.__breakers.items())
+        return frozenset(name for (name, _), breaker in breakers
+            if breaker.state == CircuitBreaker.OPEN)
+
+_REGISTRY: Optional[CircuitBreakerRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+def get_circuit_breakers() -> CircuitBreakerRegistry:
+    """Get the circuit breakers shared by all atomic functions"""
+    global _REGISTRY # pylint: disable=global-statement
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = CircuitBreakerRegistry(CircuitBreakerConfig(
+                failure_threshold=get_env_int("CIRCUIT_FAILURE_THRESHOLD", 5),
+                recovery_timeout=get_env_float("CIRCUIT_RECOVERY_TIMEOUT", 30),
+            ))
+        return _REGISTRY
@@ -0,0 +1,217 @@
+"""The module contains a local copy of ISO country codes and their administrative divisions.
+The copy is kept in an indexed file, so lookups work offline and do not wait for external APIs,
+and it is replaced in the background when it gets old"""
+
+import dataclasses
+import hashlib
+import json
+import logging
+import os
+import threading
+import time
+from typing import Callable, Dict, FrozenSet, Optional, Sequence, Tuple
+from bot_env import get_env_float
+
+Clock = Callable[[], float]
+Divisions = Dict[str, Optional[Sequence[str]]]
+"""Divisions by country code, None if the divisions of the country are not loaded"""
+Loader = Callable[[Optional[FrozenSet[str]]], Divisions]
+"""Gets divisions of the countries with the codes, of all countries if codes are None"""
+
+_MAGIC = b"COUNTRIES 1\n"
+
+@dataclasses.dataclass(frozen=True)
+class CountryDatasetConfig:
+    """Country dataset settings. The file is refreshed when it is older than max_age seconds"""
+    path: str = "countries.dataset"
+    max_age: float = 7 * 24 * 3600
+
+@dataclasses.dataclass(frozen=True)
+class CountrySnapshot:
+    """One version of the dataset. The index is ordered by code and points to divisions
+    of a country in the blob, they are decoded on lookup.
+    Countries with divisions that were not loaded have the length -1 and are missing"""
+    version: str
+    created_at: float
+    codes: FrozenSet[str]
+    index: Dict[str, Tuple[int, int]]
+    blob: bytes
+    missing: FrozenSet[str] = frozenset()
+
+    def get_divisions(self, code: str) -> Optional[Tuple[str, ...]]:
+        """Get divisions of the country, None if the country is unknown"""
+        position = self.index.get(code)
+        if position is None:
+            return None
+        offset, length = position
+        if length < 0:
+            return None
+        if not length:
+            return ()
+        return tuple(self.blob[offset:offset + length].decode().split("\n"))
+
+    def get_all_divisions(self) -> Divisions:
+        """Get divisions of all countries, None for missing countries"""
+        return {code: self.get_divisions(code) for code in self.index}
+
+    @classmethod
+    def build(cls, divisions: Divisions, created_at: float) -> "CountrySnapshot":
+        """Build a snapshot of divisions by country code"""
+        index: Dict[str, Tuple[int, int]] = {}
+        parts = []
+        offset = 0
+        for code in sorted(divisions):
+            if divisions[code] is None:
+                index[code] = (offset, -1)
+                continue
+            # Names are kept one per line
+            data = "\n".join(name.replace("\n", " ") for name in divisions[code]).encode()
+            index[code] = (offset, len(data))
+            parts.append(data)
+            offset += len(data)
+        blob = b"".join(parts)
+        version = hashlib.sha256(json.dumps(index).encode() + blob).hexdigest()[:12]
+        return cls(version, created_at, frozenset(index), index, blob, _get_missing(index))
+
+    def write(self, path: str):
+        """Save the snapshot: a header line, a JSON line with the index and the blob.
+        The file is replaced at once, readers see either the old or the new version"""
+        header = json.dumps({"version": self.version, "created_at": self.created_at,
+            "index": self.index}, separators=(",", ":")).encode()
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        with open(temp_path, "wb") as file:
+            file.write(_MAGIC + header + b"\n" + self.blob)
+        os.replace(temp_path, path)
+
+    @classmethod
+    def read(cls, path: str) -> "CountrySnapshot":
+        """Load a saved snapshot, raise ValueError if the file is not a dataset"""
+        with open(path, "rb") as file:
+            if file.readline() != _MAGIC:
+                raise ValueError(f"{path} is not a country dataset")
+            header = json.loads(file.readline())
+            blob = file.read()
+        index = {code: (offset, length) for code, (offset, length) in header["index"].items()}
+        return cls(header["version"], header["created_at"], frozenset(index), index, blob,
+            _get_missing(index))
+
+def _get_missing(index: Dict[str, Tuple[int, int]]) -> FrozenSet[str]:
+    """Get codes of countries with divisions that were not loaded"""
+    return frozenset(code for code, (_, length) in index.items() if length < 0)
+
+class CountryDataset:
+    """Country codes and divisions from the local file. A refresh loads the data
+    with the loader in a background thread, writes a new file and replaces the snapshot.
+    Until the first snapshot is loaded the dataset is not ready.
+    Countries that failed to load are kept as missing, the divisions of the previous
+    version are used for them if there are any. A failed refresh and missing countries
+    are loaded again after RETRY_INTERVAL seconds"""
+
+    RETRY_INTERVAL = 600.0
+
+    def __init__(self, loader: Loader, config: Optional[CountryDatasetConfig] = None,
+    clock: Clock = time.time):
+        self.config = config or get_country_dataset_config()
+        self.__loader = loader
+        self.__clock = clock
+        self.__snapshot: Optional[CountrySnapshot] = None
+        self.__refreshing = threading.Lock()
+        self.__attempted_at: Optional[float] = None
+        self.__logger = logging.getLogger(__name__)
+        try:
+            self.__snapshot = CountrySnapshot.read(self.config.path)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError, KeyError) as ex:
+            self.__logger.warning("Country dataset %s is not loaded: %s", self.config.path, ex)
+
+    @property
+    def snapshot(self) -> Optional[CountrySnapshot]:
+        """Current version of the data"""
+        return self.__snapshot
+
+    def is_ready(self) -> bool:
+        """Check that the data is loaded"""
+        return self.__snapshot is not None
+
+    def has_country(self, code: str) -> bool:
+        """Check the ISO code of the country"""
+        snapshot = self.__snapshot
+        return snapshot is not None and code in snapshot.codes
+
+    def get_codes(self) -> Tuple[str, ...]:
+        """Get ISO codes of all countries in alphabetical order"""
+        snapshot = self.__snapshot
+        return tuple(snapshot.index) if snapshot is not None else ()
+
+    def get_divisions(self, code: str) -> Optional[Tuple[str, ...]]:
+        """Get divisions of the country, None if the country is unknown"""
+        snapshot = self.__snapshot
+        return snapshot.get_divisions(code) if snapshot is not None else None
+
+    def refresh_if_stale(self):
+        """Start a background refresh if there is no data or it is older than max_age,
+        or load the missing countries"""
+        snapshot = self.__snapshot
+        now = self.__clock()
+        if snapshot is None or now - snapshot.created_at >= self.config.max_age:
+            target = self.refresh
+        elif snapshot.missing:
+            target = self.load_missing
+        else:
+            return
+        if self.__attempted_at is None or now - self.__attempted_at >= self.RETRY_INTERVAL:
+            self.__attempted_at = now
+            threading.Thread(target=target, name="CountryDatasetRefresh", daemon=True).start()
+
+    def refresh(self) -> bool:
+        """Load the data of all countries and replace the snapshot, one refresh at a time.
+        Get whether a new version was loaded"""
+        return self.__update(None)
+
+    def load_missing(self) -> bool:
+        """Load only the countries that are missing in the snapshot.
+        Get whether a new version was loaded"""
+        snapshot = self.__snapshot
+        if snapshot is None or not snapshot.missing:
+            return False
+        return self.__update(snapshot.missing)
+
+    def __update(self, codes: Optional[FrozenSet[str]]) -> bool:
+        """Load the countries, all of them if codes are None, and save a new snapshot"""
+        if not self.__refreshing.acquire(blocking=False): # pylint: disable=consider-using-with
+            return False
+        try:
+            previous = self.__snapshot
+            loaded = self.__loader(codes)
+            if codes is None:
+                if not loaded:
+                    raise ValueError("No countries are loaded")
+                divisions, created_at = loaded, self.__clock()
+            else:
+                divisions, created_at = previous.get_all_divisions(), previous.created_at
+                divisions.update((code, names) for code, names in loaded.items()
+                    if names is not None and code in divisions)
+            if previous is not None:
+                for code, names in divisions.items():
+                    if names is None:
+                        divisions[code] = previous.get_divisions(code)
+            snapshot = CountrySnapshot.build(divisions, created_at)
+            snapshot.write(self.config.path)
+            changed = previous is None or previous.version != snapshot.version
+            self.__snapshot = snapshot
+            self.__logger.info("Country dataset %s: %d countries, %d missing", snapshot.version,
+                len(snapshot.codes), len(snapshot.missing))
+            return changed
+        except Exception as ex: # pylint: disable=broad-except
+            self.__logger.warning("Failed to refresh country dataset: %s", ex)
+            return False
+        finally:
+            self.__refreshing.release()
+
+def get_country_dataset_config() -> CountryDatasetConfig:
+    """Get country dataset settings from environment variables"""
+    return CountryDatasetConfig(
+        path=os.environ.get("COUNTRY_DATASET_PATH", "countries.dataset"),
+        max_age=get_env_float("COUNTRY_DATASET_MAX_AGE", 7 * 24 * 3600),
+    )
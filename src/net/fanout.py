@@ -0,0 +1,56 @@
+"""The module contains a helper for concurrent requests to external APIs"""
+
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Callable, List, Optional, Sequence, TypeVar
+from bot_env import get_env_int
+
+T = TypeVar("T")
+
+_EXECUTOR: Optional[ThreadPoolExecutor] = None
+_EXECUTOR_LOCK = threading.Lock()
+
+def _get_executor() -> ThreadPoolExecutor:
+    """Get the thread pool shared by all atomic functions"""
+    global _EXECUTOR # pylint: disable=global-statement
+    with _EXECUTOR_LOCK:
+        if _EXECUTOR is None:
+            _EXECUTOR = ThreadPoolExecutor(
+                max_workers=max(1, get_env_int("FANOUT_WORKERS", 16)),
+                thread_name_prefix="FanOut")
+        return _EXECUTOR
+
+def fan_out(calls: Sequence[Callable[[], T]], deadline: float = 15,
+executor: Optional[ThreadPoolExecutor] = None) -> List[T]:
+    """Run the calls concurrently and return the results of the calls
+    that succeeded within deadline seconds, in the order of the calls.
+    The number of simultaneous requests to one host is limited by the HTTP client.
+    Calls run in the thread pool shared by atomic functions, bulk background work
+    passes its own small executor so it does not take the shared pool"""
+    if len(calls) == 1:
+        return _run_one(calls[0])
+    executor = executor or _get_executor()
+    futures: List[Future] = [executor.submit(call) for call in calls]
+    done, not_done = wait(futures, timeout=deadline)
+    for future in not_done:
+        future.cancel()
+    if not_done:
+        logging.getLogger(__name__).warning(
+            "%d of %d calls did not finish in %s seconds", len(not_done), len(calls), deadline)
+    results = []
+    for future in futures:
+        if future in done:
+            if future.exception() is None:
+                results.append(future.result())
+            else:
+                logging.getLogger(__name__).warning("Call failed: %s", future.exception())
+    return results
+
+def _run_one(call: Callable[[], T]) -> List[T]:
+    """Run a single call in the current thread"""
+    try:
+        return [call()]
+    except Exception as ex: # pylint: disable=broad-except
+        logging.getLogger(__name__).warning("Call failed: %s", ex)
+        return []
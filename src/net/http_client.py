@@ -0,0 +1,279 @@
+"""The module contains a shared HTTP client for requests to external APIs"""
+
+import dataclasses
+import threading
+import time
+from typing import Any, Callable, Dict, Hashable, List, Optional, Sequence, Tuple
+from urllib.parse import urlsplit
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from bot_env import get_env_float, get_env_int
+from bot_metrics import get_metrics
+from net.api_quota import QuotaExceededError, QuotaPolicy, get_api_quotas
+from net.circuit_breaker import CircuitBreaker, CircuitOpenError, get_circuit_breakers
+from net.json_stream import iter_array_items, project
+from net.response_cache import CachePolicy, ResponseCache
+from net.single_flight import SingleFlight
+
+Timeout = float | Tuple[float, float]
+
+class HostBusyError(requests.exceptions.ConnectionError):
+    """The limit of concurrent requests to the host has been reached"""
+
+@dataclasses.dataclass
+class HttpClientConfig:
+    """HTTP client settings"""
+    timeout: Timeout = (3.05, 10)
+    retries: int = 2
+    backoff_factor: float = 0.3
+    backoff_jitter: float = 0.3
+    pool_size: int = 10
+    host_concurrency: int = 8
+    cache_size: int = 1000
+
+class HttpClient:
+    """HTTP client with keep-alive connection pools per host,
+    uniform timeouts, retries with jittered backoff,
+    a limit of concurrent requests per host and a cache of JSON responses.
+    Identical concurrent JSON requests share one request in flight.
+    Requests to metered APIs take a key from the quota of the API.
+    Requests of an owner go through its circuit breaker of the host"""
+
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    STREAM_CHUNK_SIZE = 64 * 1024
+
+    def __init__(self, config: Optional[HttpClientConfig] = None):
+        config = config or HttpClientConfig()
+        self.config = config
+        self.__host_semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self.__lock = threading.Lock()
+        self.cache = ResponseCache(config.cache_size)
+        self.single_flight = SingleFlight()
+        retry = Retry(
+            total=config.retries,
+            backoff_factor=config.backoff_factor,
+            backoff_jitter=config.backoff_jitter,
+            status_forcelist=self.RETRY_STATUSES,
+            allowed_methods=frozenset(["GET", "HEAD", "OPTIONS"]),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=config.pool_size,
+            pool_maxsize=config.pool_size, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+    def get(self, url: str, params: Optional[Dict[str, Any]] = None,
+    headers: Optional[Dict[str, str]] = None, timeout: Optional[Timeout] = None,
+    **kwargs) -> requests.Response:
+        """Send a GET request"""
+        return self.request("GET", url, params=params, headers=headers,
+            timeout=timeout, **kwargs)
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+    cache: Optional[CachePolicy] = None, coalesce: bool = True,
+    quota: Optional[QuotaPolicy] = None, **kwargs) -> Any:
+        """Send a GET request and decode the JSON body.
+        Concurrent calls with the same URL, query parameters and headers (API keys)
+        share one request and its decoded body, pass coalesce=False for endpoints
+        that return a different body each time.
+        With a cache policy the body is cached by the URL and query parameters,
+        an expired body is returned while the circuit of the host is open
+        or the quota of the API is low"""
+        return self.__get_decoded(url, lambda response: response.json(), "json",
+            params=params, cache=cache, coalesce=coalesce, quota=quota, **kwargs)
+
+    def get_json_items(self, url: str, params: Optional[Dict[str, Any]] = None,
+    fields: Optional[Sequence[str]] = None, cache: Optional[CachePolicy] = None,
+    **kwargs) -> List[Any]:
+        """Send a GET request and decode the JSON array in the body item by item,
+        keeping only the fields of objects, so the whole body is never in memory.
+        Requests are shared and cached like in get_json, the list of items is cached"""
+        def decode(response: requests.Response) -> List[Any]:
+            chunks = response.iter_content(self.STREAM_CHUNK_SIZE)
+            return list(project(iter_array_items(chunks), fields))
+        variant = ("items",) if fields is None else ("items", *fields)
+        return self.__get_decoded(url, decode, variant, params=params, cache=cache,
+            stream=True, **kwargs)
+
+    def request(self, method: str, url: str, timeout: Optional[Timeout] = None,
+    owner: Optional[str] = None, quota: Optional[QuotaPolicy] = None,
+    **kwargs) -> requests.Response:
+        """Send a request through the connection pool of the host.
+        Connection errors, timeouts and server errors are counted by the circuit breaker
+        of the owner and the host, while the circuit is open CircuitOpenError is raised.
+        With a quota policy the key of the API is added to the request,
+        QuotaExceededError is raised when all keys are used up"""
+        if quota is not None:
+            return self.__request_with_quota(quota, method, url, timeout=timeout,
+                owner=owner, **kwargs)
+        if timeout is None:
+            timeout = self.config.timeout
+        host = urlsplit(url).netloc
+        breaker = None if owner is None else get_circuit_breakers().get(owner, host)
+        if breaker is not None and not breaker.allow_request():
+            get_metrics().inc("bot_http_errors_total", host=host, reason="CircuitOpenError")
+            raise CircuitOpenError(f"Requests to {host} are suspended after failures")
+        semaphore = self.__get_host_semaphore(host)
+        if not semaphore.acquire(timeout=self.__wait_timeout(timeout)):
+            get_metrics().inc("bot_http_errors_total", host=host, reason="HostBusyError")
+            raise HostBusyError(f"Too many concurrent requests to {host}")
+        try:
+            return self.__send(breaker, host, method, url, timeout=timeout, **kwargs)
+        finally:
+            semaphore.release()
+
+    def for_owner(self, owner: str) -> "OwnerHttpClient":
+        """Get a view of the client for requests of the owner"""
+        return OwnerHttpClient(self, owner)
+
+    def close(self):
+        """Close all pooled connections"""
+        self.session.close()
+
+    def __get_decoded(self, url: str, decode: Callable[[requests.Response], Any], # pylint: disable=too-many-arguments,too-many-positional-arguments
+    variant: Hashable, params: Optional[Dict[str, Any]] = None,
+    cache: Optional[CachePolicy] = None, coalesce: bool = True,
+    quota: Optional[QuotaPolicy] = None, **kwargs) -> Any:
+        """Send a GET request and decode the body, the variant of decoding is a part of the keys
+        of shared requests and cached bodies. Query parameters are a part of the keys
+        as they are encoded in the URL, so lists and other values of params can be used"""
+        query_url = self.__get_query_url(url, params)
+        def load() -> Any:
+            response = self.get(url, params=params, quota=quota, **kwargs)
+            try:
+                response.raise_for_status()
+                return decode(response)
+            finally:
+                response.close()
+        def load_shared() -> Any:
+            if not coalesce:
+                return load()
+            key = ("GET", query_url, tuple(sorted((kwargs.get("headers") or {}).items())),
+                kwargs.get("auth"), variant)
+            try:
+                hash(key)
+            except TypeError:
+                # Requests with an unhashable auth object are not shared
+                return load()
+            value, shared = self.single_flight.do(key, load)
+            if shared:
+                get_metrics().inc("bot_http_coalesced_total", host=urlsplit(url).netloc)
+            return value
+        if cache is None:
+            return load_shared()
+        key = (query_url, variant)
+        if quota is not None and get_api_quotas().get(quota).is_low():
+            found, value = self.cache.peek(key)
+            if found:
+                get_metrics().inc("bot_api_quota_degraded_total", api=quota.name)
+                return value
+        return self.cache.get_or_load(key, load_shared, cache,
+            fallback=(CircuitOpenError, QuotaExceededError))
+
+    def __request_with_quota(self, quota: QuotaPolicy, method: str, url: str,
+    **kwargs) -> requests.Response:
+        """Send the request with a key of the API, a key rejected with 429 is replaced"""
+        api_quota = get_api_quotas().get(quota)
+        for _ in api_quota.keys:
+            key = api_quota.acquire()
+            try:
+                response = self.request(method, url, **quota.apply(key, kwargs))
+            except requests.exceptions.RequestException:
+                api_quota.release(key)
+                raise
+            api_quota.record(key, response)
+            if response.status_code != 429:
+                break
+        return response
+
+    def __send(self, breaker: Optional[CircuitBreaker], host: str, method: str, url: str,
+    **kwargs) -> requests.Response:
+        """Send the request, collect its time and result"""
+        metrics = get_metrics()
+        start = time.perf_counter()
+        try:
+            response = self.session.request(method, url, **kwargs)
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as ex:
+            metrics.observe("bot_http_request_seconds", time.perf_counter() - start, host=host)
+            metrics.inc("bot_http_errors_total", host=host, reason=type(ex).__name__)
+            if breaker is not None:
+                breaker.record_failure()
+            raise
+        metrics.observe("bot_http_request_seconds", time.perf_counter() - start, host=host)
+        if response.status_code >= 400:
+            metrics.inc("bot_http_errors_total", host=host, reason=str(response.status_code))
+        if breaker is not None and response.status_code >= 500:
+            breaker.record_failure()
+        elif breaker is not None:
+            breaker.record_success()
+        return response
+
+    def __get_host_semaphore(self, host: str) -> threading.BoundedSemaphore:
+        with self.__lock:
+            semaphore = self.__host_semaphores.get(host)
+            if semaphore is None:
+                semaphore = threading.BoundedSemaphore(self.config.host_concurrency)
+                self.__host_semaphores[host] = semaphore
+            return semaphore
+
+    @staticmethod
+    def __get_query_url(url: str, params: Optional[Dict[str, Any]]) -> str:
+        """Get the URL with the query parameters encoded by requests in the order of names"""
+        request = requests.PreparedRequest()
+        request.prepare_url(url, sorted((params or {}).items()))
+        return request.url
+
+    @staticmethod
+    def __wait_timeout(timeout: Timeout) -> float:
+        if isinstance(timeout, tuple):
+            return sum(timeout)
+        return timeout
+
+class OwnerHttpClient:
+    """View of the HTTP client that sends requests of one atomic function
+    through its circuit breakers"""
+
+    def __init__(self, client: HttpClient, owner: str):
+        self.client = client
+        self.owner = owner
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Send a GET request"""
+        return self.client.get(url, owner=self.owner, **kwargs)
+
+    def get_json(self, url: str, params: Optional[Dict[str, Any]] = None,
+    cache: Optional[CachePolicy] = None, **kwargs) -> Any:
+        """Send a GET request and decode the JSON body, identical concurrent requests are shared"""
+        return self.client.get_json(url, params=params, cache=cache, owner=self.owner, **kwargs)
+
+    def get_json_items(self, url: str, params: Optional[Dict[str, Any]] = None,
+    fields: Optional[Sequence[str]] = None, cache: Optional[CachePolicy] = None,
+    **kwargs) -> List[Any]:
+        """Send a GET request and decode the JSON array item by item, keeping only the fields"""
+        return self.client.get_json_items(url, params=params, fields=fields, cache=cache,
+            owner=self.owner, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Send a request"""
+        return self.client.request(method, url, owner=self.owner, **kwargs)
+
+_HTTP_CLIENT: Optional[HttpClient] = None
+_HTTP_CLIENT_LOCK = threading.Lock()
+
+def get_http_client() -> HttpClient:
+    """Get the HTTP client shared by all atomic functions"""
+    global _HTTP_CLIENT # pylint: disable=global-statement
+    with _HTTP_CLIENT_LOCK:
+        if _HTTP_CLIENT is None:
+            _HTTP_CLIENT = HttpClient(HttpClientConfig(
+                timeout=(get_env_float("HTTP_CONNECT_TIMEOUT", 3.05),
+                    get_env_float("HTTP_TIMEOUT", 10)),
+                retries=get_env_int("HTTP_RETRIES", 2),
+                pool_size=get_env_int("HTTP_POOL_SIZE", 10),
+                host_concurrency=get_env_int("HTTP_HOST_CONCURRENCY", 8),
+                cache_size=get_env_int("HTTP_CACHE_SIZE", 1000),
+            ))
+        return _HTTP_CLIENT
@@ -0,0 +1,73 @@
+"""The module contains incremental decoding of large JSON arrays from external APIs"""
+
+import codecs
+import json
+from typing import Any, Iterable, Iterator, Optional, Sequence
+
+_DECODER = json.JSONDecoder()
+_WHITESPACE = " \t\n\r"
+
+def iter_array_items(chunks: Iterable[bytes]) -> Iterator[Any]:
+    """Decode the items of a top-level JSON array one at a time from UTF-8 chunks,
+    so only the current item and one chunk are kept in memory.
+    Raise ValueError if the body is not a JSON array"""
+    text_chunks = _iter_text(chunks)
+    buffer, pos = "", 0
+    state = "start"
+    while True:
+        while pos < len(buffer) and buffer[pos] in _WHITESPACE:
+            pos += 1
+        if pos == len(buffer):
+            buffer, pos = next(text_chunks, None), 0
+            if buffer is None:
+                raise ValueError("Unexpected end of JSON array")
+            continue
+        char = buffer[pos]
+        if state in ("start", "next") or (state == "first" and char == "]"):
+            if state != "start" and char == "]":
+                return
+            if char != ("[" if state == "start" else ","):
+                raise ValueError(f"Unexpected {buffer[pos:pos + 20]!r} in JSON array")
+            pos += 1
+            state = "first" if state == "start" else "item"
+            continue
+        item, buffer, pos = _decode_item(buffer, pos, text_chunks)
+        state = "next"
+        yield item
+
+def project(items: Iterable[Any], fields: Optional[Sequence[str]] = None) -> Iterator[Any]:
+    """Keep only the fields of every object, other items are returned as they are"""
+    for item in items:
+        if fields is not None and isinstance(item, dict):
+            item = {field: item[field] for field in fields if field in item}
+        yield item
+
+def _iter_text(chunks: Iterable[bytes]) -> Iterator[str]:
+    """Decode chunks that can split multibyte characters"""
+    decoder = codecs.getincrementaldecoder("utf-8")()
+    for chunk in chunks:
+        text = decoder.decode(chunk)
+        if text:
+            yield text
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+def _decode_item(buffer: str, pos: int, text_chunks: Iterator[str]):
+    """Decode the item at pos, reading chunks until the item and the character
+    after it are in the buffer. Get the item, the buffer and the position after the item"""
+    buffer = buffer[pos:]
+    while True:
+        try:
+            item, end = _DECODER.raw_decode(buffer)
+        except json.JSONDecodeError:
+            end = None
+        # A number is complete only when the separator after it is read
+        if end is not None and buffer[end:].lstrip(_WHITESPACE)[:1] in (",", "]"):
+            return item, buffer, end
+        chunk = next(text_chunks, None)
+        if chunk is None:
+            if end is None:
+                _DECODER.raw_decode(buffer)
+            return item, buffer, end
+        buffer += chunk
@@ -0,0 +1,120 @@
+"""The module contains a buffer of random items loaded from external APIs in advance"""
+
+import collections
+import dataclasses
+import logging
+import threading
+from typing import Any, Callable, Deque, List, Optional
+from bot_env import get_env_float, get_env_int
+from net.fanout import fan_out
+
+@dataclasses.dataclass
+class PrefetchConfig:
+    """Prefetch buffer settings.
+    When the buffer falls to low_watermark items, it is refilled up to high_watermark
+    with at most refill_rate upstream requests per second"""
+    low_watermark: int = 3
+    high_watermark: int = 10
+    refill_rate: float = 2.0
+
+@dataclasses.dataclass
+class PrefetchStats:
+    """Buffer counters"""
+    size: int
+    served: int
+    fetched_on_demand: int
+    failed: int
+
+class PrefetchBuffer: # pylint: disable=too-many-instance-attributes
+    """Bounded buffer of ready items of one source, refilled by a background thread.
+    fetch_one loads one item and returns None if the item is not suitable"""
+
+    def __init__(self, name: str, fetch_one: Callable[[], Optional[Any]],
+    config: Optional[PrefetchConfig] = None):
+        self.name = name
+        self.__fetch_one = fetch_one
+        self.__config = config or get_prefetch_config()
+        self.__items: Deque[Any] = collections.deque(maxlen=max(1, self.__config.high_watermark))
+        self.__condition = threading.Condition()
+        self.__thread: Optional[threading.Thread] = None
+        self.__stopping = False
+        self.__stats = PrefetchStats(0, 0, 0, 0)
+        self.__logger = logging.getLogger(__name__)
+
+    def start(self):
+        """Start the background refill"""
+        with self.__condition:
+            if self.__thread is not None:
+                return
+            self.__stopping = False
+            self.__thread = threading.Thread(target=self.__run,
+                name=f"Prefetch-{self.name}", daemon=True)
+            self.__thread.start()
+
+    def stop(self):
+        """Stop the background refill"""
+        with self.__condition:
+            self.__stopping = True
+            self.__condition.notify_all()
+            thread, self.__thread = self.__thread, None
+        if thread is not None:
+            thread.join()
+
+    def take(self, count: int = 1) -> List[Any]:
+        """Get count items from the buffer. Missing items are loaded right away
+        with concurrent requests, in at most two rounds"""
+        with self.__condition:
+            items = [self.__items.popleft() for _ in range(min(count, len(self.__items)))]
+            self.__stats.served += len(items)
+            self.__condition.notify_all()
+        for _ in range(2):
+            missing = count - len(items)
+            if missing <= 0:
+                break
+            fetched = [item for item in fan_out([self.__fetch] * missing) if item is not None]
+            items.extend(fetched)
+            with self.__condition:
+                self.__stats.fetched_on_demand += len(fetched)
+        return items
+
+    def stats(self) -> PrefetchStats:
+        """Get buffer counters"""
+        with self.__condition:
+            return dataclasses.replace(self.__stats, size=len(self.__items))
+
+    def __run(self):
+        interval = 1 / self.__config.refill_rate if self.__config.refill_rate > 0 else 0
+        refilling = True
+        while True:
+            with self.__condition:
+                if not refilling:
+                    self.__condition.wait_for(lambda: self.__stopping
+                        or len(self.__items) <= self.__config.low_watermark)
+                if self.__stopping:
+                    return
+            item = self.__fetch()
+            with self.__condition:
+                if item is not None:
+                    self.__items.append(item)
+                refilling = len(self.__items) < self.__config.high_watermark
+                # a failed source is retried no more than once per second
+                delay = interval if item is not None else max(interval, 1.0)
+                if delay:
+                    self.__condition.wait_for(lambda: self.__stopping, timeout=delay)
+
+    def __fetch(self) -> Optional[Any]:
+        try:
+            return self.__fetch_one()
+        except Exception as ex: # pylint: disable=broad-except
+            self.__logger.warning("Prefetch %s failed: %s", self.name, ex)
+            with self.__condition:
+                self.__stats.failed += 1
+            return None
+
+def get_prefetch_config() -> PrefetchConfig:
+    """Get prefetch settings from environment variables"""
+    return PrefetchConfig(
+        low_watermark=get_env_int("PREFETCH_LOW_WATERMARK", 3),
+        high_watermark=get_env_int("PREFETCH_HIGH_WATERMARK", 10),
+        refill_rate=get_env_float("PREFETCH_REFILL_RATE", 2.0),
+    )
@@ -0,0 +1,114 @@
+"""The module contains an in-process cache of responses of external APIs"""
+
+import dataclasses
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Set, Tuple, Type
+
+@dataclasses.dataclass(frozen=True)
+class CachePolicy:
+    """Cache settings of an endpoint.
+    A value is fresh for ttl seconds, then for stale_ttl seconds it is still returned
+    while a new value is loaded in the background"""
+    ttl: float
+    stale_ttl: float = 0
+
+@dataclasses.dataclass
+class ResponseCacheStats:
+    """Cache counters"""
+    size: int
+    hits: int
+    stale_hits: int
+    misses: int
+
+    @property
+    def hit_rate(self) -> float:
+        """Share of requests served from the cache"""
+        total = self.hits + self.stale_hits + self.misses
+        return (self.hits + self.stale_hits) / total if total else 0.0
+
+class ResponseCache:
+    """Bounded LRU cache with per-entry TTL and stale-while-revalidate"""
+
+    def __init__(self, max_size: int = 1000, clock: Callable[[], float] = time.monotonic):
+        self.__max_size = max(1, max_size)
+        self.__clock = clock
+        self.__entries: OrderedDict[Hashable, Tuple[float, float, Any]] = OrderedDict()
+        self.__refreshing: Set[Hashable] = set()
+        self.__lock = threading.Lock()
+        self.__counters: Dict[str, int] = {"hits": 0, "stale_hits": 0, "misses": 0}
+
+    def get_or_load(self, key: Hashable, loader: Callable[[], Any], policy: CachePolicy,
+    fallback: Tuple[Type[Exception], ...] = ()) -> Any:
+        """Get the cached value or load it. Errors of the loader are not cached.
+        If the loader fails with one of the fallback errors the expired value is returned"""
+        now = self.__clock()
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is not None:
+                fresh_until, stale_until, value = entry
+                if now < fresh_until:
+                    self.__entries.move_to_end(key)
+                    self.__counters["hits"] += 1
+                    return value
+                if now < stale_until:
+                    self.__entries.move_to_end(key)
+                    self.__counters["stale_hits"] += 1
+                    self.__start_refresh(key, loader, policy)
+                    return value
+            self.__counters["misses"] += 1
+        try:
+            value = loader()
+        except fallback:
+            if entry is None:
+                raise
+            return entry[2]
+        self.put(key, value, policy)
+        return value
+
+    def put(self, key: Hashable, value: Any, policy: CachePolicy):
+        """Save the value"""
+        now = self.__clock()
+        with self.__lock:
+            self.__entries[key] = (now + policy.ttl, now + policy.ttl + policy.stale_ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__max_size:
+                self.__entries.popitem(last=False)
+
+    def peek(self, key: Hashable) -> Tuple[bool, Any]:
+        """Get whether the key is cached and its value, even if it has expired"""
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return False, None
+            self.__counters["stale_hits"] += 1
+            return True, entry[2]
+
+    def invalidate(self, key: Hashable):
+        """Forget the value"""
+        with self.__lock:
+            self.__entries.pop(key, None)
+
+    def stats(self) -> ResponseCacheStats:
+        """Get cache counters"""
+        with self.__lock:
+            return ResponseCacheStats(size=len(self.__entries), **self.__counters)
+
+    def __start_refresh(self, key: Hashable, loader: Callable[[], Any], policy: CachePolicy):
+        """Load a new value in the background, one refresh per key at a time"""
+        if key in self.__refreshing:
+            return
+        self.__refreshing.add(key)
+        threading.Thread(target=self.__refresh, args=(key, loader, policy),
+            name="ResponseCacheRefresh", daemon=True).start()
+
+    def __refresh(self, key: Hashable, loader: Callable[[], Any], policy: CachePolicy):
+        try:
+            self.put(key, loader(), policy)
+        except Exception as ex: # pylint: disable=broad-except
+            logging.getLogger(__name__).warning("Failed to refresh cached response: %s", ex)
+        finally:
+            with self.__lock:
+                self.__refreshing.discard(key)
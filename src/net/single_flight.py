@@ -0,0 +1,62 @@
+"""The module contains coalescing of identical concurrent calls"""
+
+import dataclasses
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+@dataclasses.dataclass
+class _Call:
+    """Call in flight, followers wait for its result"""
+    done: threading.Event = dataclasses.field(default_factory=threading.Event)
+    value: Any = None
+    error: Optional[BaseException] = None
+
+@dataclasses.dataclass
+class SingleFlightStats:
+    """Coalescing counters"""
+    in_flight: int
+    calls: int
+    shared: int
+
+class SingleFlight:
+    """Runs one call per key at a time. Callers that come with the same key while
+    the call is in flight wait for it and get the same result or error.
+    The result is shared, callers must not change it"""
+
+    def __init__(self):
+        self.__calls: Dict[Hashable, _Call] = {}
+        self.__lock = threading.Lock()
+        self.__counters: Dict[str, int] = {"calls": 0, "shared": 0}
+
+    def do(self, key: Hashable, function: Callable[[], Any]) -> Tuple[Any, bool]:
+        """Call the function or wait for the call in flight with the key.
+        Get the result and whether it was shared with another caller"""
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self.__calls[key] = call
+                self.__counters["calls"] += 1
+            else:
+                self.__counters["shared"] += 1
+        if leader:
+            try:
+                call.value = function()
+            except BaseException as ex:
+                call.error = ex
+                raise
+            finally:
+                with self.__lock:
+                    del self.__calls[key]
+                call.done.set()
+            return call.value, False
+        call.done.wait()
+        if call.error is not None:
+            raise call.error
+        return call.value, True
+
+    def stats(self) -> SingleFlightStats:
+        """Get coalescing counters"""
+        with self.__lock:
+            return SingleFlightStats(in_flight=len(self.__calls), **self.__counters)
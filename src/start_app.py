@@ -1,15 +1,33 @@
 """Application setup and configuration"""
 
+import asyncio
 import logging
+import multiprocessing
+import queue
 import sys
 import os
-from typing import List
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List
 import telebot
+from telebot.async_telebot import AsyncTeleBot
+from telebot import types
 from telebot.callback_data import CallbackData
-from load_atomic import load_atomic_functions
-from bot_middleware import Middleware
+from load_atomic import LazyAtomicFunction, load_atomic_functions, load_lazy_atomic_functions
+from load_atomic import PluginReport, count_handlers, log_plugin_reports
+from bot_middleware import Middleware, AsyncMiddleware
 from bot_callback_filter import BotCallbackCustomFilter
+from bot_async import AsyncBotCallbackCustomFilter, SyncBotAdapter
 from bot_func_abc import AtomicBotFunctionABC
+from bot_dispatcher import UpdateDispatcher
+from bot_env import get_env_float, get_env_int
+from bot_metrics import get_metrics
+from bot_logging import get_rotating_handler, start_queued_logging
+from bot_router import LazyFunctionRouter, RoutedTeleBot, RoutedAsyncTeleBot
+from bot_webhook import WebhookConfig, WebhookServer
+from bot_state import StateHandlerBackend, create_state_store
+from net.async_http_client import get_async_http_client
+from net.http_client import get_http_client
 from functions.defoult_bot_function import DefoultBotFunction
 
 class StartApp():
@@ -18,34 +36,185 @@ class StartApp():
     _LOGLEVEL_ENV_KEY = "LOGLEVEL"
     _TBOT_LOGLEVEL_ENV_KEY = "TBOT_LOGLEVEL"
     _TBOTTOKEN_ENV_KEY = "TBOTTOKEN"
+    _DISPATCH_WORKERS_ENV_KEY = "DISPATCH_WORKERS"
+    _DISPATCH_QUEUE_SIZE_ENV_KEY = "DISPATCH_QUEUE_SIZE"
+    _DISPATCH_STATS_INTERVAL_ENV_KEY = "DISPATCH_STATS_INTERVAL"
+    _RUNTIME_ENV_KEY = "BOT_RUNTIME"
+    _ATOMIC_LOADING_ENV_KEY = "ATOMIC_LOADING"
+    _STARTUP_REPORT_PATH_ENV_KEY = "STARTUP_REPORT_PATH"
+    _LOG_PATH_ENV_KEY = "LOG_PATH"
+    _LOG_MAX_BYTES_ENV_KEY = "LOG_MAX_BYTES"
+    _LOG_BACKUP_COUNT_ENV_KEY = "LOG_BACKUP_COUNT"
+    _LOG_COMPRESS_ENV_KEY = "LOG_COMPRESS"
+    _LOG_QUEUE_SIZE_ENV_KEY = "LOG_QUEUE_SIZE"
+    _LOG_SAMPLE_RATE_ENV_KEY = "LOG_SAMPLE_RATE"
+    _UPDATES_MODE_ENV_KEY = "UPDATES_MODE"
+    _STATE_STORE_ENV_KEY = "STATE_STORE"
+    _STATE_SQLITE_PATH_ENV_KEY = "STATE_SQLITE_PATH"
+    _STATE_TTL_ENV_KEY = "STATE_TTL"
+    _CONECTION_PGDB_ENV_KEY = "CONECTION_PGDB"
 
     keyboard_factory: CallbackData
 
     def __init__(self, start_comannds: List[str]):
         self.logger = self.get_logger()
-        self.bot = self.__get_bot()
-        self.atom_functions_list = load_atomic_functions()
-        self.__decorate_atomic_functions()
+        self.is_async = os.environ.get(self._RUNTIME_ENV_KEY, "").lower() == "async"
+        if self.is_async:
+            self.bot = self.__get_async_bot()
+            self.dispatcher = None
+        else:
+            self.bot = self.__get_bot()
+            self.dispatcher = self.__get_dispatcher()
+        reports: List[PluginReport] = []
+        if os.environ.get(self._ATOMIC_LOADING_ENV_KEY, "lazy").lower() == "eager":
+            self.atom_functions_list = load_atomic_functions(reports=reports)
+        else:
+            self.atom_functions_list = load_lazy_atomic_functions(reports=reports)
+        self.__decorate_atomic_functions(reports)
+        log_plugin_reports(reports, self.logger,
+            os.environ.get(self._STARTUP_REPORT_PATH_ENV_KEY))
+        self.router = LazyFunctionRouter(self.bot, self.atom_functions_list,
+            self.__set_handlers, self.logger)
+        self.__get_next_step_backend().load_owner = self.router.load_function
         self.__decorate_defoult_functions(start_comannds, self.atom_functions_list)
         self.__add_middleware()
         self.__add_filter()
+        get_metrics().set_gauges("bot_response_cache", get_http_client().cache.stats,
+            ("size", "hits", "stale_hits", "misses", "hit_rate"))
+
+    def start(self):
+        """Start receiving updates by long polling or, with UPDATES_MODE=webhook, by the webhook"""
+        if os.environ.get(self._UPDATES_MODE_ENV_KEY, "").lower() == "webhook":
+            self.start_webhook()
+        else:
+            self.start_polling()
 
     def start_polling(self):
         """Start receiving messages"""
         self.logger.critical('-= START =-')
-        self.bot.infinity_polling()
+        if self.is_async:
+            asyncio.run(self.__async_polling())
+            return
+        self.dispatcher.start()
+        try:
+            self.bot.infinity_polling()
+        finally:
+            self.dispatcher.stop()
+            self.middleware.close()
+
+    async def __async_polling(self):
+        """Receive messages on AsyncTeleBot"""
+        try:
+            await self.bot.infinity_polling()
+        finally:
+            await get_async_http_client().close()
+            await self.bot.close_session()
+            self.middleware.close()
+
+    def start_webhook(self):
+        """Start the webhook server and set the webhook if WEBHOOK_URL is set.
+        Blocks until the process is interrupted"""
+        self.logger.critical('-= START WEBHOOK =-')
+        if self.is_async:
+            asyncio.run(self.__async_webhook())
+            return
+        self.dispatcher.start()
+        config = WebhookConfig.from_env()
+        server = self.__start_webhook_server(self.bot.process_new_updates, config)
+        try:
+            if config.url:
+                self.bot.set_webhook(**config.get_webhook_params())
+            threading.Event().wait()
+        finally:
+            server.stop()
+            self.dispatcher.stop()
+            self.middleware.close()
+
+    async def __async_webhook(self):
+        """Receive updates by the webhook on AsyncTeleBot"""
+        loop = asyncio.get_running_loop()
+
+        def process_updates(updates: List[types.Update]):
+            asyncio.run_coroutine_threadsafe(self.bot.process_new_updates(updates), loop)
+
+        config = WebhookConfig.from_env()
+        server = self.__start_webhook_server(process_updates, config)
+        try:
+            if config.url:
+                await self.bot.set_webhook(**config.get_webhook_params())
+            await asyncio.Event().wait()
+        finally:
+            server.stop()
+            await get_async_http_client().close()
+            await self.bot.close_session()
+            self.middleware.close()
+
+    def start_worker(self, updates: multiprocessing.Queue, heartbeat: Any):
+        """Process batches of updates that the supervisor puts into the queue until None.
+        The heartbeat value is set to the current time while the worker takes updates"""
+        self.logger.critical('-= START WORKER =-')
+        if self.is_async:
+            asyncio.run(self.__async_worker(updates, heartbeat))
+            return
+        self.dispatcher.start()
+        try:
+            for batch in self.__receive_updates(updates, heartbeat):
+                self.bot.process_new_updates(batch)
+        finally:
+            self.dispatcher.stop()
+            self.middleware.close()
+
+    async def __async_worker(self, updates: multiprocessing.Queue, heartbeat: Any):
+        """Process updates from the supervisor on AsyncTeleBot"""
+        batches = self.__receive_updates(updates, heartbeat)
+        tasks = set()
+        try:
+            while (batch := await asyncio.to_thread(next, batches, None)) is not None:
+                task = asyncio.create_task(self.bot.process_new_updates(batch))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            await asyncio.gather(*tasks)
+        finally:
+            await get_async_http_client().close()
+            await self.bot.close_session()
+            self.middleware.close()
+
+    @staticmethod
+    def __receive_updates(updates: multiprocessing.Queue,
+    heartbeat: Any) -> Iterator[List[types.Update]]:
+        """Get batches of updates from the queue, the heartbeat is set at least once a second"""
+        while True:
+            heartbeat.value = time.time()
+            try:
+                batch = updates.get(timeout=1)
+            except queue.Empty:
+                continue
+            if batch is None:
+                return
+            yield [types.Update.de_json(update) for update in batch]
+
+    def __start_webhook_server(self, process_updates: Callable[[List[types.Update]], None],
+    config: WebhookConfig) -> WebhookServer:
+        """Start a webhook server"""
+        server = WebhookServer(process_updates, self.logger, config.path, config.secret_token)
+        server.start(config.host, config.port, config.workers)
+        return server
 
     def get_logger(self)-> logging.Logger:
-        """Get a configured logger"""
+        """Get a configured logger. Records are written by a background thread:
+        to rotated JSON lines files and to the console"""
         log = logging.getLogger(__name__)
         log.setLevel(self.__get_log_level(self._LOGLEVEL_ENV_KEY))
-        handler = logging.FileHandler(f"{__name__}.log")
+        handler = get_rotating_handler(os.environ.get(self._LOG_PATH_ENV_KEY, f"{__name__}.log"),
+            max_bytes=get_env_int(self._LOG_MAX_BYTES_ENV_KEY, 10 * 1024 * 1024),
+            backup_count=get_env_int(self._LOG_BACKUP_COUNT_ENV_KEY, 5),
+            compress=os.environ.get(self._LOG_COMPRESS_ENV_KEY, "gzip").lower() == "gzip")
         formatter = logging.Formatter("%(name)s %(asctime)s %(levelname)s %(message)s")
-        handler.setFormatter(formatter)
-        log.addHandler(handler)
         console_handler = logging.StreamHandler(sys.stderr)
         console_handler.setFormatter(formatter)
-        log.addHandler(console_handler)
+        start_queued_logging(log, [handler, console_handler],
+            queue_size=get_env_int(self._LOG_QUEUE_SIZE_ENV_KEY, 10000),
+            sample_rate=get_env_float(self._LOG_SAMPLE_RATE_ENV_KEY, 1.0))
         return log
 
     def __get_log_level(self, env_key: str) -> int:
@@ -61,30 +230,114 @@ class StartApp():
         token = os.environ[self._TBOTTOKEN_ENV_KEY]
         log_level = self.__get_log_level(self._TBOT_LOGLEVEL_ENV_KEY)
         telebot.logger.setLevel(log_level)
-        new_bot = telebot.TeleBot(token, use_class_middlewares=True)
+        new_bot = RoutedTeleBot(token, threaded=False, use_class_middlewares=True,
+            next_step_backend=self.__create_next_step_backend())
+        return new_bot
+
+    def __get_async_bot(self)-> AsyncTeleBot:
+        """Get a configured asyncio bot"""
+        token = os.environ[self._TBOTTOKEN_ENV_KEY]
+        log_level = self.__get_log_level(self._TBOT_LOGLEVEL_ENV_KEY)
+        telebot.logger.setLevel(log_level)
+        new_bot = RoutedAsyncTeleBot(token)
+        SyncBotAdapter.for_bot(new_bot, self.__create_next_step_backend())
+        process_updates = new_bot.process_new_updates
+
+        async def process_new_updates(updates: List[types.Update]):
+            if self.router.has_unloaded_functions(updates):
+                await asyncio.to_thread(self.router.load_functions, updates)
+            await process_updates(updates)
+
+        new_bot.process_new_updates = process_new_updates
         return new_bot
 
+    def __create_next_step_backend(self)-> StateHandlerBackend:
+        """Get a next step handler backend with the store from STATE_STORE:
+        memory, sqlite (STATE_SQLITE_PATH) or postgres (CONECTION_PGDB)"""
+        kind = os.environ.get(self._STATE_STORE_ENV_KEY, "memory").lower()
+        connection_string = os.environ.get(self._CONECTION_PGDB_ENV_KEY)
+        if kind == "sqlite":
+            path = os.environ.get(self._STATE_SQLITE_PATH_ENV_KEY, "bot_state.db")
+            connection_string = f"sqlite:///{path}"
+        self.logger.info("Next step handlers are kept in the %s state store", kind)
+        return StateHandlerBackend(create_state_store(kind, connection_string), self.logger,
+            ttl=get_env_float(self._STATE_TTL_ENV_KEY, 3600))
+
+    def __get_next_step_backend(self)-> StateHandlerBackend:
+        """Get the next step handler backend of the bot"""
+        if self.is_async:
+            return SyncBotAdapter.for_bot(self.bot).next_step_backend
+        return self.bot.next_step_backend
+
+    def __get_dispatcher(self)-> UpdateDispatcher:
+        """Get a dispatcher that processes bot updates in a worker pool"""
+        process_updates = self.bot.process_new_updates
+
+        def process_new_updates(updates: List[types.Update]):
+            if self.router.has_unloaded_functions(updates):
+                self.router.load_functions(updates)
+            process_updates(updates)
+
+        dispatcher = UpdateDispatcher(
+            process_new_updates,
+            self.logger,
+            workers=get_env_int(self._DISPATCH_WORKERS_ENV_KEY, 4),
+            queue_size=get_env_int(self._DISPATCH_QUEUE_SIZE_ENV_KEY, 100),
+            stats_interval=get_env_int(self._DISPATCH_STATS_INTERVAL_ENV_KEY, 0),
+        )
+
+        def submit_updates(updates: List[types.Update]):
+            # The polling loop takes the next offset from last_update_id,
+            # queued updates must not be requested again
+            for update in updates:
+                self.bot.last_update_id = max(self.bot.last_update_id, update.update_id)
+            dispatcher.submit(updates)
+
+        self.bot.process_new_updates = submit_updates
+        get_metrics().set_gauge("bot_dispatch_queue_depth", lambda: dispatcher.stats().queue_depth)
+        return dispatcher
+
     def __add_middleware(self):
         """Registering Middleware for Bot"""
-        self.bot.setup_middleware(Middleware(self.logger, self.bot))
+        if self.is_async:
+            adapter = SyncBotAdapter.for_bot(self.bot)
+            self.middleware = Middleware(self.logger, adapter)
+            self.bot.setup_middleware(AsyncMiddleware(self.middleware))
+        else:
+            self.middleware = Middleware(self.logger, self.bot)
+            self.bot.setup_middleware(self.middleware)
 
     def __add_filter(self):
         """Add a custom filter for the bot"""
-        self.bot.add_custom_filter(BotCallbackCustomFilter())
+        if self.is_async:
+            self.bot.add_custom_filter(AsyncBotCallbackCustomFilter())
+        else:
+            self.bot.add_custom_filter(BotCallbackCustomFilter())
 
-    def __decorate_atomic_functions(self):
-        """Decorate handlers functions"""
+    def __decorate_atomic_functions(self, reports: List[PluginReport]):
+        """Decorate handlers functions and add their time and number of handlers to reports"""
         self.logger.info("Number of modules found - %d", len(self.atom_functions_list))
+        module_reports: Dict[str, PluginReport] = {report.module: report for report in reports}
         for funct in self.atom_functions_list:
+            report = module_reports.get(getattr(funct, "module_name", type(funct).__module__))
             try:
                 if funct.state:
-                    funct.set_handlers(self.bot)
+                    start = time.perf_counter()
+                    handlers = count_handlers(self.bot)
+                    self.__set_handlers(funct)
+                    if report:
+                        report.handlers_time += time.perf_counter() - start
+                        report.handlers += count_handlers(self.bot) - handlers
                     self.logger.info("%s - start OK!", funct)
                 else:
+                    if report:
+                        report.status = "disabled"
                     self.logger.info("%s - state FALSE!", funct)
             except Exception as ex: # pylint: disable=broad-except
                 self.logger.error(ex)
                 funct.state = False
+                if report:
+                    report.status, report.error = "failed", repr(ex)
                 self.logger.warning("%s - start EXCEPTION!", funct)
 
     def __decorate_defoult_functions(self, start_comannds: List[str],
@@ -93,4 +346,13 @@ class StartApp():
         and the function for handling uncaught messages"""
 
         defouit_function = DefoultBotFunction(start_comannds, functions_list)
-        defouit_function.set_handlers(self.bot)
+        self.__set_handlers(defouit_function)
+
+    def __set_handlers(self, funct: AtomicBotFunctionABC):
+        """Register function handlers for the current runtime"""
+        if not isinstance(funct, LazyAtomicFunction):
+            self.__get_next_step_backend().register_owner(funct)
+        if self.is_async:
+            funct.set_async_handlers(self.bot)
+        else:
+            funct.set_handlers(self.bot)
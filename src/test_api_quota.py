@@ -0,0 +1,140 @@
+"""The module contains tests for quotas of metered APIs"""
+
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import requests
+from bot_threading import wait_event
+from net.api_quota import ApiQuota, QuotaExceededError, QuotaLimit, QuotaPolicy, SqlQuotaStore
+
+POLICY = QuotaPolicy("test", "TEST_API_KEYS", limits=(QuotaLimit(3, 60),),
+    key_param="api_key", default_key="DEMO", default_limits=(QuotaLimit(1, 60),), max_wait=0)
+
+class FakeClock:
+    """Manually advanced clock"""
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class BlockingStore:
+    """Store that waits for the release event while counters are added"""
+    def __init__(self):
+        self.adding = threading.Event()
+        self.release = threading.Event()
+        self.added = []
+
+    def add(self, api, counters): # pylint: disable=unused-argument
+        """Wait for the release and remember the counters"""
+        self.adding.set()
+        wait_event(self.release, 5)
+        self.added.append(dict(counters))
+
+    def purge(self, api, first_buckets):
+        """Purge nothing"""
+
+    def load(self, api): # pylint: disable=unused-argument
+        """Get the added counters"""
+        counters = {}
+        for added in self.added:
+            for bucket, count in added.items():
+                counters[bucket] = counters.get(bucket, 0) + count
+        return counters
+
+def get_response(status: int, **headers: str) -> requests.Response:
+    """Get a response with the status and headers"""
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update({name.replace("_", "-"): value for name, value in headers.items()})
+    return response
+
+class TestApiQuota(unittest.TestCase):
+    """Unittest API quota"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+
+    def get_quota(self, keys: str = "a,b", store=None) -> ApiQuota:
+        """Get a quota with the keys"""
+        with mock.patch.dict(os.environ, {"TEST_API_KEYS": keys}):
+            return ApiQuota(POLICY, store, self.clock)
+
+    def test_rotation(self):
+        """Requests are spread between keys until all quotas are used up"""
+        quota = self.get_quota()
+        keys = [quota.acquire() for _ in range(6)]
+        self.assertEqual(sorted(keys), ["a", "a", "a", "b", "b", "b"])
+        self.assertTrue(quota.is_low())
+        self.assertRaises(QuotaExceededError, quota.acquire)
+        self.clock.now += 61
+        self.assertIn(quota.acquire(), ("a", "b"))
+
+    def test_default_key(self):
+        """Without keys the default key is used with its limits"""
+        quota = self.get_quota("")
+        self.assertEqual(quota.acquire(), "DEMO")
+        self.assertRaises(QuotaExceededError, quota.acquire)
+
+    def test_headers(self):
+        """Rate limit headers and 429 responses lower the quota of the key"""
+        quota = self.get_quota()
+        quota.record("a", get_response(200, X_RateLimit_Remaining="1", X_RateLimit_Limit="40"))
+        self.assertEqual([quota.acquire() for _ in range(2)], ["b", "b"])
+        quota.record("b", get_response(429, Retry_After="30"))
+        self.assertEqual(quota.acquire(), "a")
+        self.clock.now += 31
+        self.assertEqual(quota.acquire(), "b")
+
+    def test_reported_expiry(self):
+        """The last reported request blocks the key for a window, reported counts expire"""
+        quota = self.get_quota("a")
+        quota.record("a", get_response(200, X_RateLimit_Remaining="1", X_RateLimit_Limit="3"))
+        self.assertEqual(quota.acquire(), "a")
+        with self.assertRaisesRegex(QuotaExceededError, "60 seconds"):
+            quota.acquire()
+        self.clock.now += 61
+        quota.record("a", get_response(200, X_RateLimit_Remaining="1", X_RateLimit_Limit="3"))
+        quota.release("a")
+        self.assertEqual(quota.acquire(), "a")
+        quota.record("a", get_response(200, X_RateLimit_Remaining="1", X_RateLimit_Limit="3"))
+        self.clock.now += 61
+        self.assertEqual([quota.acquire() for _ in range(2)], ["a", "a"])
+
+    def test_save_outside_lock(self):
+        """Requests are counted while another caller saves, the counts are kept after the save"""
+        store = BlockingStore()
+        quota = self.get_quota("a", store)
+        saving = threading.Thread(target=quota.acquire)
+        saving.start()
+        self.assertTrue(wait_event(store.adding, 5))
+        self.assertEqual([quota.acquire() for _ in range(2)], ["a", "a"])
+        store.release.set()
+        saving.join(5)
+        self.assertRaises(QuotaExceededError, quota.acquire)
+        self.clock.now += ApiQuota.SAVE_INTERVAL
+        self.assertRaises(QuotaExceededError, quota.acquire)
+        self.assertEqual(sum(store.load("test").values()), 3)
+
+    def test_apply(self):
+        """The key is added to the query parameters"""
+        self.assertEqual(POLICY.apply("a", {"params": {"q": 1}}),
+            {"params": {"q": 1, "api_key": "a"}})
+
+    def test_saved_counters(self):
+        """Counters are read by a quota of a new process"""
+        with tempfile.TemporaryDirectory() as directory:
+            store = SqlQuotaStore(f"sqlite:///{os.path.join(directory, 'quota.db')}")
+            quota = self.get_quota("a", store)
+            quota.acquire()
+            quota.acquire()
+            quota.save()
+            other = self.get_quota("a", store)
+            other.acquire()
+            self.assertRaises(QuotaExceededError, other.acquire)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+"""The module contains tests for the shared asyncio HTTP client"""
+
+import asyncio
+import unittest
+import aiohttp
+from net.async_http_client import AsyncHttpClient
+from net.http_client import HttpClientConfig
+from test_http_client import JsonHandler, LocalServerTestCase
+
+class _Handler(JsonHandler):
+    """Responds 503 to the first request of /retry, 404 to /missing, otherwise 200"""
+    requests = []
+
+    def get_status(self) -> int:
+        _Handler.requests.append(self.path)
+        if self.path == "/missing":
+            return 404
+        if self.path == "/retry" and _Handler.requests.count(self.path) == 1:
+            return 503
+        return 200
+
+class TestAsyncHttpClient(LocalServerTestCase):
+    """Unittest asyncio HTTP client"""
+    handler = _Handler
+
+    def setUp(self):
+        _Handler.requests.clear()
+
+    def get(self, path: str):
+        """Send a GET request with a new client"""
+        async def get():
+            client = AsyncHttpClient(HttpClientConfig(retries=2, backoff_factor=0,
+                backoff_jitter=0))
+            try:
+                return await client.get(f"{self.url}{path}")
+            finally:
+                await client.close()
+        return asyncio.run(get())
+
+    def test_retry(self):
+        """Server errors are retried"""
+        response = self.get("/retry")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), {"ok": True})
+        self.assertEqual(_Handler.requests, ["/retry", "/retry"])
+
+    def test_error_status(self):
+        """Client errors are not retried and raise ClientResponseError"""
+        response = self.get("/missing")
+        self.assertEqual(_Handler.requests, ["/missing"])
+        with self.assertRaises(aiohttp.ClientResponseError) as context:
+            response.raise_for_status()
+        self.assertEqual(context.exception.status, 404)
+        self.assertIn("/missing", str(context.exception))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,102 @@
+"""The module contains tests for running synchronous functions on AsyncTeleBot"""
+
+import asyncio
+import threading
+import unittest
+from telebot import types
+from telebot.async_telebot import AsyncTeleBot
+from telebot.callback_data import CallbackData
+from bot_async import AsyncBotCallbackCustomFilter, SyncBotAdapter
+from bot_middleware import AsyncMiddleware
+
+CHAT = {"id": 1, "type": "private"}
+USER = {"id": 1, "is_bot": False, "first_name": "user"}
+
+def new_message(update_id: int, text: str) -> types.Update:
+    """Create an update with a text message"""
+    return types.Update.de_json({"update_id": update_id, "message": {
+        "message_id": update_id, "date": 0, "chat": CHAT, "from": USER, "text": text}})
+
+def new_callback_query(update_id: int, data: str) -> types.Update:
+    """Create an update with a callback query"""
+    return types.Update.de_json({"update_id": update_id, "callback_query": {
+        "id": str(update_id), "from": USER, "chat_instance": "1", "data": data}})
+
+class RecordingMiddleware:
+    """Synchronous middleware that records the updates it sees"""
+
+    def __init__(self):
+        self.update_types = ["message"]
+        self.calls = []
+
+    def pre_process_message(self, message, data):
+        """Record the message before handlers"""
+        data["thread"] = threading.current_thread()
+        self.calls.append(("pre", message.text))
+
+    def post_process_message(self, message, data, exception=None):
+        """Record the message after handlers"""
+        self.calls.append(("post", message.text, exception, "thread" in data))
+
+class TestSyncBotAdapter(unittest.TestCase):
+    """Unittest synchronous handlers on AsyncTeleBot"""
+
+    def setUp(self):
+        self.bot = AsyncTeleBot("1:test")
+        self.adapter = SyncBotAdapter.for_bot(self.bot)
+        self.handled = []
+
+    def process(self, *updates: types.Update):
+        """Process the updates by the bot"""
+        asyncio.run(self.bot.process_new_updates(list(updates)))
+
+    def test_sync_handler(self):
+        """A synchronous handler runs in a worker thread"""
+        @self.adapter.message_handler(commands=["start"])
+        def start(message):
+            self.handled.append((message.text, threading.current_thread()))
+        self.process(new_message(1, "/start"))
+        self.assertEqual(len(self.handled), 1)
+        self.assertEqual(self.handled[0][0], "/start")
+        self.assertIsNot(self.handled[0][1], threading.main_thread())
+        self.assertIs(SyncBotAdapter.for_bot(self.bot), self.adapter)
+
+    def test_next_step(self):
+        """The next message of the chat goes to the next step handler once"""
+        @self.adapter.message_handler(func=lambda message: True)
+        def text(message):
+            self.handled.append(("text", message.text))
+            self.adapter.register_next_step_handler(message, self.__next_step, "!")
+        self.process(new_message(1, "RU"))
+        self.process(new_message(2, "US"))
+        self.process(new_message(3, "VA"))
+        self.assertEqual(self.handled, [("text", "RU"), ("next", "US!"), ("text", "VA")])
+
+    def __next_step(self, message, suffix):
+        self.handled.append(("next", message.text + suffix))
+
+    def test_callback_filter(self):
+        """Callback queries are routed by the callback data filter"""
+        factory = CallbackData("button", prefix="start")
+        self.bot.add_custom_filter(AsyncBotCallbackCustomFilter())
+        @self.adapter.callback_query_handler(func=None, config=factory.filter(button="a"))
+        def button(call):
+            self.handled.append(call.data)
+        self.process(new_callback_query(1, factory.new(button="b")),
+            new_callback_query(2, factory.new(button="a")))
+        self.assertEqual(self.handled, ["start:a"])
+
+    def test_middleware(self):
+        """The synchronous middleware runs around handlers in worker threads"""
+        middleware = RecordingMiddleware()
+        self.bot.setup_middleware(AsyncMiddleware(middleware))
+        @self.adapter.message_handler(commands=["start"])
+        def start(message):
+            self.handled.append(message.text)
+        self.process(new_message(1, "/start"))
+        self.assertEqual(self.handled, ["/start"])
+        self.assertEqual(middleware.calls, [("pre", "/start"), ("post", "/start", None, True)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+"""The module contains tests for the update dispatcher"""
+
+import logging
+import threading
+import time
+import unittest
+from telebot import types
+from bot_dispatcher import UpdateDispatcher
+from bot_threading import wait_event
+
+def new_update(update_id: int, chat_id: int, text: str = "/start") -> types.Update:
+    """Create a message update for tests"""
+    return types.Update.de_json({
+        "update_id": update_id,
+        "message": {
+            "message_id": update_id,
+            "date": 0,
+            "text": text,
+            "chat": {"id": chat_id, "type": "private"},
+            "from": {"id": chat_id, "is_bot": False, "first_name": "Test"},
+        },
+    })
+
+class TestUpdateDispatcher(unittest.TestCase):
+    """Unittest update dispatcher"""
+
+    def setUp(self):
+        self.logger = logging.getLogger(__name__)
+        self.lock = threading.Lock()
+        self.processed = []
+
+    def __process(self, updates):
+        time.sleep(0.001)
+        with self.lock:
+            self.processed.extend(updates)
+
+    def test_chat_order(self):
+        """Updates of one chat are processed in the order of arrival"""
+        dispatcher = UpdateDispatcher(self.__process, self.logger, workers=4, queue_size=8)
+        dispatcher.start()
+        updates = [new_update(i, i % 3) for i in range(60)]
+        dispatcher.submit(updates)
+        dispatcher.stop()
+        self.assertEqual(len(self.processed), len(updates))
+        for chat_id in range(3):
+            ids = [u.update_id for u in self.processed if u.message.chat.id == chat_id]
+            self.assertEqual(ids, sorted(ids))
+
+    def test_slow_chat_does_not_block_others(self):
+        """A slow handler occupies only one worker"""
+        slow_release = threading.Event()
+        fast_done = threading.Event()
+
+        def process(updates):
+            if updates[0].message.chat.id == 0:
+                wait_event(slow_release, 5)
+            else:
+                fast_done.set()
+
+        dispatcher = UpdateDispatcher(process, self.logger, workers=2, queue_size=4)
+        dispatcher.start()
+        dispatcher.submit([new_update(1, 0), new_update(2, 1)])
+        self.assertTrue(wait_event(fast_done, 5))
+        slow_release.set()
+        dispatcher.stop()
+
+    def test_slow_chat_does_not_block_any_chat(self):
+        """While a slow chat holds one worker, the other workers process all other chats,
+        and updates of one chat are never processed at the same time"""
+        slow_release = threading.Event()
+        fast_done = threading.Event()
+        running = set()
+        overlaps = []
+
+        def process(updates):
+            chat_id = updates[0].message.chat.id
+            with self.lock:
+                if chat_id in running:
+                    overlaps.append(chat_id)
+                running.add(chat_id)
+            if chat_id == 0:
+                wait_event(slow_release, 5)
+            else:
+                time.sleep(0.001)
+                with self.lock:
+                    self.processed.extend(updates)
+                    if len(self.processed) == 40:
+                        fast_done.set()
+            with self.lock:
+                running.discard(chat_id)
+
+        dispatcher = UpdateDispatcher(process, self.logger, workers=2, queue_size=100)
+        dispatcher.start()
+        dispatcher.submit([new_update(0, 0)] + [new_update(i, 2 * (i % 4) + 2)
+            for i in range(1, 41)])
+        self.assertTrue(wait_event(fast_done, 5))
+        slow_release.set()
+        dispatcher.stop()
+        self.assertEqual(overlaps, [])
+
+    def test_stats(self):
+        """Counters reflect processed and failed updates"""
+        def process(updates):
+            if updates[0].update_id == 2:
+                raise ValueError("handler error")
+
+        dispatcher = UpdateDispatcher(process, self.logger, workers=1, queue_size=4)
+        dispatcher.start()
+        dispatcher.submit([new_update(1, 1), new_update(2, 1), new_update(3, 1)])
+        dispatcher.stop()
+        stats = dispatcher.stats()
+        self.assertEqual(stats.submitted, 3)
+        self.assertEqual(stats.processed, 2)
+        self.assertEqual(stats.failed, 1)
+        self.assertEqual(stats.queue_depth, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
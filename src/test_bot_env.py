@@ -0,0 +1,23 @@
+"""The module contains tests for numeric settings from environment variables"""
+
+import os
+import unittest
+from unittest import mock
+from bot_env import get_env_float, get_env_int
+
+class TestBotEnv(unittest.TestCase):
+    """Unittest environment settings"""
+
+    def test_numbers(self):
+        """Set values are parsed, missing and invalid values give the default"""
+        with mock.patch.dict(os.environ, {"A": "2.5", "B": "-3", "C": "x", "D": "inf"}):
+            self.assertEqual(get_env_float("A", 1), 2.5)
+            self.assertEqual(get_env_int("A", 1), 2)
+            self.assertEqual(get_env_int("B", 1), -3)
+            self.assertEqual(get_env_float("C", 1.5), 1.5)
+            self.assertEqual(get_env_int("D", 7), 7)
+            self.assertEqual(get_env_int("MISSING", 4), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
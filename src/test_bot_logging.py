@@ -0,0 +1,57 @@
+"""The module contains tests for the queued logging pipeline"""
+
+import gzip
+import json
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+from bot_logging import SAMPLED, get_rotating_handler, start_queued_logging
+
+class TestQueuedLogging(unittest.TestCase):
+    """Unittest queued logging"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.path = Path(self.temp_dir.name) / "bot.log"
+        self.logger = logging.getLogger(f"{__name__}.{self.id()}")
+        self.logger.setLevel(logging.INFO)
+        self.logger.propagate = False
+
+    def tearDown(self):
+        for handler in list(self.logger.handlers):
+            self.logger.removeHandler(handler)
+        self.temp_dir.cleanup()
+
+    def start(self, max_bytes: int = 0, sample_rate: float = 1.0):
+        """Start logging to the JSON lines file"""
+        handler = get_rotating_handler(str(self.path), max_bytes, backup_count=2, compress=True)
+        return start_queued_logging(self.logger, [handler], sample_rate=sample_rate), handler
+
+    def test_json_lines(self):
+        """Messages are formatted by the listener, sampled records are dropped"""
+        listener, handler = self.start(sample_rate=0)
+        self.logger.info("update %s", 1, extra=SAMPLED)
+        self.logger.warning("chat %s failed", 42)
+        listener.stop()
+        handler.close()
+        lines = self.path.read_text(encoding="utf-8").splitlines()
+        self.assertEqual(len(lines), 1)
+        entry = json.loads(lines[0])
+        self.assertEqual((entry["level"], entry["message"]), ("WARNING", "chat 42 failed"))
+
+    def test_gzip_rotation(self):
+        """Rotated files are compressed"""
+        listener, handler = self.start(max_bytes=200)
+        for index in range(10):
+            self.logger.info("message number %d", index)
+        listener.stop()
+        handler.close()
+        rotated = Path(f"{self.path}.1.gz")
+        self.assertTrue(rotated.exists())
+        with gzip.open(rotated, "rt", encoding="utf-8") as file:
+            self.assertIn("message number", file.readline())
+
+
+if __name__ == '__main__':
+    unittest.main()
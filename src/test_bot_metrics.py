@@ -0,0 +1,74 @@
+"""The module contains tests for the bot metrics"""
+
+import logging
+import tempfile
+import unittest
+from pathlib import Path
+from urllib.request import urlopen
+from bot_metrics import Histogram, MetricsExporter, MetricsRegistry
+from net.response_cache import ResponseCacheStats
+
+class TestMetrics(unittest.TestCase):
+    """Unittest metrics registry and export"""
+
+    def setUp(self):
+        self.registry = MetricsRegistry(max_series=2)
+
+    def test_histogram_quantiles(self):
+        """Quantiles are interpolated inside buckets"""
+        histogram = Histogram(buckets=(1, 2, 4))
+        for value in (0.5, 1.5, 1.5, 3):
+            histogram.observe(value)
+        self.assertAlmostEqual(histogram.quantile(0.5), 1.5)
+        self.assertAlmostEqual(histogram.quantile(1), 4)
+        self.assertEqual(histogram.count, 4)
+
+    def test_render(self):
+        """Metrics are rendered in the Prometheus text format"""
+        self.registry.inc("bot_errors_total", route="joke")
+        self.registry.observe("bot_update_seconds", 0.02, route="joke")
+        self.registry.set_gauge("bot_queue_depth", lambda: 3)
+        text = self.registry.render()
+        self.assertIn('bot_errors_total{route="joke"} 1\n', text)
+        self.assertIn('bot_update_seconds_bucket{route="joke",le="0.025"} 1\n', text)
+        self.assertIn('bot_update_seconds_bucket{route="joke",le="+Inf"} 1\n', text)
+        self.assertIn('bot_update_seconds_count{route="joke"} 1\n', text)
+        self.assertIn('bot_update_seconds_quantile{route="joke",quantile="0.99"}', text)
+        self.assertIn("bot_queue_depth 3\n", text)
+
+    def test_stats_gauges(self):
+        """Fields of a stats object are exported as gauges"""
+        stats = ResponseCacheStats(size=2, hits=3, stale_hits=0, misses=1)
+        self.registry.set_gauges("bot_cache", lambda: stats, ("hits", "misses", "hit_rate"))
+        text = self.registry.render()
+        self.assertIn("bot_cache_hits 3\n", text)
+        self.assertIn("bot_cache_misses 1\n", text)
+        self.assertIn("bot_cache_hit_rate 0.75\n", text)
+
+    def test_series_limit(self):
+        """Label sets over the limit are counted as other"""
+        for route in ("a", "b", "c", "d"):
+            self.registry.inc("bot_errors_total", route=route)
+        counters = self.registry.snapshot()["counters"]["bot_errors_total"]
+        self.assertEqual(counters, {(("route", "a"),): 1, (("route", "b"),): 1,
+            (("route", "other"),): 2})
+
+    def test_exporter(self):
+        """Metrics are served over HTTP and dumped to the file"""
+        self.registry.inc("bot_errors_total")
+        exporter = MetricsExporter(self.registry, logging.getLogger(__name__))
+        with tempfile.TemporaryDirectory() as temp_dir:
+            path = Path(temp_dir) / "metrics.prom"
+            exporter.serve("127.0.0.1", 0)
+            exporter.dump_periodically(str(path), 60)
+            try:
+                port = exporter.port
+                with urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as response:
+                    self.assertIn(b"bot_errors_total 1", response.read())
+            finally:
+                exporter.close()
+            self.assertIn("bot_errors_total 1", path.read_text(encoding="utf-8"))
+
+
+if __name__ == '__main__':
+    unittest.main()
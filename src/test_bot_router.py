@@ -0,0 +1,65 @@
+"""The module contains tests for routing of updates to handlers"""
+
+import unittest
+from typing import List
+from telebot import types
+from telebot.callback_data import CallbackData
+from bot_callback_filter import BotCallbackCustomFilter
+from bot_router import RoutedTeleBot
+
+CHAT = {"id": 1, "type": "private"}
+USER = {"id": 1, "is_bot": False, "first_name": "user"}
+
+def message_update(text: str) -> types.Update:
+    """Create an update with a text message"""
+    return types.Update.de_json({"update_id": 1, "message": {
+        "message_id": 1, "date": 0, "chat": CHAT, "from": USER, "text": text}})
+
+def callback_update(data: str) -> types.Update:
+    """Create an update with a callback query"""
+    return types.Update.de_json({"update_id": 1, "callback_query": {
+        "id": "1", "from": USER, "chat_instance": "1", "data": data}})
+
+class TestRoutedTeleBot(unittest.TestCase):
+    """Unittest routing table"""
+
+    def setUp(self):
+        self.calls: List[str] = []
+        self.bot = RoutedTeleBot("123:abc", threaded=False)
+        self.bot.add_custom_filter(BotCallbackCustomFilter())
+        self.factory = CallbackData("button", prefix="first")
+        self.add_handler("first", commands=["first", "one"])
+        self.add_handler("second", commands=["second"])
+        self.bot.callback_query_handler(func=None, config=self.factory.filter())(
+            lambda call: self.calls.append("first button"))
+        self.add_handler("default", func=lambda message: True)
+
+    def add_handler(self, name: str, **kwargs):
+        """Register a message handler that records its name"""
+        self.bot.message_handler(**kwargs)(lambda message: self.calls.append(name))
+
+    def test_command_routes(self):
+        """Commands go to their handlers, other messages to the default handler"""
+        for text in ("/one", "/second x", "/unknown", "text"):
+            self.bot.process_new_updates([message_update(text)])
+        self.assertEqual(self.calls, ["first", "second", "default", "default"])
+
+    def test_callback_routes(self):
+        """Callback queries are routed by the callback data prefix"""
+        self.bot.process_new_updates([callback_update(self.factory.new(button="1"))])
+        self.bot.process_new_updates([callback_update("other:1")])
+        self.assertEqual(self.calls, ["first button"])
+
+    def test_new_handlers(self):
+        """Handlers registered later are routed too, in the order of the handler list"""
+        self.add_handler("late", commands=["late"])
+        self.bot.process_new_updates([message_update("/late")])
+        self.assertEqual(self.calls, ["default"])
+        self.bot.message_handlers.insert(0, self.bot.message_handlers.pop())
+        self.bot.routing_table.invalidate()
+        self.bot.process_new_updates([message_update("/late")])
+        self.assertEqual(self.calls, ["default", "late"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+"""The module contains tests for flood limits and the sender of combined messages"""
+
+import unittest
+from typing import Any, List, Tuple
+from unittest import mock
+from telebot import apihelper, types
+from telebot.apihelper import ApiTelegramException
+from bot_sender import BotSender, BotSenderConfig, FloodLimitedTeleBot, FloodLimiter, TokenBucket
+
+def get_error(code: int, **parameters) -> ApiTelegramException:
+    """Get an error of the Bot API"""
+    return ApiTelegramException("sendMessage", None,
+        {"error_code": code, "description": "Error", "parameters": parameters})
+
+class FakeBot:
+    """Bot that records calls, fails the first call with 429 if asked
+    and rejects media groups and photos with the names in rejected"""
+
+    def __init__(self, flood: bool = False, rejected: Tuple[str, ...] = ()):
+        self.calls: List[Tuple[str, Any]] = []
+        self.flood = flood
+        self.rejected = rejected
+
+    def send_message(self, chat_id, text, **kwargs): # pylint: disable=unused-argument
+        """Record a text message"""
+        if self.flood:
+            self.flood = False
+            raise get_error(429, retry_after=0)
+        self.calls.append(("send_message", text))
+        return text
+
+    def send_photo(self, chat_id, photo, **kwargs): # pylint: disable=unused-argument
+        """Record a photo"""
+        if photo in self.rejected:
+            raise get_error(400)
+        self.calls.append(("send_photo", photo))
+        return photo
+
+    def send_media_group(self, chat_id, media, **kwargs): # pylint: disable=unused-argument
+        """Record a media group"""
+        if any(item.media in self.rejected for item in media):
+            raise get_error(400)
+        self.calls.append(("send_media_group", [item.media for item in media]))
+        return [item.media for item in media]
+
+class TestBotSender(unittest.TestCase):
+    """Unittest flood limits and the sender"""
+
+    config = BotSenderConfig(global_rate=1000, chat_rate=1000, chat_burst=100)
+
+    def test_combine_texts(self):
+        """Texts are joined into messages within the length limit"""
+        texts = ["a" * 3000, "b" * 1000, "c" * 100, "d" * 5000]
+        messages = BotSender.combine_texts(texts)
+        self.assertEqual([len(message) for message in messages], [4002, 100, 4096, 904])
+
+    def test_split_lines(self):
+        """Long texts are split at separators and line breaks, not inside a line"""
+        jokes = ["*Joke*\n" + "a" * 2000, "*Joke*\n" + "b" * 2000, "*Joke*\n" + "c" * 2000]
+        self.assertEqual(BotSender.combine_texts(["\n\n".join(jokes)]),
+            ["\n\n".join(jokes[:2]), jokes[2]])
+        lines = "\n".join(["_line_"] * 1000)
+        parts = BotSender.split_text(lines)
+        self.assertEqual(len(parts), 2)
+        self.assertTrue(all(part.startswith("_line_") and part.endswith("_line_")
+            for part in parts))
+
+    def test_media_groups(self):
+        """Photos are sent in groups of ten"""
+        bot = FakeBot()
+        BotSender(bot).send_photos(1, [str(i) for i in range(11)])
+        self.assertEqual([name for name, _ in bot.calls], ["send_media_group", "send_photo"])
+
+    def test_rejected_photo(self):
+        """Photos of a rejected group are sent one by one without the rejected one"""
+        bot = FakeBot(rejected=("b",))
+        messages = BotSender(bot).send_photos(1, ["a", "b", "c"])
+        self.assertEqual(messages, ["a", "c"])
+        with self.assertRaises(ApiTelegramException):
+            BotSender(bot).send_photos(1, ["b"])
+
+    def test_retry_after(self):
+        """A 429 response is retried"""
+        bot = FakeBot(flood=True)
+        FloodLimiter(self.config).call(1, bot.send_message, 1, "a")
+        self.assertEqual(bot.calls, [("send_message", "a")])
+
+    def test_bot_limits(self):
+        """Messages of all functions are sent through the flood limiter of the bot"""
+        limiter = FloodLimiter(self.config)
+        bot = FloodLimitedTeleBot("1:test", threaded=False, flood_limiter=limiter)
+        result = {"message_id": 1, "date": 0, "text": "/start",
+            "chat": {"id": 7, "type": "private"}}
+        message = types.Message.de_json(result)
+        answer = mock.Mock(return_value=result)
+        with mock.patch.object(limiter, "call", wraps=limiter.call) as call, \
+                mock.patch.multiple(apihelper, send_message=answer,
+                    edit_message_text=answer, edit_message_reply_markup=answer):
+            bot.reply_to(message, "reply")
+            bot.send_message(text="text", chat_id=8)
+            bot.edit_message_text("text", chat_id=9, message_id=1)
+            bot.edit_message_reply_markup(10, 1)
+        self.assertEqual([args[0] for args, _ in call.call_args_list], [7, 8, 9, 10])
+
+    def test_token_bucket(self):
+        """Tokens above the burst are delayed according to the rate"""
+        now = [0.0]
+        bucket = TokenBucket(rate=2, capacity=2, clock=lambda: now[0])
+        self.assertEqual([bucket.reserve() for _ in range(3)], [0, 0, 0.5])
+        now[0] = 10
+        self.assertEqual(bucket.reserve(), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,185 @@
+"""The module contains tests for state stores and the next step handler backend"""
+
+import json
+import logging
+import os
+import tempfile
+import threading
+import unittest
+from unittest import mock
+import telebot
+from bot_state import MemoryStateStore, SqlStateStore, StateHandlerBackend
+
+class FakeClock:
+    """Manually advanced clock"""
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class CountryFunction:
+    """Atomic function with a private next step method"""
+    function_id = "functions.atomic.countries.CountryFunction"
+
+    def __init__(self):
+        self.replies = []
+
+    def __process_code(self, message: str, suffix: str = ""):
+        self.replies.append(message + suffix)
+
+    def get_callback(self):
+        """Get the private method"""
+        return self.__process_code
+
+class TestStateStores(unittest.TestCase):
+    """Unittest memory and SQLite stores"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        path = os.path.join(self.directory.name, "state.db")
+        self.stores = [MemoryStateStore(self.clock), SqlStateStore(f"sqlite:///{path}", self.clock)]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_put_pop(self):
+        """A value is popped once and replaced by put"""
+        for store in self.stores:
+            store.put("a", b"1", 10)
+            store.put("a", b"2", 10)
+            self.assertTrue(store.contains("a"))
+            self.assertEqual(store.pop("a"), b"2")
+            self.assertIsNone(store.pop("a"))
+            self.assertFalse(store.contains("a"))
+
+    def test_update(self):
+        """A value is replaced by the function of the current value, expired values are None"""
+        for store in self.stores:
+            store.update("a", lambda value: (value or b"") + b"1", 10)
+            store.update("a", lambda value: (value or b"") + b"2", 10)
+            store.put("b", b"1", 10)
+            self.assertEqual(store.keys("a"), ["a"])
+            self.clock.now += 10
+            store.update("b", lambda value: (value or b"") + b"3", 10)
+            self.assertEqual(store.pop("b"), b"3")
+            self.assertEqual(store.keys(""), [])
+            self.clock.now -= 10
+            self.assertEqual(store.pop("a"), b"12")
+
+    def test_expiry(self):
+        """Expired values are not returned and are purged"""
+        for store in self.stores:
+            store.put("a", b"1", 10)
+            store.put("b", b"2", 100)
+            self.clock.now += 10
+            self.assertFalse(store.contains("a"))
+            self.assertEqual(store.purge_expired(), 1)
+            self.assertEqual(store.pop("b"), b"2")
+            self.clock.now -= 10
+
+class TestStateHandlerBackend(unittest.TestCase):
+    """Unittest next step handlers in a shared store"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.url = f"sqlite:///{os.path.join(self.directory.name, 'state.db')}"
+        self.logger = logging.getLogger(__name__)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def get_backend(self) -> StateHandlerBackend:
+        """Get a backend of a new process"""
+        return StateHandlerBackend(SqlStateStore(self.url), self.logger)
+
+    def test_other_process(self):
+        """A handler registered by one process is run by another one"""
+        first = self.get_backend()
+        funct = CountryFunction()
+        first.register_owner(funct)
+        first.register_handler(1, telebot.Handler(funct.get_callback(), suffix="!"))
+
+        second = self.get_backend()
+        other_funct = CountryFunction()
+        second.register_owner(other_funct)
+        self.assertTrue(second.has_handlers(1))
+        handlers = second.get_handlers(1)
+        handlers[0]["callback"]("RU", *handlers[0]["args"], **handlers[0]["kwargs"])
+        self.assertEqual(other_funct.replies, ["RU!"])
+        self.assertIsNone(second.get_handlers(1))
+
+    def test_load_owner(self):
+        """A function that is not loaded is loaded by its id"""
+        first = self.get_backend()
+        funct = CountryFunction()
+        first.register_owner(funct)
+        first.register_handler(1, telebot.Handler(funct.get_callback()))
+        second = self.get_backend()
+        loaded = []
+        second.load_owner = lambda function_id: loaded.append(function_id) or \
+            second.register_owner(CountryFunction())
+        self.assertEqual(len(second.get_handlers(1)), 1)
+        self.assertEqual(loaded, [CountryFunction.function_id])
+
+    def test_no_handlers(self):
+        """Chats without handlers do not query the shared store on every message"""
+        backend = self.get_backend()
+        store = backend.store
+        with mock.patch.object(store, "pop") as pop, \
+                mock.patch.object(store, "keys", wraps=store.keys) as keys:
+            for chat_id in range(100):
+                self.assertIsNone(backend.get_handlers(chat_id))
+        pop.assert_not_called()
+        self.assertEqual(keys.call_count, 1)
+
+    def test_json(self):
+        """Handlers are saved as JSON, arguments that are not JSON are kept in memory"""
+        backend = self.get_backend()
+        funct = CountryFunction()
+        backend.register_owner(funct)
+        backend.register_handler(1, telebot.Handler(funct.get_callback(), suffix="!"))
+        backend.register_handler(2, telebot.Handler(funct.get_callback(), suffix=object()))
+        self.assertEqual(json.loads(backend.store.pop(f"{backend.KEY_PREFIX}1")),
+            [[[funct.function_id, "_CountryFunction__process_code"], [], {"suffix": "!"}]])
+        self.assertFalse(self.get_backend().has_handlers(2))
+        self.assertEqual(len(backend.get_handlers(2)), 1)
+
+    def test_concurrent_registration(self):
+        """Handlers registered by processes at the same time are all kept"""
+        backends = [self.get_backend() for _ in range(2)]
+        funct = CountryFunction()
+        for backend in backends:
+            backend.register_owner(funct)
+        threads = [threading.Thread(target=backend.register_handler,
+            args=(1, telebot.Handler(funct.get_callback(), suffix=str(index))))
+            for index in range(5) for backend in backends]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        reader = self.get_backend()
+        reader.register_owner(funct)
+        self.assertEqual(sorted(handler["kwargs"]["suffix"] for handler in reader.get_handlers(1)),
+            sorted(str(index) for index in range(5) for _ in backends))
+
+    def test_closure_in_memory(self):
+        """Callbacks that can not be referenced are kept in the process"""
+        backend = self.get_backend()
+        backend.register_handler(1, telebot.Handler(lambda message: None))
+        self.assertFalse(self.get_backend().has_handlers(1))
+        self.assertEqual(len(backend.get_handlers(1)), 1)
+
+    def test_clear(self):
+        """Cleared handlers are not run"""
+        backend = self.get_backend()
+        funct = CountryFunction()
+        backend.register_owner(funct)
+        backend.register_handler(1, telebot.Handler(funct.get_callback()))
+        backend.clear_handlers(1)
+        self.assertIsNone(backend.get_handlers(1))
+
+
+if __name__ == '__main__':
+    unittest.main()
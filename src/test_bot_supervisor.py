@@ -0,0 +1,77 @@
+"""The module contains tests for partitioning of updates between worker processes"""
+
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from bot_supervisor import Supervisor, SupervisorConfig, get_partition_key
+
+def run_test_worker(index, start_commands, updates, heartbeat, setup):
+    """Worker that exits at the first start without reading its queue,
+    after a restart it writes the ids of updates to the file"""
+    del index, setup
+    path = start_commands[0]
+    if not os.path.exists(path):
+        with open(path, "w", encoding="utf-8"):
+            pass
+        time.sleep(0.5)
+        os._exit(1)
+    while (batch := updates.get()) is not None:
+        heartbeat.value = time.time()
+        with open(path, "a", encoding="utf-8") as file:
+            file.write(json.dumps([update["update_id"] for update in batch]) + "\n")
+
+class TestPartitionKey(unittest.TestCase):
+    """Unittest partition keys of updates"""
+
+    def test_chat_updates(self):
+        """Messages and callback queries are partitioned by the chat"""
+        chat = {"id": -100, "type": "group"}
+        self.assertEqual(get_partition_key({"update_id": 1, "message": {"chat": chat}}), -100)
+        self.assertEqual(get_partition_key({"update_id": 2, "edited_message": {"chat": chat}}),
+            -100)
+        query = {"id": "1", "from": {"id": 5}, "message": {"chat": chat}}
+        self.assertEqual(get_partition_key({"update_id": 3, "callback_query": query}), -100)
+
+    def test_user_updates(self):
+        """Updates without a chat are partitioned by the user, other ones by the update id"""
+        query = {"id": "1", "from": {"id": 5}, "inline_message_id": "x"}
+        self.assertEqual(get_partition_key({"update_id": 3, "callback_query": query}), 5)
+        inline_query = {"id": "2", "from": {"id": 6}}
+        self.assertEqual(get_partition_key({"update_id": 4, "inline_query": inline_query}), 6)
+        self.assertEqual(get_partition_key({"update_id": 7, "poll": {"id": "p"}}), 7)
+
+class TestSupervisor(unittest.TestCase):
+    """Unittest restarts of worker processes"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.cwd = os.getcwd()
+        os.chdir(self.directory.name)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    def test_worker_dies_with_full_queue(self):
+        """Updates queued to a dead worker and updates waiting for its queue
+        are processed by the restarted worker"""
+        path = os.path.join(self.directory.name, "updates.jsonl")
+        supervisor = Supervisor([path], SupervisorConfig(processes=1, queue_size=1),
+            target=run_test_worker)
+        supervisor.start()
+        supervisor.submit([{"update_id": 1, "message": {"chat": {"id": 1}}}])
+        producer = threading.Thread(target=supervisor.submit,
+            args=([{"update_id": 2, "message": {"chat": {"id": 1}}}],))
+        producer.start()
+        producer.join(30)
+        self.assertFalse(producer.is_alive())
+        supervisor.stop()
+        with open(path, encoding="utf-8") as file:
+            self.assertEqual([json.loads(line) for line in file], [[1], [2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
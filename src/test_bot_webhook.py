@@ -0,0 +1,109 @@
+"""The module contains tests for the webhook server"""
+
+import json
+import logging
+import queue
+import socket
+import unittest
+from unittest import mock
+from urllib.error import HTTPError
+from urllib.request import Request, urlopen
+from bot_webhook import WebhookServer
+
+UPDATE = {"update_id": 7, "message": {"message_id": 1, "date": 0, "text": "/start",
+    "chat": {"id": 1, "type": "private"}, "from": {"id": 1, "is_bot": False, "first_name": "a"}}}
+
+class TestWebhookServer(unittest.TestCase):
+    """Unittest webhook server"""
+
+    def setUp(self):
+        self.updates: queue.Queue = queue.Queue()
+        self.server = WebhookServer(self.updates.put, logging.getLogger(__name__),
+            "/hook", "secret")
+        self.server.start("127.0.0.1", 0, workers=2)
+        self.url = f"http://127.0.0.1:{self.server.port}"
+
+    def restart(self, timeout: float):
+        """Restart the server with the timeout of connections"""
+        self.server.stop()
+        with mock.patch.object(WebhookServer, "REQUEST_TIMEOUT", timeout):
+            self.server.start("127.0.0.1", 0, workers=2)
+        self.url = f"http://127.0.0.1:{self.server.port}"
+
+    def connect(self) -> socket.socket:
+        """Open a connection to the server"""
+        connection = socket.create_connection(("127.0.0.1", self.server.port), timeout=5)
+        self.addCleanup(connection.close)
+        return connection
+
+    def tearDown(self):
+        self.server.stop()
+
+    def post(self, path: str, token: str, body: bytes) -> int:
+        """Post the body to the server and get the status"""
+        request = Request(self.url + path, data=body, method="POST",
+            headers={WebhookServer.SECRET_HEADER: token, "Content-Type": "application/json"})
+        try:
+            with urlopen(request, timeout=5) as response:
+                return response.status
+        except HTTPError as ex:
+            return ex.code
+
+    def test_update(self):
+        """An update with the secret token is passed on"""
+        self.assertEqual(self.post("/hook", "secret", json.dumps(UPDATE).encode()), 200)
+        updates = self.updates.get(timeout=5)
+        self.assertEqual(updates[0].update_id, 7)
+        self.assertEqual(updates[0].message.text, "/start")
+
+    def test_rejected(self):
+        """Wrong tokens, paths and bodies are rejected"""
+        body = json.dumps(UPDATE).encode()
+        self.assertEqual(self.post("/hook", "wrong", body), 403)
+        self.assertEqual(self.post("/other", "secret", body), 404)
+        self.assertEqual(self.post("/hook", "secret", b"not json"), 400)
+        self.assertTrue(self.updates.empty())
+
+    def test_content_length(self):
+        """Requests with a Content-Length that is not a positive number are rejected"""
+        for length in ("abc", "-5"):
+            connection = self.connect()
+            connection.sendall(f"POST /hook HTTP/1.1\r\nContent-Length: {length}\r\n"
+                f"{WebhookServer.SECRET_HEADER}: secret\r\n\r\n".encode())
+            self.assertTrue(connection.recv(1024).startswith(b"HTTP/1.1 400"))
+
+    def test_idle_connections(self):
+        """Idle connections and partial bodies are closed after the timeout,
+        so they do not hold the threads"""
+        self.restart(timeout=0.5)
+        self.connect()
+        self.connect().sendall(b"POST /hook HTTP/1.1\r\nContent-Length: 100\r\n\r\n{")
+        self.assertEqual(self.post("/hook", "secret", json.dumps(UPDATE).encode()), 200)
+        self.assertEqual(self.updates.get(timeout=5)[0].update_id, 7)
+
+    def test_saturated(self):
+        """Connections over the threads and the pending limit are answered 503"""
+        self.restart(timeout=5)
+        for _ in range(4):
+            self.connect()
+        self.assertTrue(self.connect().recv(1024).startswith(b"HTTP/1.1 503"))
+
+    def test_raw_updates(self):
+        """Without parsing updates are passed on as JSON objects"""
+        self.server.stop()
+        self.server = WebhookServer(self.updates.put, logging.getLogger(__name__),
+            "/hook", "secret", parse=False)
+        self.server.start("127.0.0.1", 0, workers=2)
+        self.url = f"http://127.0.0.1:{self.server.port}"
+        self.assertEqual(self.post("/hook", "secret", json.dumps(UPDATE).encode()), 200)
+        self.assertEqual(self.updates.get(timeout=5), [UPDATE])
+        self.assertEqual(self.post("/hook", "secret", b"[]"), 400)
+
+    def test_health_check(self):
+        """The root path answers OK"""
+        with urlopen(self.url + "/", timeout=5) as response:
+            self.assertEqual(response.read(), b"OK")
+
+
+if __name__ == '__main__':
+    unittest.main()
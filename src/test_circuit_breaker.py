@@ -0,0 +1,94 @@
+"""The module contains tests for circuit breakers of external APIs"""
+
+import unittest
+from unittest import mock
+import requests
+from net.circuit_breaker import CircuitBreaker, CircuitBreakerConfig, CircuitOpenError
+from net.circuit_breaker import get_circuit_breakers
+from net.http_client import HttpClient, HttpClientConfig
+from net.response_cache import CachePolicy
+
+class FakeClock:
+    """Manually advanced clock"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class TestCircuitBreaker(unittest.TestCase):
+    """Unittest circuit breaker states"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        config = CircuitBreakerConfig(failure_threshold=2, recovery_timeout=10)
+        self.breaker = CircuitBreaker(config, clock=self.clock)
+
+    def test_open_after_failures(self):
+        """The circuit opens after failures in a row and a success resets the count"""
+        self.breaker.record_failure()
+        self.breaker.record_success()
+        self.breaker.record_failure()
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.assertFalse(self.breaker.allow_request())
+
+    def test_probe(self):
+        """After the recovery timeout one probe is sent, its result closes or opens the circuit"""
+        self.breaker.record_failure()
+        self.breaker.record_failure()
+        self.clock.now = 10
+        self.assertEqual(self.breaker.state, CircuitBreaker.HALF_OPEN)
+        self.assertTrue(self.breaker.allow_request())
+        self.assertFalse(self.breaker.allow_request())
+        self.breaker.record_failure()
+        self.assertEqual(self.breaker.state, CircuitBreaker.OPEN)
+        self.clock.now = 20
+        self.assertTrue(self.breaker.allow_request())
+        self.breaker.record_success()
+        self.assertEqual(self.breaker.state, CircuitBreaker.CLOSED)
+
+class TestHttpClientCircuit(unittest.TestCase):
+    """Unittest circuit breakers of the HTTP client"""
+
+    def setUp(self):
+        self.client = HttpClient(HttpClientConfig(retries=0))
+        self.owner = self.client.for_owner(f"{__name__}.{self.id()}")
+        self.send = mock.Mock(side_effect=requests.exceptions.ConnectTimeout("timeout"))
+        self.client.session.request = self.send
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_fail_fast(self):
+        """Requests fail fast when the upstream is down and the function becomes unhealthy"""
+        threshold = get_circuit_breakers().config.failure_threshold
+        for _ in range(threshold):
+            with self.assertRaises(requests.exceptions.Timeout):
+                self.owner.get("http://upstream.test/api")
+        with self.assertRaises(CircuitOpenError):
+            self.owner.get("http://upstream.test/api")
+        self.assertEqual(self.send.call_count, threshold)
+        unhealthy = get_circuit_breakers().get_unhealthy_owners()
+        self.assertIn(self.owner.owner, unhealthy)
+        self.assertNotIn(f"{self.owner.owner}.other", unhealthy)
+
+    def test_cached_fallback(self):
+        """An expired cached body is returned while the circuit is open"""
+        response = mock.Mock(status_code=200)
+        response.json.return_value = {"joke": "cached"}
+        self.send.side_effect = None
+        self.send.return_value = response
+        policy = CachePolicy(ttl=0)
+        url = "http://upstream.test/joke"
+        self.assertEqual(self.owner.get_json(url, cache=policy), {"joke": "cached"})
+        self.send.side_effect = requests.exceptions.ConnectionError("down")
+        for _ in range(get_circuit_breakers().config.failure_threshold):
+            with self.assertRaises(requests.exceptions.ConnectionError):
+                self.owner.get_json(url, cache=policy)
+        self.assertEqual(self.owner.get_json(url, cache=policy), {"joke": "cached"})
+
+
+if __name__ == '__main__':
+    unittest.main()
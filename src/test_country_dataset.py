@@ -0,0 +1,98 @@
+"""The module contains tests for the local country dataset"""
+
+import os
+import tempfile
+import unittest
+from net.country_dataset import CountryDataset, CountryDatasetConfig, CountrySnapshot
+
+DIVISIONS = {"RU": ["Москва", "Татарстан"], "US": ["Alabama", "Alaska"], "VA": []}
+
+class TestCountryDataset(unittest.TestCase):
+    """Unittest country dataset"""
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.config = CountryDatasetConfig(os.path.join(self.directory.name, "countries.dataset"),
+            max_age=100)
+        self.now = 1000.0
+        self.loaded = []
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def load(self, codes):
+        """Loader that records the requested codes"""
+        self.loaded.append(codes)
+        return {code: DIVISIONS[code] for code in codes} if codes is not None else DIVISIONS
+
+    def get_dataset(self) -> CountryDataset:
+        """Get a dataset of a new process"""
+        return CountryDataset(self.load, self.config, lambda: self.now)
+
+    def test_snapshot(self):
+        """A snapshot is saved and read with the same data and version"""
+        snapshot = CountrySnapshot.build(DIVISIONS, 5.0)
+        snapshot.write(self.config.path)
+        saved = CountrySnapshot.read(self.config.path)
+        self.assertEqual(saved, snapshot)
+        self.assertEqual(saved.get_divisions("RU"), ("Москва", "Татарстан"))
+        self.assertEqual(saved.get_divisions("VA"), ())
+        self.assertIsNone(saved.get_divisions("XX"))
+        self.assertEqual(CountrySnapshot.build(DIVISIONS, 6.0).version, snapshot.version)
+
+    def test_refresh(self):
+        """A refreshed dataset is used offline by other processes until it gets old"""
+        dataset = self.get_dataset()
+        self.assertFalse(dataset.is_ready())
+        self.assertIsNone(dataset.get_divisions("RU"))
+        self.assertTrue(dataset.refresh())
+        self.assertFalse(dataset.refresh())
+        self.assertEqual(self.loaded, [None, None])
+
+        other = self.get_dataset()
+        self.assertTrue(other.has_country("US"))
+        self.assertFalse(other.has_country("XX"))
+        self.assertEqual(other.get_codes(), ("RU", "US", "VA"))
+        self.assertEqual(other.get_divisions("US"), ("Alabama", "Alaska"))
+        other.refresh_if_stale()
+        self.assertEqual(len(self.loaded), 2)
+
+    def test_missing_countries(self):
+        """Countries that failed to load are saved as missing and loaded again alone"""
+        failed = {"US"}
+        def load(codes):
+            divisions = self.load(codes)
+            return {code: None if code in failed else names for code, names in divisions.items()}
+        dataset = CountryDataset(load, self.config, lambda: self.now)
+        self.assertTrue(dataset.refresh())
+        self.assertTrue(dataset.has_country("US"))
+        self.assertIsNone(dataset.get_divisions("US"))
+        self.assertEqual(dataset.get_divisions("RU"), ("Москва", "Татарстан"))
+        self.assertEqual(CountrySnapshot.read(self.config.path).missing, frozenset(["US"]))
+
+        failed.clear()
+        self.assertTrue(dataset.load_missing())
+        self.assertEqual(self.loaded[-1], frozenset(["US"]))
+        self.assertEqual(dataset.get_divisions("US"), ("Alabama", "Alaska"))
+        self.assertEqual(dataset.snapshot.created_at, 1000.0)
+        self.assertFalse(dataset.load_missing())
+
+        failed.add("RU")
+        self.now += 200
+        self.assertFalse(dataset.refresh())
+        self.assertEqual(dataset.get_divisions("RU"), ("Москва", "Татарстан"))
+        self.assertEqual(dataset.snapshot.created_at, 1200.0)
+
+    def test_failed_refresh(self):
+        """The previous version is kept when the loader fails"""
+        dataset = self.get_dataset()
+        dataset.refresh()
+        def fail(_):
+            raise ValueError("offline")
+        failing = CountryDataset(fail, self.config, lambda: self.now)
+        self.assertFalse(failing.refresh())
+        self.assertEqual(failing.snapshot, dataset.snapshot)
+
+
+if __name__ == '__main__':
+    unittest.main()
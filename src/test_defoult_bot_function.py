@@ -0,0 +1,68 @@
+"""The module contains tests for the start menu and the function catalog"""
+
+import json
+import unittest
+from typing import List
+from bot_func_abc import AtomicBotFunctionABC
+from functions.defoult_bot_function import DefoultBotFunction
+
+class NumberedFunction(AtomicBotFunctionABC):
+    """Atomic function with a numbered command"""
+    commands: List[str] = []
+    authors: List[str] = ["author"]
+    about: str = ""
+    description: str = "Описание `snake_case`"
+    state: bool = True
+
+    def __init__(self, number: int):
+        self.commands = [f"cmd{number}"]
+        self.about = f"Функция {number}"
+        self.state = number != 1
+
+    def set_handlers(self, bot):
+        """No handlers"""
+
+class TestDefoultBotFunction(unittest.TestCase):
+    """Unittest rendering of the start menu and of catalog pages"""
+
+    def setUp(self):
+        self.functions = [NumberedFunction(number) for number in range(12)]
+        self.funct = DefoultBotFunction(["start"], self.functions)
+
+    def test_menu(self):
+        """The menu lists available functions and is rendered once for the same functions"""
+        available = tuple(funct.state for funct in self.functions)
+        menu = self.funct.get_menu(available)
+        self.assertIn("/cmd0 - Функция 0", menu)
+        self.assertNotIn("/cmd1 ", menu)
+        self.assertIs(self.funct.get_menu(available), menu)
+        self.funct.set_catalog(self.funct.build_catalog())
+        self.assertIsNot(self.funct.get_menu(available), menu)
+        self.assertTrue(self.functions[0].is_available(frozenset()))
+        self.assertFalse(self.functions[0].is_available(frozenset([self.functions[0].function_id])))
+        self.assertFalse(self.functions[1].is_available(frozenset()))
+
+    def test_pages(self):
+        """Functions are split into pages linked by buttons"""
+        catalog = self.funct.catalog
+        self.assertEqual(len(catalog.pages), 3)
+        self.assertEqual(catalog.function_pages[:6], (0, 0, 0, 0, 0, 1))
+        text, markup = catalog.pages[1]
+        self.assertIn("`/cmd5`", text)
+        self.assertIn("snake\\_case", text)
+        self.assertIn("Страница 2 из 3", text)
+        buttons = json.loads(markup)["inline_keyboard"][0]
+        self.assertEqual([button["callback_data"] for button in buttons],
+            ["start:catalog:0", "start:catalog:2"])
+
+    def test_page_length(self):
+        """A page is not longer than the message limit"""
+        for funct in self.functions:
+            funct.description = "x" * 1500
+        catalog = DefoultBotFunction(["start"], self.functions).catalog
+        self.assertEqual(len(catalog.pages), 6)
+        self.assertTrue(all(len(text) <= 4096 for text, _ in catalog.pages))
+
+
+if __name__ == '__main__':
+    unittest.main()
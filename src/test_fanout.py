@@ -0,0 +1,36 @@
+"""The module contains tests for concurrent calls"""
+
+import time
+import unittest
+from net.fanout import fan_out
+
+def failing_call() -> int:
+    """Call that always fails"""
+    raise ValueError("failed")
+
+def slow_call() -> int:
+    """Call that does not finish before the deadline"""
+    time.sleep(1)
+    return 0
+
+class TestFanOut(unittest.TestCase):
+    """Unittest fan-out"""
+
+    def test_concurrent_calls(self):
+        """Calls run concurrently and results keep the order of calls"""
+        def call(value: int):
+            time.sleep(0.2)
+            return value
+        start = time.monotonic()
+        results = fan_out([lambda i=i: call(i) for i in range(5)])
+        self.assertEqual(results, [0, 1, 2, 3, 4])
+        self.assertLess(time.monotonic() - start, 0.8)
+
+    def test_partial_results(self):
+        """Failed and late calls are skipped"""
+        results = fan_out([lambda: 1, failing_call, slow_call, lambda: 2], deadline=0.5)
+        self.assertEqual(results, [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+"""The module contains tests for the shared HTTP client"""
+
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from net.http_client import HttpClient, HttpClientConfig
+from net.response_cache import CachePolicy
+
+class JsonHandler(BaseHTTPRequestHandler):
+    """Responds to GET requests with a JSON body and the status of get_status"""
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self): # pylint: disable=invalid-name
+        """Handle GET request"""
+        body = b'{"ok": true}'
+        self.send_response(self.get_status())
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def get_status(self) -> int:
+        """Get the status of the response to the request"""
+        return 200
+
+    def log_message(self, format, *args): # pylint: disable=redefined-builtin
+        """Disable request logging"""
+
+class LocalServerTestCase(unittest.TestCase):
+    """Runs a local HTTP server with the handler for the tests of the class"""
+    handler = JsonHandler
+
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), cls.handler)
+        cls.url = f"http://127.0.0.1:{cls.server.server_port}"
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+class _Handler(JsonHandler):
+    """Responds 503 to the first request of each path, then 200"""
+    seen_paths = set()
+    connections = set()
+
+    def get_status(self) -> int:
+        _Handler.connections.add(self.client_address)
+        status = 200 if self.path in _Handler.seen_paths else 503
+        _Handler.seen_paths.add(self.path)
+        return status
+
+class TestHttpClient(LocalServerTestCase):
+    """Unittest HTTP client"""
+    handler = _Handler
+
+    def test_retry_and_keep_alive(self):
+        """Failed requests are retried over the same pooled connection"""
+        client = HttpClient(HttpClientConfig(retries=2, backoff_factor=0, backoff_jitter=0))
+        _Handler.connections.clear()
+        for path in ("/a", "/b", "/c"):
+            response = client.get(f"{self.url}{path}")
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual(response.json(), {"ok": True})
+        self.assertEqual(len(_Handler.connections), 1)
+        client.close()
+
+    def test_list_params(self):
+        """Parameters with lists are shared and cached by their encoded query"""
+        client = HttpClient(HttpClientConfig(retries=2, backoff_factor=0, backoff_jitter=0))
+        _Handler.seen_paths.clear()
+        for params in ({"ids": [1, 2], "q": "a"}, {"q": "a", "ids": [1, 2]}):
+            self.assertEqual(client.get_json(f"{self.url}/list", params=params,
+                cache=CachePolicy(60)), {"ok": True})
+        self.assertEqual(_Handler.seen_paths, {"/list?ids=1&ids=2&q=a"})
+        self.assertEqual(client.cache.stats().hits, 1)
+        client.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+"""The module contains tests for incremental decoding of JSON arrays"""
+
+import json
+import unittest
+from net.json_stream import iter_array_items, project
+
+ITEMS = [{"cca2": "RU", "name": {"common": "Россия"}}, 12.5, "a]b", [1, [2]], None, True, {}]
+
+def split(body: bytes, size: int) -> list:
+    """Split the body into chunks of the size"""
+    return [body[i:i + size] for i in range(0, len(body), size)]
+
+class TestJsonStream(unittest.TestCase):
+    """Unittest incremental decoding"""
+
+    def test_chunks(self):
+        """Items are decoded whatever the chunks split, including numbers and characters"""
+        body = json.dumps(ITEMS, ensure_ascii=False, indent=1).encode()
+        for size in range(1, len(body) + 1):
+            self.assertEqual(list(iter_array_items(split(body, size))), ITEMS)
+
+    def test_project(self):
+        """Only the fields of objects are kept"""
+        items = iter_array_items([b'[{"cca2": "RU", "cca3": "RUS"}, {"name": "x"}, 1]'])
+        self.assertEqual(list(project(items, ("cca2",))), [{"cca2": "RU"}, {}, 1])
+        self.assertEqual(list(iter_array_items([b" [ ] "])), [])
+
+    def test_invalid(self):
+        """Bodies that are not complete JSON arrays raise ValueError"""
+        for body in (b'{"a": 1}', b"", b"[1,", b"[1 2]", b'[{"a":', b"[1,]"):
+            with self.assertRaises(ValueError):
+                list(iter_array_items(split(body, 2)))
+
+
+if __name__ == '__main__':
+    unittest.main()
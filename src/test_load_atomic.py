@@ -0,0 +1,79 @@
+"""The module contains tests for the atomic functions manifest"""
+
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from load_atomic import get_manifest, load_atomic_functions, load_lazy_atomic_functions
+from load_atomic import PluginReport
+
+MODULE_TEMPLATE = '''
+from bot_func_abc import AtomicBotFunctionABC
+from telebot.callback_data import CallbackData
+
+class TestFunction(AtomicBotFunctionABC):
+    commands = ["test", "tst"]
+    authors = ["IHVH"]
+    about = "Test function"
+    description = "Test function description"
+    state = True
+
+    def set_handlers(self, bot):
+        factory = CallbackData("button", prefix=self.commands[0])
+        @bot.message_handler({handler_args})
+        def handler(message):
+            pass
+'''
+
+class TestManifest(unittest.TestCase):
+    """Unittest atomic functions manifest"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        self.path = Path(self.temp_dir.name)
+        self.cache_path = self.path / "manifest.json"
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def write_module(self, handler_args: str):
+        """Write a test atomic module"""
+        module_path = self.path / "test_function.py"
+        module_path.write_text(MODULE_TEMPLATE.format(handler_args=handler_args), encoding="utf-8")
+        (self.path / "test_function.pyc").write_bytes(b"")
+        os.utime(module_path, ns=(0, os.stat(module_path).st_mtime_ns + 1))
+
+    def test_module_description(self):
+        """Commands and callback prefixes are read without importing the module"""
+        self.write_module("commands=self.commands")
+        manifest = get_manifest(self.path, self.cache_path)
+        self.assertEqual(list(manifest), ["test_function"])
+        function = manifest["test_function"]["functions"][0]
+        self.assertEqual(function["commands"], ["test", "tst"])
+        self.assertEqual(function["callback_prefixes"], ["test"])
+        self.assertFalse(manifest["test_function"]["eager"])
+
+    def test_cache_invalidation(self):
+        """A changed module is described again"""
+        self.write_module("commands=self.commands")
+        get_manifest(self.path, self.cache_path)
+        self.write_module("func=lambda message: True")
+        manifest = get_manifest(self.path, self.cache_path)
+        self.assertTrue(manifest["test_function"]["eager"])
+
+    def test_same_functions(self):
+        """The manifest describes the same functions as the import"""
+        def describe(functions):
+            return sorted((f.commands, f.authors, f.about, f.description) for f in functions)
+        self.assertEqual(describe(load_lazy_atomic_functions()), describe(load_atomic_functions()))
+
+    def test_startup_report(self):
+        """Every imported module is reported"""
+        reports: list[PluginReport] = []
+        functions = load_atomic_functions(reports=reports)
+        self.assertEqual(len(reports), len({type(f).__module__ for f in functions}))
+        self.assertTrue(all(report.status == "ok" for report in reports))
+
+
+if __name__ == '__main__':
+    unittest.main()
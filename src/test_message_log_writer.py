@@ -0,0 +1,73 @@
+"""The module contains tests for the write-behind message log"""
+
+import logging
+import os
+import tempfile
+import unittest
+from datetime import datetime
+from db.storage_worker import StorageWorker
+from db.message_log_writer import MessageLogWriter, MessageLogWriterConfig, MessageLogRecord
+from db.identity_cache import IdentityCache
+
+def new_record(user_id: int, chat_id: int, text: str, username: str = "user") -> MessageLogRecord:
+    """Create a message log record for tests"""
+    return MessageLogRecord(
+        user={"id": user_id, "username": username, "first_name": None, "last_name": None,
+            "full_name": username, "language_code": "ru", "is_bot": False},
+        chat={"id": chat_id, "bio": None, "description": "private - user"},
+        message={"user_id": user_id, "chat_id": chat_id, "full_user_name": username,
+            "date_time": datetime.now(), "text": text, "call_data": None},
+    )
+
+class TestMessageLogWriter(unittest.TestCase):
+    """Unittest write-behind message log"""
+
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory() # pylint: disable=consider-using-with
+        path = os.path.join(self.temp_dir.name, "log.db")
+        self.storage_worker = StorageWorker(f"sqlite:///{path}")
+        self.logger = logging.getLogger(__name__)
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def test_flush_on_close(self):
+        """Queued records are saved when the writer is closed"""
+        writer = MessageLogWriter(self.storage_worker, self.logger,
+            MessageLogWriterConfig(batch_size=100, flush_interval=60))
+        writer.start()
+        for i in range(10):
+            writer.put(new_record(1 + i % 2, 10, f"text {i}"))
+        writer.close()
+        messages = self.storage_worker.get_messages()
+        self.assertEqual(len(messages), 10)
+        self.assertIsNotNone(self.storage_worker.get_user(1))
+        self.assertIsNotNone(self.storage_worker.get_chat(10))
+
+    def test_upsert_updates_profile(self):
+        """Changed user fields are updated in the users table"""
+        identity_cache = IdentityCache()
+        writer = MessageLogWriter(self.storage_worker, self.logger,
+            MessageLogWriterConfig(batch_size=1), identity_cache)
+        writer.start()
+        writer.put(new_record(1, 10, "first", username="old"))
+        writer.put(new_record(1, 10, "second", username="old"))
+        writer.put(new_record(1, 10, "third", username="new"))
+        writer.close()
+        self.assertEqual(self.storage_worker.get_user(1).username, "new")
+        self.assertEqual(len(self.storage_worker.get_messages()), 3)
+        stats = identity_cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (3, 3))
+
+    def test_record_message(self):
+        """A message is recorded with its user and chat in one call"""
+        record = new_record(1, 10, "text")
+        self.storage_worker.record_message(record.user, record.chat, record.message)
+        record = new_record(1, 10, "text", username="renamed")
+        self.storage_worker.record_message(record.user, record.chat, record.message)
+        self.assertEqual(self.storage_worker.get_user(1).username, "renamed")
+        self.assertEqual(len(self.storage_worker.get_messages()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,40 @@
+"""The module contains tests for the prefetch buffer"""
+
+import itertools
+import time
+import unittest
+from net.prefetch import PrefetchBuffer, PrefetchConfig
+
+class TestPrefetchBuffer(unittest.TestCase):
+    """Unittest prefetch buffer"""
+
+    def setUp(self):
+        self.counter = itertools.count(1)
+
+    def test_take_on_demand(self):
+        """Without the background refill items are loaded right away"""
+        buffer = PrefetchBuffer("test", lambda: next(self.counter), PrefetchConfig())
+        self.assertEqual(buffer.take(3), [1, 2, 3])
+        self.assertEqual(buffer.stats().fetched_on_demand, 3)
+
+    def test_refill_to_high_watermark(self):
+        """The buffer is filled in the background up to the high watermark"""
+        config = PrefetchConfig(low_watermark=1, high_watermark=4, refill_rate=0)
+        buffer = PrefetchBuffer("test", lambda: next(self.counter), config)
+        buffer.start()
+        deadline = time.monotonic() + 5
+        while buffer.stats().size < 4 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(buffer.take(3), [1, 2, 3])
+        buffer.stop()
+        stats = buffer.stats()
+        self.assertEqual((stats.served, stats.fetched_on_demand), (3, 0))
+
+    def test_unsuitable_items_are_skipped(self):
+        """None items are not returned"""
+        buffer = PrefetchBuffer("test", lambda: None, PrefetchConfig())
+        self.assertEqual(buffer.take(2), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
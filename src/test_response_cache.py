@@ -0,0 +1,65 @@
+"""The module contains tests for the response cache"""
+
+import queue
+import unittest
+from net.response_cache import CachePolicy, ResponseCache
+
+class FakeClock:
+    """Manually advanced clock"""
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+class TestResponseCache(unittest.TestCase):
+    """Unittest response cache"""
+
+    def setUp(self):
+        self.clock = FakeClock()
+        self.cache = ResponseCache(max_size=2, clock=self.clock)
+        self.loads = 0
+
+    def load(self) -> int:
+        """Count loads and return the load number"""
+        self.loads += 1
+        return self.loads
+
+    def test_fresh_and_expired(self):
+        """A fresh value is served from the cache, an expired one is loaded again"""
+        policy = CachePolicy(ttl=10)
+        self.assertEqual(self.cache.get_or_load("key", self.load, policy), 1)
+        self.assertEqual(self.cache.get_or_load("key", self.load, policy), 1)
+        self.clock.now = 11
+        self.assertEqual(self.cache.get_or_load("key", self.load, policy), 2)
+        stats = self.cache.stats()
+        self.assertEqual((stats.hits, stats.misses), (1, 2))
+
+    def test_stale_while_revalidate(self):
+        """A stale value is served while a new one is loaded in the background"""
+        policy = CachePolicy(ttl=10, stale_ttl=100)
+        loaded: queue.Queue = queue.Queue()
+        def load() -> int:
+            value = self.load()
+            loaded.put(value)
+            return value
+        self.cache.get_or_load("key", load, policy)
+        self.clock.now = 50
+        self.assertEqual(self.cache.get_or_load("key", load, policy), 1)
+        self.assertEqual(loaded.get(timeout=5), 1)
+        self.assertEqual(loaded.get(timeout=5), 2)
+        self.assertEqual(self.cache.stats().stale_hits, 1)
+
+    def test_lru_eviction(self):
+        """The least recently used value is evicted"""
+        policy = CachePolicy(ttl=10)
+        self.cache.get_or_load("a", self.load, policy)
+        self.cache.get_or_load("b", self.load, policy)
+        self.cache.get_or_load("a", self.load, policy)
+        self.cache.get_or_load("c", self.load, policy)
+        self.assertEqual(self.cache.get_or_load("a", self.load, policy), 1)
+        self.assertEqual(self.cache.get_or_load("b", self.load, policy), 4)
+
+
+if __name__ == '__main__':
+    unittest.main()
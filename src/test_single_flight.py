@@ -0,0 +1,70 @@
+"""The module contains tests for coalescing of identical concurrent calls"""
+
+import threading
+import time
+import unittest
+from bot_threading import wait_event
+from net.single_flight import SingleFlight
+
+class TestSingleFlight(unittest.TestCase):
+    """Unittest single flight"""
+
+    def setUp(self):
+        self.flight = SingleFlight()
+        self.release = threading.Event()
+        self.calls = []
+
+    def run_callers(self, key: str, function, count: int) -> list:
+        """Call the function from several threads while the first call is in flight"""
+        results = []
+        def caller():
+            try:
+                results.append(self.flight.do(key, function))
+            except ValueError as ex:
+                results.append(ex)
+        threads = [threading.Thread(target=caller) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        deadline = time.monotonic() + 5
+        while self.flight.stats().shared < count - 1 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.release.set()
+        for thread in threads:
+            thread.join(5)
+        return results
+
+    def slow_call(self) -> dict:
+        """Call that waits for the release"""
+        self.calls.append(1)
+        wait_event(self.release, 5)
+        return {"price": 1}
+
+    def test_shared_result(self):
+        """Concurrent callers get the result of one call"""
+        results = self.run_callers("a", self.slow_call, 4)
+        self.assertEqual(len(self.calls), 1)
+        self.assertEqual(sorted(shared for _, shared in results), [False, True, True, True])
+        self.assertTrue(all(value is results[0][0] for value, _ in results))
+        self.assertEqual(self.flight.stats().in_flight, 0)
+
+    def test_shared_error(self):
+        """Concurrent callers get the error of one call and the next call is made again"""
+        def failing_call():
+            self.slow_call()
+            raise ValueError("limit")
+        results = self.run_callers("a", failing_call, 3)
+        self.assertEqual(len(self.calls), 1)
+        self.assertTrue(all(isinstance(result, ValueError) for result in results))
+        self.assertEqual(self.flight.do("a", self.slow_call), ({"price": 1}, False))
+        self.assertEqual(len(self.calls), 2)
+
+    def test_other_keys(self):
+        """Calls with different keys are not shared"""
+        self.release.set()
+        self.flight.do("a", self.slow_call)
+        self.flight.do("b", self.slow_call)
+        self.assertEqual(len(self.calls), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()